@@ -1,14 +1,40 @@
+import os
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from routes.prompts import router as prompts_router
-from db import init_db
+from db import init_db, get_async_sessionmaker, dispose_async_engine
+from services.logger import stop_telemetry_writer
+from services.health import get_metrics_snapshot, stop_metrics_snapshot
+from services.metrics import METRICS_ENABLED, MetricsMiddleware
+from services.profiling import ProfilingMiddleware, profiling_enabled
+from providers.openai_provider import get_provider, close_provider
+
+# "full": create/upgrade the schema, build the LLM client and start the /health
+# metrics refresher on startup. "fast" (serverless, autoscaling): skip all three;
+# run `python -m db migrate` as a release step and let the rest start on first use.
+STARTUP_MODE = os.getenv("STARTUP_MODE", "full")
 
 app = FastAPI(title="Prompt Gauge — Core Generation MVP")
 
-# Initialize database on startup
 @app.on_event("startup")
 def startup_event():
+    # Async engine for the request path (fails fast if the async driver is missing)
+    get_async_sessionmaker()
+    if STARTUP_MODE == "fast":
+        return
     init_db()
+    # Long-lived pooled LLM client (None when no key is configured)
+    get_provider()
+    # Background refresh of the run metrics reported by /health
+    get_metrics_snapshot()
+
+# Flush any write-behind telemetry and close pooled connections before exit
+@app.on_event("shutdown")
+async def shutdown_event():
+    stop_telemetry_writer()
+    stop_metrics_snapshot()
+    await close_provider()
+    await dispose_async_engine()
 
 app.add_middleware(
     CORSMiddleware,
@@ -16,6 +42,13 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
+# Only installed when a trigger is configured, so it costs nothing otherwise
+if profiling_enabled():
+    app.add_middleware(ProfilingMiddleware)
+# Outermost, so the latency histograms include CORS handling and error responses
+if METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
 
 app.include_router(prompts_router, prefix="")
@@ -0,0 +1,116 @@
+"""
+Cold-start import budget.
+Times `import app` in fresh interpreters (the part of a cold start that
+happens before the server can accept a connection). It fails when the best
+of --runs exceeds --budget-ms, or when importing the app pulls in a module
+that is supposed to load lazily (the LLM SDK, the async database drivers).
+The module check doesn't depend on machine speed, so it is the part to
+rely on in CI. The budget catches everything else. tests/test_import_time.py
+runs both checks under pytest.
+
+Usage (from backend/):
+    python -m benchmarks.import_time [--budget-ms 1500] [--runs 5] [--top 15]
+
+Importing the app never touches the database; it only needs to be
+importable. Sample (single-core VM): ~1.1s, down from ~1.6s when the
+openai SDK was imported eagerly and init_db ran at import.
+"""
+
+import os
+import sys
+import json
+import argparse
+import subprocess
+from typing import Any, Dict, List, Optional, Tuple
+
+IMPORT_BUDGET_MS = float(os.getenv("IMPORT_BUDGET_MS", "1500"))
+
+# Must not be imported by `import app`. The sync DBAPI driver (sqlite3,
+# psycopg2) isn't listed: db.py builds the sync engine at import, which loads
+# it, and the serving process needs it anyway (write-behind flusher,
+# readiness checks, metrics refresher).
+LAZY_MODULES = ["openai", "httpx", "aiosqlite", "asyncpg"]
+
+CHILD = """
+import sys, time, json
+start = time.perf_counter()
+import app
+elapsed_ms = (time.perf_counter() - start) * 1000
+print(json.dumps({"ms": elapsed_ms, "loaded": [m for m in %r if m in sys.modules]}))
+"""
+
+
+def time_import(importtime: bool = False, env: Optional[Dict[str, str]] = None) -> Tuple[Dict[str, Any], str]:
+    """
+    One fresh-interpreter `import app`.
+
+    Args:
+        importtime: Also collect a -X importtime report
+        env: Environment overrides for the child (e.g. DATABASE_URL)
+
+    Returns:
+        result: {"ms": import time, "loaded": lazy modules that got imported}
+        stderr: -X importtime report when importtime is set
+    """
+    backend = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    cmd = [sys.executable] + (["-X", "importtime"] if importtime else []) + ["-c", CHILD % LAZY_MODULES]
+    proc = subprocess.run(cmd, cwd=backend, capture_output=True, text=True, check=True,
+                          env={**os.environ, **(env or {})})
+    return json.loads(proc.stdout.strip().splitlines()[-1]), proc.stderr
+
+
+def slowest_imports(report: str, top: int) -> List[Tuple[float, float, str]]:
+    """
+    Modules loaded by `import app`, slowest first, from an -X importtime report.
+
+    Returns:
+        rows: (self ms, cumulative ms, module) for the top modules by self time
+    """
+    # The report lists children before their parent, indented two spaces per level
+    rows: List[Tuple[float, float, str]] = []
+    for line in report.splitlines():
+        if not line.startswith("import time:") or line.count("|") != 2:
+            continue
+        own, cumulative, name = line[len("import time:"):].split("|")
+        if not own.strip().isdigit():
+            continue
+        if name.startswith("  "):
+            rows.append((int(own) / 1000, int(cumulative) / 1000, name.strip()))
+        elif name.strip() == "app":
+            return sorted(rows, reverse=True)[:top]
+        else:
+            rows = []
+    return []
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Fail if `import app` is slower than a budget")
+    parser.add_argument("--budget-ms", type=float, default=IMPORT_BUDGET_MS)
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters; the fastest counts")
+    parser.add_argument("--top", type=int, default=15, help="Slowest imports to list")
+    args = parser.parse_args(argv)
+
+    results = [time_import()[0] for _ in range(args.runs)]
+    best = min(r["ms"] for r in results)
+    loaded = sorted({m for r in results for m in r["loaded"]})
+
+    _, report = time_import(importtime=True)
+    print(f"{'module':<44} {'self ms':>9} {'cumulative ms':>14}")
+    for own_ms, cumulative_ms, name in slowest_imports(report, args.top):
+        print(f"{name:<44} {own_ms:>9.1f} {cumulative_ms:>14.1f}")
+    print(f"\nimport app: best {best:.0f}ms of {args.runs} (budget {args.budget_ms:.0f}ms)")
+
+    failed = False
+    if loaded:
+        print(f"FAIL: imported eagerly: {', '.join(loaded)}")
+        failed = True
+    if best > args.budget_ms:
+        print(f"FAIL: over budget by {best - args.budget_ms:.0f}ms")
+        failed = True
+    if failed:
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+Keyword engine benchmark.
+Shows how KeywordMatcher.scan scales with prompt size and with the number of
+rules, for both the substring strategy and the regex automaton.
+
+Usage (from backend/):
+    python -m benchmarks.keyword_engine
+"""
+
+import random
+import string
+import time
+from typing import Callable
+
+from services.keywords import KeywordMatcher, GOAL_KEYWORDS, GOAL_PATTERN
+from services.scoring import compare_prompts
+from services.explain import explain
+
+SENTENCE = "Turn the notes from our weekly sync into a 6-bullet action list the team can read. "
+SIZES = [100, 1_000, 10_000, 50_000]
+EXTRA_RULES = [0, 100, 500, 2_000, 5_000]
+
+
+def time_us(fn: Callable[[], object], budget_s: float = 0.2) -> float:
+    """Average microseconds per call, repeating until the time budget is spent"""
+    calls = 0
+    start = time.perf_counter()
+    while True:
+        fn()
+        calls += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= budget_s:
+            return elapsed / calls * 1e6
+
+
+def make_text(size: int) -> str:
+    return (SENTENCE * (size // len(SENTENCE) + 1))[:size]
+
+
+def random_keywords(n: int, seed: int = 0):
+    rng = random.Random(seed)
+    return ["".join(rng.choices(string.ascii_lowercase, k=rng.randint(4, 10))) for _ in range(n)]
+
+
+def main():
+    print("prompt size scaling (us per call)")
+    print(f"{'chars':>8} {'scan':>10} {'explain':>10} {'compare':>10}")
+    for size in SIZES:
+        text = make_text(size)
+        matcher = KeywordMatcher(GOAL_KEYWORDS, GOAL_PATTERN)
+        print(f"{size:>8} {time_us(lambda: matcher.scan(text)):>10.1f} "
+              f"{time_us(lambda: explain(text)):>10.1f} {time_us(lambda: compare_prompts(text)):>10.1f}")
+
+    print()
+    print("rule count scaling on a 10KB prompt (us per scan)")
+    print(f"{'rules':>8} {'substring':>10} {'automaton':>10}")
+    text = make_text(10_000)
+    for extra in EXTRA_RULES:
+        keywords = GOAL_KEYWORDS + tuple(random_keywords(extra))
+        substring = KeywordMatcher(keywords, GOAL_PATTERN, automaton_min_keywords=len(keywords) + 1)
+        automaton = KeywordMatcher(keywords, GOAL_PATTERN, automaton_min_keywords=0)
+        print(f"{len(keywords):>8} {time_us(lambda: substring.scan(text)):>10.1f} "
+              f"{time_us(lambda: automaton.scan(text)):>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
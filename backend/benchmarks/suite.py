@@ -0,0 +1,349 @@
+"""
+Benchmark suite and regression gate.
+Times the hot paths (entity extraction, explain, every style builder, code
+wrappers, scoring, run recording) over short, medium and very long goals,
+plus the main endpoints in-process through the ASGI test client, and saves
+p50/p95 per case as JSON. `compare` exits non-zero when a case got slower
+than the threshold allows, so it can gate CI.
+
+Usage (from backend/):
+    python -m benchmarks.suite run -o bench.json [--budget 1.0] [--rounds 3] [--filter explain]
+    python -m benchmarks.suite compare baseline.json bench.json [--threshold 0.25] [--recheck]
+
+Micro cases time one pass over every goal of their size class. Memo caches
+are bypassed (use_cache=False, Cache-Control: no-cache) so the numbers are
+for the cold path. The database is a fresh temporary SQLite file
+unless DATABASE_URL is already set.
+
+Timings on a shared or single-core machine swing by 20-30% between runs of
+the same code, mostly on the endpoint cases and on p95. The gate therefore
+compares p50 only by default, takes the best of several rounds per case,
+and with --recheck re-times the flagged cases on this machine and keeps the
+faster result before failing. Produce the baseline on the same machine.
+"""
+
+import gc
+import os
+import sys
+import json
+import math
+import time
+import random
+import argparse
+import platform
+import tempfile
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+STYLES = ["directive", "schema_json", "few_shot", "planner_executor", "rubric_scored"]
+
+SHORT_GOALS = [
+    "Summarize this document in 3 bullets",
+    "Classify support tickets by urgency",
+    "Translate the product FAQ into Spanish",
+]
+MEDIUM_GOALS = [
+    "Turn a messy meeting transcript into a 6-bullet action list in JSON with owner and due date "
+    "fields; keep each bullet under 20 words and flag anything that looks like a risk or a blocker.",
+    "You are a support analyst. Read each customer email, extract the product, the issue category "
+    "and the sentiment, and return a CSV row per email. Be concise and avoid guessing missing fields.",
+]
+LONG_SENTENCES = [
+    "Read the attached quarterly report and the call transcript.",
+    "Extract every metric that changed by more than five percent and explain the likely cause.",
+    "Group the findings by business unit and rank them by revenue impact.",
+    "Return JSON with a summary field, a list of risks and a list of action items.",
+    "Keep the summary under 120 words and cite the page for each number.",
+    "If a figure is ambiguous, say so instead of guessing.",
+]
+
+
+def long_goal(chars: int, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    parts = []
+    while sum(len(p) + 1 for p in parts) < chars:
+        parts.append(rng.choice(LONG_SENTENCES))
+    return " ".join(parts)[:chars]
+
+
+def corpus() -> Dict[str, List[str]]:
+    """Goals by size class"""
+    return {
+        "short": SHORT_GOALS,
+        "medium": MEDIUM_GOALS,
+        "long": [long_goal(5_000, 1), long_goal(20_000, 2)],
+    }
+
+
+def percentile(sorted_samples: List[float], q: float) -> float:
+    """Nearest-rank percentile of an ascending list"""
+    rank = math.ceil(q * len(sorted_samples))
+    return sorted_samples[min(len(sorted_samples), max(rank, 1)) - 1]
+
+
+def measure(fn: Callable[[], Any], budget_s: float, rounds: int = 3, min_calls: int = 5,
+            max_calls: int = 100_000) -> Dict[str, float]:
+    """
+    Time fn() repeatedly for about budget_s seconds, split into rounds.
+
+    Each statistic is the best (lowest) of its per-round values: a real
+    slowdown shows up in every round, while a noisy neighbour usually spoils
+    only one. As in timeit, the garbage collector is off while timing.
+
+    Returns:
+        stats: p50_us, p95_us, mean_us, min_us and n (total calls)
+    """
+    fn()  # warm up imports, regex compilation, connection pools
+    per_round = []
+    for _ in range(rounds):
+        samples = []
+        gc.collect()
+        gc.disable()
+        try:
+            deadline = time.perf_counter() + budget_s / rounds
+            while len(samples) < min_calls or (time.perf_counter() < deadline and len(samples) < max_calls):
+                start = time.perf_counter_ns()
+                fn()
+                samples.append((time.perf_counter_ns() - start) / 1000)
+        finally:
+            gc.enable()
+        samples.sort()
+        per_round.append({
+            "p50_us": percentile(samples, 0.50),
+            "p95_us": percentile(samples, 0.95),
+            "mean_us": sum(samples) / len(samples),
+            "min_us": samples[0],
+            "n": len(samples),
+        })
+    stats = {k: round(min(r[k] for r in per_round), 2) for k in ("p50_us", "p95_us", "mean_us", "min_us")}
+    stats["n"] = sum(r["n"] for r in per_round)
+    return stats
+
+
+def micro_cases() -> Dict[str, Callable[[], Any]]:
+    """Function-level cases, one per hot path and size class"""
+    from services.compact import compact_prompt
+    from services.explain import explain, extract_entities
+    from services.generate import (
+        code_wrappers, make_directive, make_few_shot, make_planner_executor,
+        make_rubric_scored, make_schema_json,
+    )
+    from services.scoring import compare_prompts, score_prompt
+
+    builders = {
+        "make_directive": make_directive,
+        "make_schema_json": make_schema_json,
+        "make_few_shot": make_few_shot,
+        "make_planner_executor": make_planner_executor,
+        "make_rubric_scored": make_rubric_scored,
+    }
+    cases: Dict[str, Callable[[], Any]] = {}
+    for size, goals in corpus().items():
+        specs = [explain(goal, use_cache=False) for goal in goals]
+        bodies = [make_directive(spec) for spec in specs]
+        few_shot_bodies = [make_few_shot(spec) for spec in specs]
+
+        def each(fn, items):
+            return lambda: [fn(item) for item in items]
+
+        cases[f"extract_entities[{size}]"] = each(extract_entities, goals)
+        cases[f"explain[{size}]"] = each(lambda g: explain(g, use_cache=False), goals)
+        for name, builder in builders.items():
+            cases[f"{name}[{size}]"] = each(builder, specs)
+        cases[f"code_wrappers[{size}]"] = each(code_wrappers, bodies)
+        cases[f"compact_prompt[{size}]"] = each(compact_prompt, few_shot_bodies)
+        cases[f"score_prompt[{size}]"] = each(score_prompt, goals)
+        cases[f"compare_prompts[{size}]"] = each(lambda g: compare_prompts(g, use_cache=False), goals)
+    return cases
+
+
+def db_cases() -> Dict[str, Callable[[], Any]]:
+    from db import SessionLocal
+    from services.logger import get_or_create_scratchpad_version, record_run
+
+    def one_run():
+        with SessionLocal() as db:
+            version_id = get_or_create_scratchpad_version(db, "directive", "gpt-4o-mini")
+            now = datetime.utcnow()
+            record_run(db, version_id, "directive", "gpt-4o-mini", {}, now, now, output="ok")
+
+    return {"record_run": one_run}
+
+
+def endpoint_cases(client) -> Dict[str, Callable[[], Any]]:
+    """Endpoint cases through an in-process ASGI TestClient"""
+    no_cache = {"Cache-Control": "no-cache"}
+    medium = MEDIUM_GOALS[0]
+    long = corpus()["long"][0]
+
+    def call(method: str, path: str, **kwargs):
+        def fn():
+            r = client.request(method, path, headers=no_cache, **kwargs)
+            if r.status_code >= 400:
+                raise RuntimeError(f"{method} {path} -> {r.status_code}: {r.text[:200]}")
+        return fn
+
+    cases = {
+        "POST /explain[medium]": call("POST", "/explain", json={"goal": medium}),
+        "POST /explain[long]": call("POST", "/explain", json={"goal": long}),
+        "POST /compare[medium]": call("POST", "/compare", json={"prompt": medium}),
+        "POST /compare/batch[100]": call("POST", "/compare/batch", json={
+            "items": [{"prompt": f"{medium} #{i}"} for i in range(100)]
+        }),
+        "GET /runs": call("GET", "/runs", params={"limit": 50}),
+        "GET /stats/me": call("GET", "/stats/me"),
+        "GET /health/ready": call("GET", "/health/ready"),
+    }
+    for style in STYLES:
+        cases[f"POST /generate[{style}]"] = call("POST", "/generate", json={"goal": medium, "style": style})
+    return cases
+
+
+def run(budget_s: float, only: Optional[str] = None, rounds: int = 3,
+        keys: Optional[List[str]] = None) -> Dict[str, Any]:
+    """
+    Time every case and collect the results.
+
+    Args:
+        budget_s: Seconds spent timing each case
+        only: Only cases whose key contains this
+        rounds: Rounds per case (the best round counts)
+        keys: Only these exact case keys (used to re-check regressions)
+
+    Returns:
+        report: {"meta": ..., "results": {case key: stats}}
+    """
+    tmp = None
+    if "DATABASE_URL" not in os.environ:
+        tmp = tempfile.TemporaryDirectory()
+        os.environ["DATABASE_URL"] = f"sqlite:///{tmp.name}/bench.db"
+    os.environ.setdefault("LLM_CACHE_PATH", "")
+    os.environ.setdefault("TELEMETRY_WRITE_BEHIND", "false")
+
+    import logging
+    logging.disable(logging.CRITICAL)
+    from fastapi.testclient import TestClient
+    from app import app
+
+    results: Dict[str, Dict[str, float]] = {}
+
+    def bench(group: str, cases: Dict[str, Callable[[], Any]]) -> None:
+        for name, fn in cases.items():
+            key = f"{group}.{name}"
+            if (only and only not in key) or (keys is not None and key not in keys):
+                continue
+            results[key] = measure(fn, budget_s, rounds)
+            print(f"{key:<48} p50 {results[key]['p50_us']:>11.1f}us  p95 {results[key]['p95_us']:>11.1f}us",
+                  file=sys.stderr)
+
+    try:
+        bench("micro", micro_cases())
+        with TestClient(app) as client:
+            bench("db", db_cases())
+            bench("api", endpoint_cases(client))
+    finally:
+        if tmp is not None:
+            tmp.cleanup()
+
+    return {
+        "meta": {
+            "created_at": datetime.utcnow().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "budget_s": budget_s,
+            "rounds": rounds,
+        },
+        "results": results,
+    }
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], threshold: float,
+            metrics: List[str], min_delta_us: float) -> List[str]:
+    """
+    Regressions between two result files.
+
+    A case regresses when a metric grew by more than `threshold` (a fraction)
+    and by more than min_delta_us, so microsecond noise on tiny cases doesn't
+    fail the gate. Cases whose key is missing on either side are listed but
+    never fail it.
+
+    Returns:
+        regressions: One line per regressed case and metric
+    """
+    regressions = []
+    base_results, cur_results = baseline["results"], current["results"]
+    print(f"{'case':<48} " + " ".join(f"{m:>22}" for m in metrics))
+    for key in sorted(set(base_results) | set(cur_results)):
+        if key not in base_results or key not in cur_results:
+            print(f"{key:<48} {'(only in ' + ('current' if key in cur_results else 'baseline') + ')':>22}")
+            continue
+        cells = []
+        for metric in metrics:
+            before, after = base_results[key][metric], cur_results[key][metric]
+            change = (after - before) / before if before else 0.0
+            flag = ""
+            if change > threshold and after - before > min_delta_us:
+                flag = " !"
+                regressions.append(f"{key} {metric}: {before:.1f}us -> {after:.1f}us ({change:+.0%})")
+            cells.append(f"{after:>11.1f} ({change:+5.0%}){flag:<2}")
+        print(f"{key:<48} " + " ".join(f"{c:>22}" for c in cells))
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Benchmark suite and regression gate")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run_p = sub.add_parser("run", help="Run the suite and save results as JSON")
+    run_p.add_argument("-o", "--output", help="Results file (default: stdout)")
+    run_p.add_argument("--budget", type=float, default=1.0, help="Seconds spent timing each case")
+    run_p.add_argument("--rounds", type=int, default=3, help="Rounds per case; the best round counts")
+    run_p.add_argument("--filter", dest="only", help="Only cases whose name contains this")
+
+    cmp_p = sub.add_parser("compare", help="Fail if current results regressed against a baseline")
+    cmp_p.add_argument("baseline")
+    cmp_p.add_argument("current")
+    cmp_p.add_argument("--threshold", type=float, default=0.25, help="Allowed slowdown as a fraction (0.25 = 25%%)")
+    cmp_p.add_argument("--metrics", default="p50_us", help="Comma-separated metrics to gate on, e.g. p50_us,p95_us")
+    cmp_p.add_argument("--min-delta-us", type=float, default=20.0, help="Ignore slowdowns smaller than this")
+    cmp_p.add_argument("--recheck", action="store_true",
+                       help="Re-time regressed cases here and keep the faster result before failing")
+
+    args = parser.parse_args(argv)
+    if args.command == "run":
+        out = json.dumps(run(args.budget, args.only, args.rounds), indent=2, sort_keys=True)
+        if args.output:
+            with open(args.output, "w") as f:
+                f.write(out + "\n")
+        else:
+            print(out)
+        return
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    metrics = args.metrics.split(",")
+    regressions = compare(baseline, current, args.threshold, metrics, args.min_delta_us)
+    if regressions and args.recheck:
+        flagged = sorted({key for key in current["results"] if any(line.startswith(key + " ") for line in regressions)})
+        print(f"\nRe-checking {len(flagged)} case(s)...")
+        meta = current.get("meta", {})
+        again = run(meta.get("budget_s", 1.0), rounds=meta.get("rounds", 3), keys=flagged)["results"]
+        for key, stats in again.items():
+            previous = current["results"][key]
+            current["results"][key] = {
+                m: min(v, previous.get(m, v)) if m.endswith("_us") else v for m, v in stats.items()
+            }
+        print()
+        regressions = compare(baseline, current, args.threshold, metrics, args.min_delta_us)
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) over {args.threshold:.0%}:")
+        for line in regressions:
+            print(f"  {line}")
+        sys.exit(1)
+    print("\nNo regressions")
+
+
+if __name__ == "__main__":
+    main()
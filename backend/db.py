@@ -1,14 +1,201 @@
 import os
-from sqlalchemy import create_engine
+from typing import Any, Dict
+from sqlalchemy import create_engine, event, inspect, text
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker, declarative_base
 
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///prompt_gauge.db")
 
-# sqlite needs check_same_thread=False only when using sqlite+aiosqlite or similar.
-engine = create_engine(DATABASE_URL, echo=False, future=True)
+# Engine tuning profile: "auto" picks sqlite_wal or postgres_pooled from the URL,
+# "default" keeps SQLAlchemy's stock settings
+DB_PROFILE = os.getenv("DB_PROFILE", "auto")
+
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", "65536"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+
+PG_POOL_SIZE = int(os.getenv("PG_POOL_SIZE", "20"))
+PG_MAX_OVERFLOW = int(os.getenv("PG_MAX_OVERFLOW", "20"))
+PG_POOL_TIMEOUT_S = float(os.getenv("PG_POOL_TIMEOUT_S", "10"))
+PG_POOL_RECYCLE_S = int(os.getenv("PG_POOL_RECYCLE_S", "1800"))
+PG_STATEMENT_TIMEOUT_MS = int(os.getenv("PG_STATEMENT_TIMEOUT_MS", "15000"))
+
+PROFILE_BACKENDS = {"sqlite_wal": "sqlite", "postgres_pooled": "postgresql"}
+
+def resolve_profile(url: str, profile: str = DB_PROFILE) -> str:
+    """Concrete profile name for a URL; raises ValueError for unknown or mismatched profiles"""
+    backend = make_url(url).get_backend_name()
+    if profile == "auto":
+        return next((name for name, b in PROFILE_BACKENDS.items() if b == backend), "default")
+    if profile != "default" and profile not in PROFILE_BACKENDS:
+        raise ValueError(f"Unknown DB_PROFILE {profile!r}; expected auto, default, {', '.join(PROFILE_BACKENDS)}")
+    if profile in PROFILE_BACKENDS and PROFILE_BACKENDS[profile] != backend:
+        raise ValueError(f"DB_PROFILE {profile!r} needs a {PROFILE_BACKENDS[profile]} URL, got {backend}")
+    return profile
+
+def sqlite_pragmas() -> Dict[str, Any]:
+    # WAL lets readers run alongside the single writer; NORMAL sync is durable
+    # across app crashes in WAL mode (a power cut can lose the last commits)
+    return {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "busy_timeout": SQLITE_BUSY_TIMEOUT_MS,
+        "cache_size": -SQLITE_CACHE_SIZE_KB,  # negative means KiB, per connection
+        "mmap_size": SQLITE_MMAP_SIZE,
+        "temp_store": "MEMORY",
+    }
+
+def engine_options(profile: str, is_async: bool = False) -> Dict[str, Any]:
+    """create_engine keyword arguments for a resolved profile"""
+    if profile == "sqlite_wal":
+        options: Dict[str, Any] = {"connect_args": {"timeout": SQLITE_BUSY_TIMEOUT_MS / 1000}}
+        if is_async:
+            # aiosqlite file databases default to NullPool, which opens a new
+            # connection (and worker thread) per session
+            from sqlalchemy.pool import AsyncAdaptedQueuePool
+            options["poolclass"] = AsyncAdaptedQueuePool
+        return options
+    if profile == "postgres_pooled":
+        if is_async:  # asyncpg takes server settings directly
+            connect_args = {"server_settings": {"statement_timeout": str(PG_STATEMENT_TIMEOUT_MS)}}
+        else:
+            connect_args = {"options": f"-c statement_timeout={PG_STATEMENT_TIMEOUT_MS}"}
+        return {
+            "pool_size": PG_POOL_SIZE,
+            "max_overflow": PG_MAX_OVERFLOW,
+            "pool_timeout": PG_POOL_TIMEOUT_S,
+            "pool_recycle": PG_POOL_RECYCLE_S,
+            "pool_pre_ping": True,
+            "connect_args": connect_args,
+        }
+    return {}
+
+def install_sqlite_pragmas(sync_engine) -> None:
+    """Apply sqlite_pragmas() to every new connection of a (sync or async) engine"""
+    pragmas = sqlite_pragmas()
+    
+    @event.listens_for(sync_engine, "connect")
+    def apply_pragmas(dbapi_conn, _record):
+        cursor = dbapi_conn.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+def make_engine(url: str = DATABASE_URL, profile: str = DB_PROFILE):
+    """Engine for `url` tuned by `profile` (see DB_PROFILE)"""
+    profile = resolve_profile(url, profile)
+    eng = create_engine(url, echo=False, future=True, **engine_options(profile))
+    if profile == "sqlite_wal":
+        install_sqlite_pragmas(eng)
+    return eng
+
+ENGINE_PROFILE = resolve_profile(DATABASE_URL)
+engine = make_engine(DATABASE_URL, ENGINE_PROFILE)
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False, future=True)
+
+# Async drivers used for the same database by the async request path
+ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg"}
+
+def async_url(url: str = DATABASE_URL):
+    """DATABASE_URL with its driver swapped for the async one"""
+    parsed = make_url(url)
+    driver = ASYNC_DRIVERS.get(parsed.get_backend_name())
+    if driver is None:
+        raise ValueError(f"No async driver configured for {parsed.get_backend_name()}")
+    return parsed.set(drivername=driver)
+
+def make_async_engine(url: str = DATABASE_URL, profile: str = DB_PROFILE):
+    """Async engine for the same database and profile as make_engine"""
+    from sqlalchemy.ext.asyncio import create_async_engine
+    profile = resolve_profile(url, profile)
+    eng = create_async_engine(async_url(url), echo=False, **engine_options(profile, is_async=True))
+    if profile == "sqlite_wal":
+        install_sqlite_pragmas(eng.sync_engine)
+    return eng
+
+_async_engine = None
+_AsyncSessionLocal = None
+
+def get_async_sessionmaker():
+    """
+    AsyncSession factory, created on first use so the async drivers are only
+    needed by processes that serve the async routes. Scripts that use it must
+    await dispose_async_engine() before exiting (aiosqlite connections hold a
+    worker thread open).
+    """
+    global _async_engine, _AsyncSessionLocal
+    if _AsyncSessionLocal is None:
+        from sqlalchemy.ext.asyncio import async_sessionmaker
+        _async_engine = make_async_engine(DATABASE_URL, ENGINE_PROFILE)
+        _AsyncSessionLocal = async_sessionmaker(bind=_async_engine, autoflush=False, expire_on_commit=False)
+    return _AsyncSessionLocal
+
+async def dispose_async_engine():
+    """Close pooled async connections (app shutdown)"""
+    global _async_engine, _AsyncSessionLocal
+    if _async_engine is not None:
+        await _async_engine.dispose()
+        _async_engine = _AsyncSessionLocal = None
+
 Base = declarative_base()
 
 def init_db():
-    from models import Project, Prompt, PromptVersion, Run, RunItem
+    from models import Project, Prompt, PromptVersion, Run, RunItem, Blob, DailyStats, ArchivedDailyStats, ArchiveFile
     Base.metadata.create_all(bind=engine)
+    ensure_columns()
+    ensure_indexes()
+    ensure_rollups()
+
+def ensure_columns():
+    """
+    Add nullable columns declared on models that are missing from existing
+    tables (create_all never alters a table). Foreign keys on added columns
+    are not enforced on databases created before the column existed.
+    """
+    with engine.begin() as conn:
+        inspector = inspect(conn)
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing and column.nullable:
+                    column_type = column.type.compile(dialect=conn.dialect)
+                    conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+
+def ensure_indexes():
+    """
+    Create indexes declared on models that are missing from existing tables
+    (create_all only adds indexes when it creates the table itself).
+    """
+    from services.logger import dedupe_prompt_versions
+    with engine.begin() as conn:
+        # Unique indexes on prompt_versions can only be built once duplicates are gone
+        dedupe_prompt_versions(conn)
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
+
+def ensure_rollups():
+    """Backfill daily_stats from existing history the first time it is created"""
+    from services.rollups import backfill_daily_stats
+    with SessionLocal() as db:
+        backfill_daily_stats(db)
+
+def main(argv=None):
+    """
+    Schema management, for deployments running with STARTUP_MODE=fast.
+    From backend/:
+        python -m db migrate
+    """
+    import argparse
+    parser = argparse.ArgumentParser(description="Create or upgrade the database schema")
+    parser.add_argument("command", choices=["migrate"])
+    parser.parse_args(argv)
+    # Run as `-m db` this file is __main__; the models register on the importable db module
+    from db import init_db as migrate
+    migrate()
+    print(f"Schema is up to date ({make_url(DATABASE_URL).render_as_string(hide_password=True)})")
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,9 @@
 """
 Startup script for production deployment.
-Adds current directory to Python path and starts the app.
+`python main.py` already puts this directory first on sys.path.
 """
-import sys
 import os
 
-# Add current directory to Python path
-sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
-
-# Now import and run the app
 from app import app
 
 if __name__ == "__main__":
@@ -1,6 +1,7 @@
-from sqlalchemy import Column, Integer, String, Text, ForeignKey, Boolean, Float, DateTime, JSON
+from sqlalchemy import Column, Integer, String, Text, ForeignKey, Boolean, Float, Date, DateTime, JSON, Index, LargeBinary, text
 from sqlalchemy.orm import relationship, Mapped, mapped_column
-from datetime import datetime
+from datetime import date, datetime
+from typing import Optional
 from db import Base
 
 # Version lifecycle constants
@@ -43,6 +44,14 @@ class PromptVersion(Base):
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
     updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     prompt = relationship("Prompt", backref="versions")
+    __table_args__ = (
+        Index("uq_prompt_versions_prompt_label", "prompt_id", "version_label", unique=True),
+        # NULLs never collide in a unique index, so prompt-less (scratchpad) versions need their own
+        Index(
+            "uq_prompt_versions_scratchpad_label", "version_label", unique=True,
+            sqlite_where=text("prompt_id IS NULL"), postgresql_where=text("prompt_id IS NULL")
+        ),
+    )
 
 class Run(Base):
     __tablename__ = "runs"
@@ -61,35 +70,100 @@ class Run(Base):
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
     updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     run_items = relationship("RunItem", backref="run")
+    __table_args__ = (
+        # Serves /runs ordering and its (started_at, id) keyset cursor
+        Index("ix_runs_started_at_id", "started_at", "id"),
+        Index("ix_runs_created_at", "created_at"),
+        Index("ix_runs_prompt_version_id", "prompt_version_id"),
+    )
+
+class Blob(Base):
+    """Content-addressed text (sha256 of the UTF-8 bytes), zlib-compressed when large"""
+    __tablename__ = "blobs"
+    hash: Mapped[str] = mapped_column(String(64), primary_key=True)
+    size: Mapped[int] = mapped_column(Integer)  # uncompressed bytes
+    compression: Mapped[str] = mapped_column(String(10), default="none")  # none, zlib
+    data: Mapped[bytes] = mapped_column(LargeBinary)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
 
 class RunItem(Base):
     __tablename__ = "run_items"
     id: Mapped[int] = mapped_column(primary_key=True)
     run_id: Mapped[int] = mapped_column(ForeignKey("runs.id"))
-    input_ref: Mapped[str] = mapped_column(Text)
-    output_ref: Mapped[str] = mapped_column(Text)
+    input_ref: Mapped[str] = mapped_column(Text)  # empty when input_hash is set
+    output_ref: Mapped[str] = mapped_column(Text)  # empty when output_hash is set
+    input_hash: Mapped[Optional[str]] = mapped_column(String(64), ForeignKey("blobs.hash"), nullable=True)
+    output_hash: Mapped[Optional[str]] = mapped_column(String(64), ForeignKey("blobs.hash"), nullable=True)
     pass_bool: Mapped[bool] = mapped_column(Boolean, default=False)
     similarity: Mapped[float] = mapped_column(Float, default=0.0)
     judge_score: Mapped[float] = mapped_column(Float, default=0.0)
     notes: Mapped[str] = mapped_column(Text, default="")
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
     updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    __table_args__ = (
+        # Retention moves a run's items out with it
+        Index("ix_run_items_run_id", "run_id"),
+    )
 
 class PromptScore(Base):
     __tablename__ = "prompt_scores"
     id: Mapped[int] = mapped_column(primary_key=True)
-    prompt_text: Mapped[str] = mapped_column(Text)
+    prompt_text: Mapped[str] = mapped_column(Text)  # empty when prompt_hash is set
+    prompt_hash: Mapped[Optional[str]] = mapped_column(String(64), ForeignKey("blobs.hash"), nullable=True)
     score: Mapped[int] = mapped_column(Integer)
     problems_json: Mapped[str] = mapped_column(Text, default="[]")
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    __table_args__ = (
+        # "Have we seen this prompt?" is an index lookup on its hash
+        Index("ix_prompt_scores_prompt_hash", "prompt_hash"),
+    )
 
 class PromptTransformation(Base):
     __tablename__ = "prompt_transformations"
     id: Mapped[int] = mapped_column(primary_key=True)
     before_id: Mapped[int] = mapped_column(ForeignKey("prompt_scores.id"))
-    after_prompt_text: Mapped[str] = mapped_column(Text)
+    after_prompt_text: Mapped[str] = mapped_column(Text)  # empty when after_prompt_hash is set
+    after_prompt_hash: Mapped[Optional[str]] = mapped_column(String(64), ForeignKey("blobs.hash"), nullable=True)
     after_score: Mapped[int] = mapped_column(Integer)
     fixes_json: Mapped[str] = mapped_column(Text, default="[]")
     improvement_pct: Mapped[int] = mapped_column(Integer)
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
     before_score = relationship("PromptScore", foreign_keys=[before_id])
+    __table_args__ = (
+        # Serves retention's oldest-first batches
+        Index("ix_prompt_transformations_created_at", "created_at"),
+    )
+
+class DailyStats(Base):
+    """Per-day counters behind /stats/me, kept current by the run and compare writes"""
+    __tablename__ = "daily_stats"
+    day: Mapped[date] = mapped_column(Date, primary_key=True)
+    runs: Mapped[int] = mapped_column(Integer, default=0)
+    completed_runs: Mapped[int] = mapped_column(Integer, default=0)
+    transforms: Mapped[int] = mapped_column(Integer, default=0)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class ArchivedDailyStats(Base):
+    """daily_stats counters for rows retention has moved out, so rollup rebuilds still count them"""
+    __tablename__ = "archived_daily_stats"
+    day: Mapped[date] = mapped_column(Date, primary_key=True)
+    runs: Mapped[int] = mapped_column(Integer, default=0)
+    completed_runs: Mapped[int] = mapped_column(Integer, default=0)
+    transforms: Mapped[int] = mapped_column(Integer, default=0)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class ArchiveFile(Base):
+    """One gzipped NDJSON file written by retention (path is relative to ARCHIVE_DIR)"""
+    __tablename__ = "archive_files"
+    id: Mapped[int] = mapped_column(primary_key=True)
+    dataset: Mapped[str] = mapped_column(String(50))
+    path: Mapped[str] = mapped_column(String(500), unique=True)
+    rows: Mapped[int] = mapped_column(Integer)
+    min_id: Mapped[int] = mapped_column(Integer)
+    max_id: Mapped[int] = mapped_column(Integer)
+    min_created_at: Mapped[datetime] = mapped_column(DateTime)
+    max_created_at: Mapped[datetime] = mapped_column(DateTime)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    __table_args__ = (
+        Index("ix_archive_files_dataset_created", "dataset", "min_created_at"),
+    )
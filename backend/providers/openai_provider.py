@@ -1,23 +1,331 @@
+"""
+OpenAI adapter.
+One long-lived async client per process, owned by the app lifespan: HTTP
+keep-alive pooling, a concurrency cap, and retries with jittered backoff.
+Point OPENAI_BASE_URL at a local stub server to test without the real API.
+
+The SDK (with httpx) takes a few hundred ms to import, so it is loaded when
+the first provider is built rather than when this module is imported.
+"""
+
 import os
-from typing import Optional, Dict, Any
-try:
-    from openai import OpenAI
-except Exception:
-    OpenAI = None
-
-def call_openai(prompt: str, model: Optional[str] = None, params: Optional[Dict[str, Any]] = None) -> Optional[str]:
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key or OpenAI is None:
-        return None
-    client = OpenAI(api_key=api_key)
-    model = model or "gpt-4o-mini"
-    params = params or {}
+import sys
+import random
+import asyncio
+import logging
+import importlib.util
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional, Tuple, TypeVar
+from providers.response_cache import cache_key, get_response_cache
+from services.metrics import track_event
+from services.tokens import count_tokens, record_llm_usage
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+DEFAULT_MODEL = "gpt-4o-mini"
+OPENAI_MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", "16"))
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "3"))
+OPENAI_BACKOFF_BASE_S = float(os.getenv("OPENAI_BACKOFF_BASE_S", "0.5"))
+OPENAI_BACKOFF_MAX_S = float(os.getenv("OPENAI_BACKOFF_MAX_S", "8"))
+OPENAI_TIMEOUT_S = float(os.getenv("OPENAI_TIMEOUT_S", "30"))
+OPENAI_POOL_SIZE = int(os.getenv("OPENAI_POOL_SIZE", "20"))
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+# Checked without importing the SDK
+SDK_INSTALLED = importlib.util.find_spec("openai") is not None
+
+
+def _import_sdk():
+    """(httpx, openai), imported on first use"""
+    try:
+        import httpx
+        import openai
+    except Exception as e:
+        raise RuntimeError(f"openai SDK is not installed or failed to import: {e}") from e
+    return httpx, openai
+
+
+def _usable(content: str, validate: Optional[Callable[[str], Any]]) -> bool:
+    """False if `validate` rejects the content"""
+    if validate is None:
+        return True
     try:
-        resp = client.chat.completions.create(
-            model=model,
-            messages=[{"role":"user","content":prompt}],
-            temperature=params.get("temperature", 0.2),
+        validate(content)
+        return True
+    except Exception:
+        return False
+
+
+def _is_retryable(e: Exception) -> bool:
+    # An SDK error can only exist once the SDK has been imported
+    openai = sys.modules.get("openai")
+    if openai is not None and isinstance(e, openai.APIConnectionError):
+        return True  # includes timeouts
+    return getattr(e, "status_code", None) in RETRYABLE_STATUS
+
+
+class OpenAIProvider:
+    """Pooled async OpenAI client with a concurrency cap and jittered retries"""
+
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        base_url: Optional[str] = None,
+        max_concurrency: int = OPENAI_MAX_CONCURRENCY,
+        max_retries: int = OPENAI_MAX_RETRIES,
+        backoff_base_s: float = OPENAI_BACKOFF_BASE_S,
+        backoff_max_s: float = OPENAI_BACKOFF_MAX_S,
+        timeout_s: float = OPENAI_TIMEOUT_S,
+        pool_size: int = OPENAI_POOL_SIZE,
+    ):
+        httpx, openai = _import_sdk()
+        self.max_retries = max_retries
+        self.backoff_base_s = backoff_base_s
+        self.backoff_max_s = backoff_max_s
+        self._http = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+            timeout=timeout_s,
+        )
+        self._client = openai.AsyncOpenAI(
+            api_key=api_key or os.getenv("OPENAI_API_KEY"),
+            base_url=base_url or os.getenv("OPENAI_BASE_URL") or None,
+            http_client=self._http,
+            max_retries=0,  # retries are handled here, with jitter
         )
-        return resp.choices[0].message.content
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    def backoff_s(self, attempt: int) -> float:
+        """Full-jitter exponential backoff for the given retry attempt (0-based)"""
+        return random.uniform(0, min(self.backoff_max_s, self.backoff_base_s * (2 ** attempt)))
+
+    def _request(
+        self,
+        prompt: str,
+        model: Optional[str] = None,
+        params: Optional[Dict[str, Any]] = None,
+        response_format: Optional[Dict[str, Any]] = None,
+    ) -> Dict[str, Any]:
+        params = params or {}
+        request: Dict[str, Any] = {
+            "model": model or DEFAULT_MODEL,
+            "messages": [{"role": "user", "content": prompt}],
+            "temperature": params.get("temperature", 0.2),
+        }
+        if params.get("max_tokens"):
+            request["max_tokens"] = params["max_tokens"]
+        if response_format:
+            request["response_format"] = response_format
+        return request
+
+    def cache_key(
+        self,
+        prompt: str,
+        model: Optional[str] = None,
+        params: Optional[Dict[str, Any]] = None,
+        response_format: Optional[Dict[str, Any]] = None,
+    ) -> str:
+        """Response cache key for a request"""
+        return cache_key("openai", model or DEFAULT_MODEL, prompt,
+                         {**(params or {}), "response_format": response_format})
+
+    @track_event("llm_call")
+    async def complete(
+        self,
+        prompt: str,
+        model: Optional[str] = None,
+        params: Optional[Dict[str, Any]] = None,
+        response_format: Optional[Dict[str, Any]] = None,
+    ) -> Optional[str]:
+        """
+        Single-message chat completion; returns the content, or None on failure.
+        Token usage and estimated cost go to the LLM usage counters (the API's
+        usage figures when it reports them, offline counts otherwise).
+        """
+        request = self._request(prompt, model, params, response_format)
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with self._semaphore:
+                    resp = await self._client.chat.completions.create(**request)
+                content = resp.choices[0].message.content
+                usage = getattr(resp, "usage", None)
+                if usage is not None and usage.prompt_tokens is not None:
+                    record_llm_usage(request["model"], usage.prompt_tokens, usage.completion_tokens or 0)
+                else:
+                    record_llm_usage(request["model"], count_tokens(prompt), count_tokens(content or ""))
+                return content
+            except Exception as e:
+                if attempt >= self.max_retries or not _is_retryable(e):
+                    logger.warning(f"OpenAI call failed after {attempt + 1} attempt(s): {e}")
+                    return None
+                delay = self.backoff_s(attempt)
+                logger.info(f"OpenAI call failed ({e}); retrying in {delay:.2f}s")
+                await asyncio.sleep(delay)
+        return None
+
+    @track_event("llm_stream")
+    async def stream(
+        self,
+        prompt: str,
+        model: Optional[str] = None,
+        params: Optional[Dict[str, Any]] = None,
+        response_format: Optional[Dict[str, Any]] = None,
+    ) -> AsyncIterator[str]:
+        """
+        Streaming chat completion; yields content deltas as they arrive.
+
+        Failures before the first delta are retried like complete(). Once output
+        has been yielded a failure can't be retried transparently, so it is
+        raised to the caller, as is the last failure when retries run out.
+        """
+        request = {**self._request(prompt, model, params, response_format), "stream": True}
+
+        for attempt in range(self.max_retries + 1):
+            started = False
+            parts = []
+            try:
+                async with self._semaphore:
+                    chunks = await self._client.chat.completions.create(**request)
+                    async for chunk in chunks:
+                        delta = chunk.choices[0].delta.content if chunk.choices else None
+                        if delta:
+                            started = True
+                            parts.append(delta)
+                            yield delta
+                record_llm_usage(request["model"], count_tokens(prompt), count_tokens("".join(parts)))
+                return
+            except Exception as e:
+                if started or attempt >= self.max_retries or not _is_retryable(e):
+                    logger.warning(f"OpenAI stream failed after {attempt + 1} attempt(s): {e}")
+                    raise
+                delay = self.backoff_s(attempt)
+                logger.info(f"OpenAI stream failed ({e}); retrying in {delay:.2f}s")
+                await asyncio.sleep(delay)
+
+    async def complete_cached(
+        self,
+        prompt: str,
+        model: Optional[str] = None,
+        params: Optional[Dict[str, Any]] = None,
+        response_format: Optional[Dict[str, Any]] = None,
+        use_cache: bool = True,
+        validate: Optional[Callable[[str], Any]] = None,
+    ) -> Tuple[Optional[str], bool]:
+        """
+        complete() through the persistent response cache; returns (content, cache_hit).
+
+        `validate` (e.g. a JSON parser) is called on the content and raises if
+        the caller can't use it. Content that fails is returned but not cached,
+        and a cached entry that fails is evicted and requested again, so one
+        malformed answer isn't replayed until the TTL runs out.
+        """
+        cache = get_response_cache() if use_cache else None
+        if cache is None:
+            return await self.complete(prompt, model, params, response_format), False
+
+        model = model or DEFAULT_MODEL
+        key = self.cache_key(prompt, model, params, response_format)
+        content = await asyncio.to_thread(cache.get, key)
+        if content is not None:
+            if _usable(content, validate):
+                logger.info(f"[LLM CACHE] hit model={model} key={key[:12]}")
+                return content, True
+            logger.warning(f"[LLM CACHE] evicting unusable entry model={model} key={key[:12]}")
+            await asyncio.to_thread(cache.delete, key)
+
+        content = await self.complete(prompt, model, params, response_format)
+        if content is not None and _usable(content, validate):
+            await asyncio.to_thread(cache.set, key, "openai", model, content)
+        return content, False
+
+    async def aclose(self) -> None:
+        await self._http.aclose()
+
+
+_provider: Optional[OpenAIProvider] = None
+
+
+def provider_available() -> bool:
+    return SDK_INSTALLED and bool(os.getenv("OPENAI_API_KEY"))
+
+
+def get_provider() -> Optional[OpenAIProvider]:
+    """The process-wide provider, or None when no key or SDK is available"""
+    global _provider
+    if _provider is None and provider_available():
+        _provider = OpenAIProvider()
+    return _provider
+
+
+async def close_provider() -> None:
+    """Close the pooled client (app shutdown)"""
+    global _provider
+    if _provider is not None:
+        await _provider.aclose()
+        _provider = None
+
+
+def _in_app_worker_thread() -> bool:
+    """True inside a threadpool worker spawned by the running app (e.g. a sync endpoint)"""
+    try:
+        from anyio.from_thread import check_cancelled
+        check_cancelled()
+        return True
+    except Exception:
+        return False
+
+
+def run_with_provider(fn: Callable[[OpenAIProvider], Awaitable[T]]) -> Optional[T]:
+    """
+    Run an async provider call from sync code.
+
+    From a FastAPI threadpool worker the call runs on the app's event loop and
+    shares its pooled client. Elsewhere (scripts, CLI) a short-lived provider
+    is used for the one call. Like the old synchronous client, it returns
+    None instead of raising: when the provider fails, or when called from a
+    thread that is running an event loop (async code should await the
+    provider instead).
+    """
+    if not provider_available():
+        return None
+    try:
+        if _in_app_worker_thread():
+            from anyio.from_thread import run as run_on_app_loop
+            return run_on_app_loop(fn, get_provider())
+
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            pass  # no loop in this thread; run one for the call
+        else:
+            logger.warning("OpenAI call skipped: called synchronously from a running event loop; "
+                           "await get_provider() instead")
+            return None
+
+        async def once():
+            provider = OpenAIProvider()
+            try:
+                return await fn(provider)
+            finally:
+                await provider.aclose()
+        return asyncio.run(once())
     except Exception as e:
+        logger.warning(f"OpenAI call failed: {e}")
         return None
+
+
+def call_openai(prompt: str, model: Optional[str] = None, params: Optional[Dict[str, Any]] = None,
+                response_format: Optional[Dict[str, Any]] = None, use_cache: bool = True) -> Optional[str]:
+    result = call_openai_cached(prompt, model, params, response_format, use_cache)
+    return result[0] if result else None
+
+
+def call_openai_cached(prompt: str, model: Optional[str] = None, params: Optional[Dict[str, Any]] = None,
+                       response_format: Optional[Dict[str, Any]] = None, use_cache: bool = True,
+                       validate: Optional[Callable[[str], Any]] = None) -> Optional[Tuple[Optional[str], bool]]:
+    """Sync complete_cached(); returns (content, cache_hit), or None when no provider is configured"""
+    return run_with_provider(
+        lambda p: p.complete_cached(prompt, model, params, response_format, use_cache, validate)
+    )
@@ -0,0 +1,136 @@
+"""
+Persistent LLM response cache.
+Completions are stored in a small SQLite file keyed by provider, model,
+rendered prompt and sampling params, so repeated requests cost no tokens and
+the cache survives restarts. Entries expire after a TTL and the least recently
+used ones are evicted beyond a size limit.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Empty path disables the cache
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "llm_cache.db")
+LLM_CACHE_TTL_S = float(os.getenv("LLM_CACHE_TTL_S", str(7 * 24 * 3600)))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "10000"))
+
+# Run size eviction every N writes rather than on each one
+EVICT_EVERY = 100
+
+
+def cache_key(provider: str, model: str, prompt: str, params: Dict[str, Any]) -> str:
+    """Stable hash of everything that determines the completion"""
+    payload = json.dumps(
+        {"provider": provider, "model": model, "prompt": prompt, "params": params},
+        sort_keys=True, default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """SQLite-backed completion cache with TTL and LRU size eviction"""
+
+    def __init__(self, path: str = LLM_CACHE_PATH, ttl_s: float = LLM_CACHE_TTL_S,
+                 max_entries: int = LLM_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.hits = 0
+        self.misses = 0
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=5.0, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS llm_responses (
+                key TEXT PRIMARY KEY,
+                provider TEXT NOT NULL,
+                model TEXT NOT NULL,
+                content TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used_at REAL NOT NULL
+            )"""
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS ix_llm_responses_last_used_at ON llm_responses (last_used_at)"
+        )
+
+    def get(self, key: str) -> Optional[str]:
+        """Cached content for key, or None if missing or expired"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT content FROM llm_responses WHERE key = ? AND created_at >= ?",
+                (key, now - self.ttl_s),
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE llm_responses SET last_used_at = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            return row[0]
+
+    def set(self, key: str, provider: str, model: str, content: str) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_responses (key, provider, model, content, created_at, last_used_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, provider, model, content, now, now),
+            )
+            self._writes += 1
+            if self._writes % EVICT_EVERY == 1:
+                self._evict(now)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_responses WHERE key = ?", (key,))
+
+    def _evict(self, now: float) -> None:
+        self._conn.execute("DELETE FROM llm_responses WHERE created_at < ?", (now - self.ttl_s,))
+        self._conn.execute(
+            "DELETE FROM llm_responses WHERE key IN ("
+            "SELECT key FROM llm_responses ORDER BY last_used_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            size = self._conn.execute("SELECT COUNT(*) FROM llm_responses").fetchone()[0]
+            return {"size": size, "max_entries": self.max_entries, "hits": self.hits, "misses": self.misses}
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+_cache: Optional[ResponseCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> Optional[ResponseCache]:
+    """The process-wide response cache, or None when LLM_CACHE_PATH is empty"""
+    global _cache
+    if _cache is None and LLM_CACHE_PATH:
+        with _cache_lock:
+            if _cache is None:
+                try:
+                    _cache = ResponseCache()
+                except Exception as e:
+                    logger.warning(f"LLM response cache unavailable ({e}); continuing without it")
+                    return None
+    return _cache
+
+
+def response_cache_stats() -> Optional[Dict[str, Any]]:
+    """Counters of the response cache if this process has opened it, else None (never creates the file)"""
+    cache = _cache
+    return cache.stats() if cache is not None else None
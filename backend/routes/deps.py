@@ -1,8 +1,5 @@
-from db import SessionLocal, init_db
-from typing import Generator
-
-# create tables on import
-init_db()
+from db import SessionLocal, get_async_sessionmaker
+from typing import AsyncGenerator, Generator
 
 def get_db() -> Generator:
     db = SessionLocal()
@@ -10,3 +7,7 @@ def get_db() -> Generator:
         yield db
     finally:
         db.close()
+
+async def get_async_db() -> AsyncGenerator:
+    async with get_async_sessionmaker()() as db:
+        yield db
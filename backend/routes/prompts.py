@@ -1,72 +1,157 @@
-from fastapi import APIRouter, Depends, Header
+from fastapi import APIRouter, Depends, Header, Query, Request, Response
 from fastapi import HTTPException
-from sqlalchemy.orm import Session
-from typing import Optional, List
+from fastapi.exceptions import RequestValidationError
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import TypeAdapter, ValidationError
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import iterate_in_threadpool
+from typing import AsyncIterator, Iterator, Optional, List, Tuple, Union
 from datetime import datetime
 import os
 import json
+import time
 import logging
-from routes.deps import get_db
-from schemas import ExplainIn, ExplainOut, GenerateIn, GenerateOut, RunOut, CompareIn, CompareOut, StatsOut, StatsWeek, StatsAllTime
-from services.explain import explain
-from services.generate import generate
-from services.scoring import compare_prompts
-from services.logger import record_run, get_or_create_scratchpad_version, track_event, get_run_stats
-from models import Run, PromptScore, PromptTransformation
+from db import get_async_sessionmaker
+from routes.deps import get_async_db
+from schemas import ExplainIn, ExplainOut, GenerateIn, GenerateOut, GenerateManyOut, RunOut, CompareIn, CompareOut, CompareBatchIn, CompareBatchOut, StatsOut, StatsWeek, StatsAllTime
+from services.explain import explain_async, explain_events
+from services.generate import generate, generate_events, prompt_targets, unknown_languages
+from services.helpers import sse_event
+from services.scoring import compare_prompts, summarize_comparisons
+from services.logger import record_run_async, record_runs_async, record_comparisons_async, get_or_create_scratchpad_version_async, track_event, telemetry_queue_stats, encode_comparisons, get_telemetry_writer
+from services.health import cached_readiness, check_ready, get_metrics_snapshot
+from services.cache import cache_stats
+from services.singleflight import singleflight_stats
+from services.rollups import read_totals
+from services.runs import list_runs
+from services.export import EXPORTS, FORMATS as EXPORT_FORMATS, aiter_export, export_filename
+from services.metrics import METRICS_ENABLED, CONTENT_TYPE as METRICS_CONTENT_TYPE, render_metrics
+from services.tokens import prompt_usage
+from services.profiling import PROFILE_TOP_N, collapse, get_profile_store, profile_detail, profiling_enabled, token_matches
+from providers.response_cache import response_cache_stats
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
+# Upper bound on prompts accepted by /compare/batch in one request
+COMPARE_BATCH_MAX = int(os.getenv("COMPARE_BATCH_MAX", "50000"))
+# Upper bound on the /compare/batch request body, checked while it is read
+COMPARE_BATCH_MAX_BYTES = int(os.getenv("COMPARE_BATCH_MAX_BYTES", str(64 * 1024 * 1024)))
+NDJSON_CONTENT_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl")
+_compare_items = TypeAdapter(List[CompareIn])
+# Largest page /runs will return
+RUNS_PAGE_MAX = int(os.getenv("RUNS_PAGE_MAX", "500"))
+# Keep proxies from buffering server-sent events
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+def wants_cache(cache_control: Optional[str]) -> bool:
+    """`Cache-Control: no-cache` on a request bypasses the memo caches"""
+    return not (cache_control and "no-cache" in cache_control.lower())
+
+def wants_llm(x_use_llm: Optional[str]) -> bool:
+    return x_use_llm is not None and x_use_llm.lower() in ["true", "1", "yes"]
+
+def run_usage(result: dict, model: str) -> dict:
+    """Estimated tokens_in/tokens_out/cost of sending a generated result's prompt(s) to `model`"""
+    return prompt_usage(prompt_targets(result).values(), model)
+
+def generate_with_usage(goal: str, model: str, **kwargs) -> Tuple[dict, List[dict]]:
+    """
+    generate() plus run_usage for each result, so the token counting runs in
+    the same worker thread as the heuristics.
+
+    Returns:
+        (out, usages): generate's response and one usage per result
+    """
+    out = generate(goal, model=model, **kwargs)
+    return out, [run_usage(r, model) for r in out.get("results", [out])]
+
+def with_usage(events: Iterator[Tuple[str, dict]], model: str) -> Iterator[Tuple[str, dict, Optional[dict]]]:
+    """generate_events with the run's usage attached to the `prompt` event (counted in the iterating thread)"""
+    for event, data in events:
+        yield event, data, run_usage(data, model) if event == "prompt" else None
+
+def check_languages(languages: Optional[List[str]]) -> None:
+    """Reject `languages` naming a code wrapper that isn't registered"""
+    unknown = unknown_languages(languages)
+    if unknown:
+        raise HTTPException(status_code=422, detail=f"Unknown languages: {', '.join(unknown)}")
+
 @router.post("/explain", response_model=ExplainOut)
-def explain_endpoint(
+async def explain_endpoint(
     body: ExplainIn, 
-    db: Session = Depends(get_db),
-    x_use_llm: Optional[str] = Header(None)
+    x_use_llm: Optional[str] = Header(None),
+    cache_control: Optional[str] = Header(None)
 ):
     """
     Explain a prompt goal with hybrid heuristic + optional LLM refinement.
     Pass 'x-use-llm: true' header to enable LLM refinement (requires OPENAI_API_KEY).
+    The LLM call awaits the pooled provider client instead of holding a worker thread.
     """
-    use_llm = x_use_llm is not None and x_use_llm.lower() in ["true", "1", "yes"]
-    data = explain(
+    use_llm = wants_llm(x_use_llm)
+    data = await explain_async(
         body.goal, 
         body.constraints or "", 
         body.desired_format or "",
-        use_llm=use_llm
+        use_llm=use_llm,
+        use_cache=wants_cache(cache_control)
     )
     return data
 
-@router.post("/generate", response_model=GenerateOut)
+@router.post("/generate", response_model=Union[GenerateOut, GenerateManyOut])
 @track_event("generate_call")
-def generate_endpoint(body: GenerateIn, db: Session = Depends(get_db)):
+async def generate_endpoint(
+    body: GenerateIn,
+    db: AsyncSession = Depends(get_async_db),
+    cache_control: Optional[str] = Header(None)
+):
     """
     Generate a prompt in the specified style.
     Supports: directive, schema_json, few_shot, planner_executor, rubric_scored
     
-    Automatically logs each generation run to the database for telemetry.
+    Pass `styles` (e.g. ["*"]) to build several styles from one explain pass;
+    the response is then {"results": [...]} ranked by score, best first.
+    Pass `languages` to pick which code wrappers are rendered ([] for none).
+    Pass `compact: true` or `max_prompt_tokens` for a minimal-token prompt; the
+    response's `compaction` reports tokens and score_prompt score before/after.
+    
+    Automatically logs each generation run to the database for telemetry, with
+    offline token and cost estimates for the generated prompt (services.tokens).
+    The heuristics run in a worker thread; the DB writes are awaited.
     """
     started_at = datetime.utcnow()
+    check_languages(body.languages)
+    
+    use_cache = wants_cache(cache_control)
+    if body.styles:
+        return await generate_many_endpoint(body, db, started_at, use_cache)
     
     # Generate the prompt
-    out = generate(
+    out, (usage,) = await run_in_threadpool(
+        generate_with_usage,
         body.goal, 
         style=body.style,
         model=body.model or "gpt-4o-mini",
-        params=body.params or {}
+        params=body.params or {},
+        languages=body.languages,
+        compact=body.compact,
+        max_prompt_tokens=body.max_prompt_tokens,
+        use_cache=use_cache
     )
     
     finished_at = datetime.utcnow()
     
     # Get or create a scratchpad version for this run
-    version_id = get_or_create_scratchpad_version(
+    version_id = await get_or_create_scratchpad_version_async(
         db, 
         style=body.style, 
         model=body.model or "gpt-4o-mini"
     )
     
     # Log the run
-    record_run(
-        db=db,
+    await record_run_async(
+        db,
         prompt_version_id=version_id,
         style=body.style,
         model=body.model or "gpt-4o-mini",
@@ -74,125 +159,441 @@ def generate_endpoint(body: GenerateIn, db: Session = Depends(get_db)):
         started_at=started_at,
         finished_at=finished_at,
         output=out.get("prompt_body", ""),
-        tokens_in=0,  # Placeholder - actual token counting would require API integration
-        tokens_out=0,
-        cost=0.0,
-        source="web"
+        source="web",
+        **usage
     )
     
     return out
 
+@router.post("/explain/stream")
+async def explain_stream_endpoint(
+    body: ExplainIn,
+    x_use_llm: Optional[str] = Header(None),
+    cache_control: Optional[str] = Header(None)
+):
+    """
+    /explain as server-sent events.
+    Events: `spec` (heuristic spec, sent as soon as it is computed); with
+    'x-use-llm: true', `token` ({"delta": ...}) as the completion arrives, then
+    `refined` (the merged spec, or the heuristic spec if refinement fails);
+    finally `done` with timings in ms.
+    """
+    return StreamingResponse(
+        explain_sse(body, wants_llm(x_use_llm), wants_cache(cache_control)),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS
+    )
+
+async def explain_sse(body: ExplainIn, use_llm: bool, use_cache: bool) -> AsyncIterator[str]:
+    t0 = time.perf_counter()
+    timing = {}
+    async for event, data in explain_events(
+        body.goal,
+        body.constraints or "",
+        body.desired_format or "",
+        use_llm=use_llm,
+        use_cache=use_cache
+    ):
+        if event == "spec":
+            timing["heuristic_ms"] = int((time.perf_counter() - t0) * 1000)
+        yield sse_event(event, data)
+    timing["total_ms"] = int((time.perf_counter() - t0) * 1000)
+    yield sse_event("done", timing)
+
+@router.post("/generate/stream")
+@track_event("generate_stream_call")
+async def generate_stream_endpoint(
+    body: GenerateIn,
+    cache_control: Optional[str] = Header(None)
+):
+    """
+    /generate as server-sent events, for a single style.
+    Events: `prompt` (style, prompt_body, planner/executor prompts, notes, plus
+    `compaction` when compacting), then one `variant` ({"language", "code"}, plus
+    "prompt": planner|executor for dual prompts) per requested code wrapper, then
+    `done` with run_id and timings in ms.
+    run_id is null when the run was queued for a background write or not stored.
+    """
+    if body.styles:
+        raise HTTPException(
+            status_code=422,
+            detail="`styles` is not supported when streaming; use /generate or one request per style"
+        )
+    check_languages(body.languages)
+    return StreamingResponse(
+        generate_sse(body, wants_cache(cache_control)),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS
+    )
+
+async def generate_sse(body: GenerateIn, use_cache: bool) -> AsyncIterator[str]:
+    started_at = datetime.utcnow()
+    t0 = time.perf_counter()
+    model = body.model or "gpt-4o-mini"
+    timing = {}
+    prompt_body = ""
+    usage = {}
+    events = generate_events(body.goal, body.style, model, body.params or {}, body.languages, use_cache,
+                             body.compact, body.max_prompt_tokens)
+    async for event, data, event_usage in iterate_in_threadpool(with_usage(events, model)):
+        if event == "prompt":
+            timing["prompt_ms"] = int((time.perf_counter() - t0) * 1000)
+            prompt_body = data["prompt_body"]
+            usage = event_usage
+        yield sse_event(event, data)
+    timing["generate_ms"] = int((time.perf_counter() - t0) * 1000)
+    finished_at = datetime.utcnow()
+    
+    # The request's session is closed before the body streams, so use our own
+    async with get_async_sessionmaker()() as db:
+        version_id = await get_or_create_scratchpad_version_async(db, style=body.style, model=model)
+        run_id = await record_run_async(
+            db,
+            prompt_version_id=version_id,
+            style=body.style,
+            model=model,
+            params=body.params or {},
+            started_at=started_at,
+            finished_at=finished_at,
+            output=prompt_body,
+            source="web",
+            **usage
+        )
+    
+    timing["total_ms"] = int((time.perf_counter() - t0) * 1000)
+    yield sse_event("done", {"run_id": run_id if run_id > 0 else None, **timing})
+
+async def generate_many_endpoint(body: GenerateIn, db: AsyncSession, started_at: datetime,
+                                 use_cache: bool = True) -> dict:
+    """Multi-style /generate: one Run row per style, written in one transaction"""
+    model = body.model or "gpt-4o-mini"
+    out, usages = await run_in_threadpool(
+        generate_with_usage, body.goal, model=model, params=body.params or {}, styles=body.styles,
+        languages=body.languages, compact=body.compact, max_prompt_tokens=body.max_prompt_tokens,
+        use_cache=use_cache
+    )
+    finished_at = datetime.utcnow()
+    
+    await record_runs_async(db, [
+        {
+            "prompt_version_id": await get_or_create_scratchpad_version_async(db, style=r["style"], model=model),
+            "style": r["style"],
+            "model": model,
+            "params": body.params or {},
+            "started_at": started_at,
+            "finished_at": finished_at,
+            "source": "web",
+            **usage,
+        }
+        for r, usage in zip(out["results"], usages)
+    ])
+    
+    return out
+
 @router.get("/runs", response_model=List[RunOut])
-def get_runs_endpoint(db: Session = Depends(get_db), limit: int = 20):
+async def get_runs_endpoint(
+    response: Response,
+    db: AsyncSession = Depends(get_async_db),
+    limit: int = Query(20, ge=1, le=RUNS_PAGE_MAX),
+    cursor: Optional[str] = None,
+    style: Optional[str] = None,
+    model: Optional[str] = None,
+    source: Optional[str] = None
+):
     """
     Get recent runs with basic telemetry data.
-    Returns the last N runs ordered by most recent first.
+    Returns runs ordered by most recent first, one page at a time.
     
     Args:
         limit: Maximum number of runs to return (default: 20)
+        cursor: Value of the previous page's X-Next-Cursor header
+        style, model, source: Only return runs matching these exactly
+    
+    The X-Next-Cursor response header holds the cursor for the next page;
+    it is absent on the last page.
     """
-    runs = db.query(Run).order_by(Run.started_at.desc()).limit(limit).all()
+    try:
+        runs, next_cursor = await db.run_sync(
+            list_runs, limit, cursor, style=style, model=model, source=source
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     return runs
 
+@router.get("/export/{dataset}")
+async def export_endpoint(
+    dataset: str,
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    gzip: bool = False,
+    archived: bool = False
+):
+    """
+    Stream every row of a telemetry table for bulk loading elsewhere.
+
+    Args:
+        dataset: runs, run_items or comparisons
+        format: ndjson (default) or csv
+        since, until: Optional created_at range (since inclusive, until exclusive)
+        gzip: Send a .gz file instead of plain text
+        archived: Also include rows retention has moved to archive files
+
+    Rows are read through a server-side cursor and streamed as they are
+    encoded, so memory use doesn't grow with the table.
+    """
+    if dataset not in EXPORTS:
+        raise HTTPException(status_code=404, detail=f"Unknown export {dataset!r}; expected {', '.join(EXPORTS)}")
+
+    async def chunks() -> AsyncIterator[bytes]:
+        # The request's session is closed before the body streams, so use our own
+        async with get_async_sessionmaker()() as db:
+            async for chunk in aiter_export(db, dataset, format, since, until, gzip, archived=archived):
+                yield chunk
+
+    filename = export_filename(dataset, format, gzip)
+    return StreamingResponse(
+        chunks(),
+        media_type="application/gzip" if gzip else EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+@router.get("/health/live")
+async def liveness_check():
+    """
+    Liveness probe: the process is up and serving. Never touches the database.
+    """
+    return {"status": "ok"}
+
+@router.get("/health/ready")
+async def readiness_check():
+    """
+    Readiness probe: the database answers `SELECT 1`.
+    The result is reused for HEALTH_READY_CACHE_S, so frequent probes stay cheap.
+    Responds 503 when the database is unreachable.
+    """
+    ready = cached_readiness()
+    if ready is None:
+        ready = await run_in_threadpool(check_ready)
+    if not ready:
+        return JSONResponse(status_code=503, content={"status": "unavailable", "db": False})
+    return {"status": "ok", "db": True}
+
 @router.get("/health")
-def health_check(db: Session = Depends(get_db)):
+async def health_check():
     """
     Health check endpoint for monitoring, CI probes, and Docker health checks.
+    Orchestrator probes should prefer /health/live and /health/ready.
     
     Returns:
         - status: overall health status
-        - db: database connectivity status
+        - db: database connectivity status (same cached check as /health/ready)
         - openai_key: whether OpenAI API key is configured
-        - metrics: aggregate run statistics
+        - metrics: aggregate run statistics from the background snapshot
+        - metrics_age_s: seconds since the snapshot was refreshed (null before the first refresh)
+        - cache: memo cache counters per function
+        - singleflight: coalesced in-flight call counters per function
+        - telemetry_queue: write-behind queue depth and drop counters (null when off)
+        - llm_cache: persistent LLM response cache counters (null when off or not used yet)
     """
-    db_ok = True
-    try:
-        # Test database connection
-        from sqlalchemy import text
-        db.execute(text("SELECT 1"))
-    except Exception as e:
-        db_ok = False
-    
-    # Get run statistics
-    stats = get_run_stats(db) if db_ok else {
-        "total_runs": 0,
-        "avg_latency_ms": 0,
-        "total_cost": 0.0,
-        "success_rate": 0.0
-    }
+    db_ok = cached_readiness()
+    if db_ok is None:
+        db_ok = await run_in_threadpool(check_ready)
+    snapshot = get_metrics_snapshot().get()
     
+    # Stats only once something has used the cache; a probe shouldn't create the file
+    llm_cache = await run_in_threadpool(response_cache_stats)
     return {
         "status": "ok" if db_ok else "degraded",
         "db": db_ok,
         "openai_key": bool(os.getenv("OPENAI_API_KEY")),
-        "metrics": stats
+        "metrics": snapshot["metrics"],
+        "metrics_age_s": snapshot["age_s"],
+        "cache": cache_stats(),
+        "singleflight": singleflight_stats(),
+        "telemetry_queue": telemetry_queue_stats(),
+        "llm_cache": llm_cache
     }
 
+@router.get("/metrics", include_in_schema=False)
+async def metrics_endpoint():
+    """
+    Prometheus scrape target: per-event and per-route latency histograms,
+    in-flight gauges and error counters (404 when METRICS_ENABLED is off).
+    """
+    if not METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    return Response(render_metrics(), media_type=METRICS_CONTENT_TYPE)
+
+def check_profile_access(x_profile: Optional[str]) -> None:
+    """Profiles are only served when profiling is on, and only to holders of PROFILE_TOKEN"""
+    if not profiling_enabled():
+        raise HTTPException(status_code=404, detail="Profiling is disabled")
+    if not token_matches(x_profile):
+        raise HTTPException(status_code=403, detail="Send the profiling token in X-Profile")
+
+@router.get("/profiles", include_in_schema=False)
+async def list_profiles_endpoint(x_profile: Optional[str] = Header(None)):
+    """
+    Recent request profiles, newest first (id, request_id, method, path, status,
+    duration, sample count). Profile a request by sending
+    `X-Profile: <PROFILE_TOKEN>`, or let 1-in-PROFILE_SAMPLE_N sampling pick it.
+    """
+    check_profile_access(x_profile)
+    return {"profiles": get_profile_store().list()}
+
+@router.get("/profiles/{profile_id}", include_in_schema=False)
+async def get_profile_endpoint(
+    profile_id: str,
+    top: int = Query(PROFILE_TOP_N, ge=1, le=1000),
+    x_profile: Optional[str] = Header(None)
+):
+    """One profile with its hottest functions by self and total samples"""
+    check_profile_access(x_profile)
+    profile = get_profile_store().get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return profile_detail(profile, top)
+
+@router.get("/profiles/{profile_id}/collapsed", include_in_schema=False)
+async def get_profile_collapsed_endpoint(profile_id: str, x_profile: Optional[str] = Header(None)):
+    """One profile as collapsed stacks, for flamegraph.pl or speedscope"""
+    check_profile_access(x_profile)
+    profile = get_profile_store().get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return Response(collapse(profile["stacks"]), media_type="text/plain")
+
 @router.post("/compare", response_model=CompareOut)
-def compare_endpoint(body: CompareIn, db: Session = Depends(get_db)):
+async def compare_endpoint(
+    body: CompareIn,
+    db: AsyncSession = Depends(get_async_db),
+    cache_control: Optional[str] = Header(None)
+):
     """
     Compare original prompt with optimized version.
     Shows before/after scores, problems, and improvement percentage.
     
     This is the "money shot" for viral LinkedIn sharing.
     """
-    # Run comparison
-    result = compare_prompts(body.prompt, body.context or "")
+    # Run comparison (CPU-bound, so off the event loop)
+    result = await run_in_threadpool(
+        compare_prompts, body.prompt, body.context or "", use_cache=wants_cache(cache_control)
+    )
     
-    # Store in database
-    try:
-        # Store before score
-        before_score = PromptScore(
-            prompt_text=body.prompt,
-            score=result["before"]["score"],
-            problems_json=json.dumps(result["before"]["problems"])
-        )
-        db.add(before_score)
-        db.commit()
-        db.refresh(before_score)
-        
-        # Store transformation
-        transformation = PromptTransformation(
-            before_id=before_score.id,
-            after_prompt_text=result["after"]["prompt"],
-            after_score=result["after"]["score"],
-            fixes_json=json.dumps(result["after"]["fixes"]),
-            improvement_pct=result["improvement_pct"]
-        )
-        db.add(transformation)
-        db.commit()
-        
-    except Exception as e:
-        logger.warning(f"Failed to store comparison: {e}")
-        # Don't fail the request if DB write fails
+    # Store in database (one transaction; don't fail the request if the write fails)
+    await record_comparisons_async(db, [result])
     
     return result
 
+def batch_too_large(count: str) -> HTTPException:
+    return HTTPException(status_code=413, detail=f"Batch too large: {count} items (max {COMPARE_BATCH_MAX})")
+
+def parse_compare_batch(raw: bytes, content_type: str) -> List[CompareIn]:
+    """
+    Parse a batch body: a JSON array, a JSON object with "items", or NDJSON
+    (one CompareIn object per line).
+    
+    Raises 413 as soon as more than COMPARE_BATCH_MAX items are seen, before
+    validating them (NDJSON stops decoding at the first item over the cap).
+    CPU-bound on large bodies; call it from the threadpool.
+    """
+    try:
+        if content_type.split(";")[0].strip().lower() in NDJSON_CONTENT_TYPES:
+            payload = []
+            for line in raw.splitlines():
+                if not line.strip():
+                    continue
+                if len(payload) == COMPARE_BATCH_MAX:
+                    raise batch_too_large(f"more than {COMPARE_BATCH_MAX}")
+                payload.append(json.loads(line))
+        else:
+            payload = json.loads(raw or b"[]")
+            if isinstance(payload, dict):
+                items = payload.get("items")
+                if isinstance(items, list) and len(items) > COMPARE_BATCH_MAX:
+                    raise batch_too_large(str(len(items)))
+                return CompareBatchIn.model_validate(payload).items
+            if isinstance(payload, list) and len(payload) > COMPARE_BATCH_MAX:
+                raise batch_too_large(str(len(payload)))
+        return _compare_items.validate_python(payload)
+    except json.JSONDecodeError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid JSON body: {e}")
+    except ValidationError as e:
+        raise RequestValidationError(e.errors(include_url=False))
+
+async def read_body_capped(request: Request, max_bytes: int) -> bytes:
+    """The request body, or a 413 as soon as it is known to exceed max_bytes"""
+    too_large = HTTPException(status_code=413, detail=f"Request body too large (max {max_bytes} bytes)")
+    declared = request.headers.get("content-length", "")
+    if declared.isdigit() and int(declared) > max_bytes:
+        raise too_large
+    chunks = []
+    size = 0
+    async for chunk in request.stream():
+        size += len(chunk)
+        if size > max_bytes:
+            raise too_large
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+def score_compare_batch(items: List[CompareIn], use_cache: bool = True) -> Tuple[dict, Optional[dict]]:
+    """
+    Score every item; the rows are stored separately with one bulk insert per table.
+    
+    Returns:
+        (out, encoded): the response body, and the prompt texts hashed and encoded
+            for record_comparisons_async (None with write-behind, whose writer
+            thread encodes them)
+    """
+    results = [compare_prompts(item.prompt, item.context or "", use_cache=use_cache) for item in items]
+    encoded = encode_comparisons(results) if get_telemetry_writer() is None else None
+    return {"results": results, "stats": summarize_comparisons(results)}, encoded
+
+@router.post("/compare/batch", response_model=CompareBatchOut)
+async def compare_batch_endpoint(request: Request, db: AsyncSession = Depends(get_async_db)):
+    """
+    Compare many prompts in one request.
+    Accepts a JSON array of {prompt, context}, {"items": [...]}, or an NDJSON body
+    (Content-Type: application/x-ndjson). Returns per-item results in input order
+    plus aggregate stats. All rows are written in a single transaction.
+    Bodies over COMPARE_BATCH_MAX_BYTES or COMPARE_BATCH_MAX items get a 413.
+    """
+    raw = await read_body_capped(request, COMPARE_BATCH_MAX_BYTES)
+    # Parsing and scoring are CPU-bound; keep them off the event loop
+    items = await run_in_threadpool(parse_compare_batch, raw, request.headers.get("content-type", ""))
+    
+    use_cache = wants_cache(request.headers.get("cache-control"))
+    out, encoded = await run_in_threadpool(score_compare_batch, items, use_cache)
+    out["stats"]["stored"] = await record_comparisons_async(db, out["results"], encoded) >= 0
+    return out
+
 @router.get("/stats/me", response_model=StatsOut)
-def get_stats_endpoint(db: Session = Depends(get_db)):
+async def get_stats_endpoint(db: AsyncSession = Depends(get_async_db)):
     """
     Get user's personal impact statistics.
     Shows time saved, cost avoided, and success metrics.
+    
+    Reads the per-day daily_stats rollups, so cost doesn't grow with history.
+    "This week" covers the last 7 UTC days plus today.
     """
-    from sqlalchemy import func
     from datetime import timedelta
     
     # Calculate week boundary
     now = datetime.utcnow()
     week_ago = now - timedelta(days=7)
     
-    # Week stats
-    week_runs = db.query(func.count(Run.id)).filter(
-        Run.created_at >= week_ago
-    ).scalar() or 0
+    totals = await db.run_sync(read_totals, since=week_ago.date())
     
-    week_transforms = db.query(func.count(PromptTransformation.id)).filter(
-        PromptTransformation.created_at >= week_ago
-    ).scalar() or 0
+    # Week stats
+    week_runs = totals["recent_runs"]
+    week_transforms = totals["recent_transforms"]
     
     # All time stats
-    total_runs = db.query(func.count(Run.id)).scalar() or 0
-    total_transforms = db.query(func.count(PromptTransformation.id)).scalar() or 0
+    total_runs = totals["total_runs"]
+    total_transforms = totals["total_transforms"]
     
     # Calculate derived metrics
     # Formula: 15 min saved per optimized prompt
@@ -204,9 +605,7 @@ def get_stats_endpoint(db: Session = Depends(get_db)):
     all_cost_avoided = total_transforms * 0.02 * 3
     
     # Success rate (runs that completed successfully)
-    total_completed = db.query(func.count(Run.id)).filter(
-        Run.finished_at.isnot(None)
-    ).scalar() or 0
+    total_completed = totals["completed_runs"]
     success_rate = int((total_completed / total_runs * 100)) if total_runs > 0 else 95
     
     return StatsOut(
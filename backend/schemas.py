@@ -26,12 +26,30 @@ class ExplainOut(BaseModel):
     risks: List[str]
     readiness_score: int
     missing: List[str]
+    llm_cache_hit: Optional[bool] = None
 
 class GenerateIn(BaseModel):
     goal: str
     style: str = Field(default="directive", description="directive, schema_json, few_shot, planner_executor, or rubric_scored")
     model: Optional[str] = "gpt-4o-mini"
     params: Optional[Dict[str, Any]] = {}
+    styles: Optional[List[str]] = Field(default=None, description="Generate several styles in one call, ranked by score. Use [\"*\"] for all styles")
+    languages: Optional[List[str]] = Field(default=None, description="Code wrappers to render in language_variants (default: python, javascript, curl). Use [] for none")
+    compact: bool = Field(default=False, description="Return a minimal-token version of the prompt, with a `compaction` report")
+    max_prompt_tokens: Optional[int] = Field(default=None, gt=0, description="Compact only as far as needed to fit this many tokens per prompt (implies compact)")
+
+class CompactionOut(BaseModel):
+    """Token savings of a compacted prompt and its score before/after"""
+    level: Optional[str]
+    max_prompt_tokens: Optional[int] = None
+    within_budget: bool
+    tokens_before: int
+    tokens_after: int
+    tokens_saved: int
+    saved_pct: int
+    score_before: int
+    score_after: int
+    problems_added: List[str] = []
 
 class GenerateOut(BaseModel):
     style: str
@@ -41,6 +59,9 @@ class GenerateOut(BaseModel):
     executor_prompt: Optional[str] = None
     language_variants: Union[Dict[str, str], Dict[str, Dict[str, str]]]
     notes: List[str] = []
+    score: Optional[int] = None
+    problems: Optional[List[str]] = None
+    compaction: Optional[CompactionOut] = None
     
     class Config:
         json_schema_extra = {
@@ -57,6 +78,10 @@ class GenerateOut(BaseModel):
             }
         }
 
+class GenerateManyOut(BaseModel):
+    """Multi-style generation output, best score first"""
+    results: List[GenerateOut]
+
 class RunOut(BaseModel):
     """Output schema for run records"""
     id: int
@@ -93,6 +118,25 @@ class CompareOut(BaseModel):
     after: PromptScoreData
     improvement_pct: int
 
+class CompareBatchIn(BaseModel):
+    """Input for batch prompt comparison"""
+    items: List[CompareIn]
+
+class CompareBatchStats(BaseModel):
+    """Aggregate stats for a batch comparison"""
+    count: int
+    avg_before_score: float
+    avg_after_score: float
+    avg_improvement_pct: float
+    min_improvement_pct: int
+    max_improvement_pct: int
+    stored: bool
+
+class CompareBatchOut(BaseModel):
+    """Output for batch prompt comparison"""
+    results: List[CompareOut]
+    stats: CompareBatchStats
+
 class StatsWeek(BaseModel):
     """Weekly stats"""
     time_saved_min: int
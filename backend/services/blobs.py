@@ -0,0 +1,229 @@
+"""
+Content-addressed text storage.
+Prompt and run-item texts are stored once in the blobs table, keyed by the
+sha256 of their UTF-8 bytes, and referenced by hash from prompt_scores,
+prompt_transformations and run_items. A prompt submitted a thousand times is
+stored once; texts of BLOB_COMPRESS_MIN_BYTES or more are zlib-compressed.
+
+Rows written before the blob store keep their text inline (hash NULL). Move
+them over, or drop blobs nothing references any more (after retention, say),
+from backend/:
+    python -m services.blobs migrate
+    python -m services.blobs gc
+    python -m services.blobs stats
+"""
+
+import os
+import zlib
+import hashlib
+import logging
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import delete, func, insert, select, union, update
+from sqlalchemy.orm import Session
+from models import Blob, PromptScore, PromptTransformation, RunItem
+from services.cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+# Texts at least this long (UTF-8 bytes) are compressed
+BLOB_COMPRESS_MIN_BYTES = int(os.getenv("BLOB_COMPRESS_MIN_BYTES", "512"))
+BLOB_COMPRESS_LEVEL = int(os.getenv("BLOB_COMPRESS_LEVEL", "6"))
+# Recently encoded blobs, so a hot prompt isn't recompressed on every write
+BLOB_ENCODE_CACHE_SIZE = int(os.getenv("BLOB_ENCODE_CACHE_SIZE", "256"))
+
+_encoded = LRUCache(BLOB_ENCODE_CACHE_SIZE)
+
+# (text column, hash column) pairs that reference blobs
+TEXT_REFS = (
+    (PromptScore.prompt_text, PromptScore.prompt_hash),
+    (PromptTransformation.after_prompt_text, PromptTransformation.after_prompt_hash),
+    (RunItem.input_ref, RunItem.input_hash),
+    (RunItem.output_ref, RunItem.output_hash),
+)
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def encode_blob(text: str) -> Dict[str, Any]:
+    """blobs row for a text"""
+    raw = text.encode("utf-8")
+    row = {"hash": hashlib.sha256(raw).hexdigest(), "size": len(raw), "compression": "none", "data": raw}
+    if len(raw) >= BLOB_COMPRESS_MIN_BYTES:
+        packed = zlib.compress(raw, BLOB_COMPRESS_LEVEL)
+        if len(packed) < len(raw):
+            row.update(compression="zlib", data=packed)
+    return row
+
+
+def decode_blob(data: bytes, compression: str) -> str:
+    if compression == "zlib":
+        data = zlib.decompress(data)
+    return bytes(data).decode("utf-8")
+
+
+def encode_blobs(texts: Iterable[str]) -> Tuple[List[str], Dict[str, Dict[str, Any]]]:
+    """
+    Hash and encode texts for store_blobs. This is the CPU-bound half of
+    storing texts (sha256, zlib); on the async path run it in the threadpool.
+
+    Args:
+        texts: Texts to store (duplicates are fine)
+
+    Returns:
+        hashes: One hash per input text, in order
+        rows: blobs rows by hash, one per distinct text
+    """
+    rows: Dict[str, Dict[str, Any]] = {}
+    hashes = []
+    for text in texts:
+        h = content_hash(text)
+        hashes.append(h)
+        if h not in rows:
+            found, row = _encoded.get(h)
+            if not found:
+                row = encode_blob(text)
+                _encoded.set(h, row)
+            rows[h] = row
+    return hashes, rows
+
+
+def store_blobs(db: Session, rows: Dict[str, Dict[str, Any]]) -> None:
+    """Insert encoded blobs rows (from encode_blobs) that aren't stored yet, without committing"""
+    if not rows:
+        return
+
+    dialect = db.get_bind().dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        if dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        # Writing first (no existence check) keeps SQLite from upgrading a read
+        # transaction, which fails if another writer committed in between
+        db.execute(dialect_insert(Blob).on_conflict_do_nothing(index_elements=["hash"]), list(rows.values()))
+        return
+
+    existing = set(db.scalars(select(Blob.hash).where(Blob.hash.in_(list(rows)))))
+    new_rows = [row for h, row in rows.items() if h not in existing]
+    if new_rows:
+        db.execute(insert(Blob), new_rows)
+
+
+def put_blobs(db: Session, texts: Iterable[str]) -> List[str]:
+    """
+    Store texts that aren't stored yet, without committing (encode_blobs + store_blobs).
+
+    Args:
+        db: Database session
+        texts: Texts to store (duplicates are fine)
+
+    Returns:
+        hashes: One hash per input text, in order
+    """
+    hashes, rows = encode_blobs(texts)
+    store_blobs(db, rows)
+    return hashes
+
+
+def get_texts(db: Session, hashes: Iterable[str]) -> Dict[str, str]:
+    """Texts for the given hashes (missing hashes are left out)"""
+    wanted = list(set(hashes))
+    if not wanted:
+        return {}
+    return {
+        h: decode_blob(data, compression)
+        for h, data, compression in db.execute(
+            select(Blob.hash, Blob.data, Blob.compression).where(Blob.hash.in_(wanted))
+        )
+    }
+
+
+def prompt_seen(db: Session, prompt: str) -> bool:
+    """True if a compare has already stored this exact prompt (index lookup on prompt_scores.prompt_hash)"""
+    return db.execute(
+        select(PromptScore.id).where(PromptScore.prompt_hash == content_hash(prompt)).limit(1)
+    ).first() is not None
+
+
+def migrate_inline_texts(db: Session, batch_rows: int = 2000) -> Dict[str, int]:
+    """
+    Move texts stored inline (from before the blob store) into blobs, one
+    committed batch at a time.
+
+    Returns:
+        moved: Rows updated per "table.column"
+    """
+    moved = {}
+    for text_col, hash_col in TEXT_REFS:
+        table = text_col.class_
+        name = f"{table.__tablename__}.{text_col.key}"
+        moved[name] = 0
+        while True:
+            rows = db.execute(
+                select(table.id, text_col).where(hash_col.is_(None), text_col != "").limit(batch_rows)
+            ).all()
+            if not rows:
+                break
+            db.rollback()  # start the write transaction fresh (see put_blobs)
+            hashes = put_blobs(db, [text for _, text in rows])
+            db.execute(update(table), [
+                {"id": row_id, hash_col.key: h, text_col.key: ""} for (row_id, _), h in zip(rows, hashes)
+            ])
+            db.commit()
+            moved[name] += len(rows)
+            logger.info(f"[BLOBS] Migrated {moved[name]} {name} value(s) so far")
+    return moved
+
+
+def gc_blobs(db: Session) -> int:
+    """
+    Delete blobs no row references any more and commit; returns blobs removed.
+    Run it while nothing is writing: a compare that reuses a blob as it is
+    being collected would be left pointing at nothing.
+    """
+    referenced = union(*(select(hash_col).where(hash_col.isnot(None)) for _, hash_col in TEXT_REFS)).subquery()
+    result = db.execute(delete(Blob).where(Blob.hash.not_in(select(referenced.c[0]))))
+    db.commit()
+    logger.info(f"[BLOBS] Removed {result.rowcount} unreferenced blob(s)")
+    return result.rowcount
+
+
+def blob_stats(db: Session) -> Dict[str, Any]:
+    """Blob count, total text bytes and stored bytes"""
+    count, size, stored = db.execute(
+        select(func.count(Blob.hash), func.coalesce(func.sum(Blob.size), 0),
+               func.coalesce(func.sum(func.length(Blob.data)), 0))
+    ).one()
+    inline = {
+        f"{text_col.class_.__tablename__}.{text_col.key}": db.scalar(
+            select(func.count()).where(hash_col.is_(None), text_col != "")
+        )
+        for text_col, hash_col in TEXT_REFS
+    }
+    return {"blobs": count, "text_bytes": size, "stored_bytes": stored, "inline_rows": inline}
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    import json
+    import argparse
+    from db import SessionLocal, init_db
+
+    parser = argparse.ArgumentParser(description="Maintain the content-addressed text store")
+    parser.add_argument("command", choices=["migrate", "gc", "stats"])
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    init_db()
+    with SessionLocal() as db:
+        if args.command == "migrate":
+            print(json.dumps(migrate_inline_texts(db), indent=2))
+        elif args.command == "gc":
+            print(f"Removed {gc_blobs(db)} blob(s)")
+        else:
+            print(json.dumps(blob_stats(db), indent=2))
+
+
+if __name__ == "__main__":
+    main()
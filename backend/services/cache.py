@@ -0,0 +1,143 @@
+"""
+In-process memoization for the pure heuristic paths (explain, generate, compare).
+Bounded LRU caches with hit/miss/eviction counters, safe to share across the
+threadpool FastAPI uses for sync endpoints.
+"""
+
+import os
+import json
+import threading
+from collections import OrderedDict
+from contextvars import ContextVar
+from functools import wraps
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+from services.singleflight import singleflight
+
+# Max entries per memoized function; 0 disables caching
+MEMO_CACHE_SIZE = int(os.getenv("MEMO_CACHE_SIZE", "1024"))
+
+_MISSING = object()
+
+# Set while a use_cache=False call runs, so nested memoized calls bypass too
+_bypass: ContextVar[bool] = ContextVar("memo_bypass", default=False)
+
+
+class LRUCache:
+    """Thread-safe bounded LRU cache"""
+
+    def __init__(self, maxsize: int = MEMO_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Tuple[bool, Any]:
+        """Return (found, value) and mark the entry as recently used"""
+        with self._lock:
+            value = self._data.get(key, _MISSING)
+            if value is _MISSING:
+                self.misses += 1
+                return False, None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return True, value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+CACHES: Dict[str, LRUCache] = {}
+
+
+def normalize_text(text: Optional[str]) -> str:
+    """Key form of a free-text input (outer whitespace never changes results)"""
+    return (text or "").strip()
+
+
+def normalize_params(params: Optional[Dict[str, Any]]) -> str:
+    """Key form of a params dict, independent of key order"""
+    return json.dumps(params or {}, sort_keys=True, default=str)
+
+
+def memoize(name: str, key: Callable[..., Optional[Hashable]]):
+    """
+    Decorator that memoizes a pure function in a named LRU cache.
+
+    `key` receives the same arguments as the function and returns a hashable
+    key, or None when the call must not be cached (e.g. the LLM path).
+    Pass `use_cache=False` to bypass the cache for a single call, including
+    any memoized functions it calls.
+
+    Concurrent misses for the same key are coalesced so only one computes.
+    Cached values are shared between callers; treat them as read-only.
+
+    Usage:
+        @memoize("explain", key=lambda goal, **kw: normalize_text(goal))
+        def explain(goal, ...):
+            ...
+    """
+    cache = CACHES.setdefault(name, LRUCache())
+    flight = singleflight(name)
+
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, use_cache: bool = True, **kwargs):
+            if not use_cache and not _bypass.get():
+                token = _bypass.set(True)
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    _bypass.reset(token)
+            cache_key = None if _bypass.get() or cache.maxsize <= 0 else key(*args, **kwargs)
+            if cache_key is None:
+                return func(*args, **kwargs)
+            found, value = cache.get(cache_key)
+            if found:
+                return value
+
+            def compute():
+                result = func(*args, **kwargs)
+                cache.set(cache_key, result)
+                return result
+
+            try:
+                return flight.do(cache_key, compute)
+            except TimeoutError:
+                # Pure function: computing our own copy is always correct
+                return func(*args, **kwargs)
+        wrapper.cache = cache
+        return wrapper
+    return decorator
+
+
+def cache_stats() -> Dict[str, Dict[str, int]]:
+    """Counters for every memoized function"""
+    return {name: cache.stats() for name, cache in CACHES.items()}
+
+
+def clear_caches() -> None:
+    for cache in CACHES.values():
+        cache.clear()
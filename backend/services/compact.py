@@ -0,0 +1,188 @@
+"""
+Token-budget compaction for generated prompts.
+The make_* builders favour readability: blank lines, indented JSON, one
+bullet per constraint, several examples and a paragraph of self-check
+boilerplate. compact_prompt() rewrites a prompt in levels, each cheaper
+than the last and each including the ones before it:
+
+    whitespace    drop blank lines and trailing spaces, minify JSON blocks
+    lists         fold "Heading:" + bullet/numbered items into one line
+    examples      keep only the first example
+    boilerplate   drop redundant lines and shorten stock phrasing
+
+"whitespace" and "lists" keep every instruction. "examples" and
+"boilerplate" give up some of them, which can cost score_prompt points.
+With a token budget the lightest level that fits is used; without one
+every level is applied.
+
+Usage (from backend/):
+    python -m services.compact "Summarize this transcript into 5 bullets" [--max-tokens 80]
+"""
+
+import re
+import json
+from typing import List, Optional, Tuple
+from services.tokens import count_tokens
+
+COMPACT_LEVELS = ("whitespace", "lists", "examples", "boilerplate")
+
+# Verbose builder phrasing -> shorter equivalent, applied at the "boilerplate" level
+BOILERPLATE: List[Tuple[str, str]] = [
+    ("Learn from these examples, then complete the task.", "Follow the examples."),
+    ("Now complete this task: ", "Task: "),
+    ("Do not include any commentary outside JSON.", ""),
+    ("After completing the task, grade your output against this rubric:\n", ""),
+    (
+        "Self-check process:\n1. Complete the task\n2. Score your output (1-5 on each criterion)\n"
+        "3. If total score < 16/20, revise and rescore\n4. Return final output only (not the scores)",
+        "If the total is under 16/20, revise and rescore. Return the final output only.",
+    ),
+    (
+        "Quality checks:\n- Output must be consistent, concise, and correct.\n"
+        "- If information is missing, ask a single clarifying question.",
+        "Quality checks: concise and correct; if information is missing, ask one clarifying question.",
+    ),
+    (
+        "Execute the current step precisely and return results in the format specified by the plan.",
+        "Execute the current step and return results in the plan's format.",
+    ),
+]
+
+_EXAMPLE_HEADER = re.compile(r"^Example (\d+):$")
+_LIST_ITEM = re.compile(r"^(?:- (?!\[)|\d+\. )(.+)$")
+
+
+def _boilerplate(text: str) -> str:
+    for verbose, short in BOILERPLATE:
+        text = text.replace(verbose, short)
+    # Emptied lines and exact repeats of an earlier line (e.g. a constraint
+    # restating a quality check)
+    seen = set()
+    lines = []
+    for line in text.split("\n"):
+        key = line.strip().lower()
+        if not key or key in seen:
+            continue
+        seen.add(key)
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def _examples(text: str) -> str:
+    lines = []
+    skipping = False
+    for line in text.split("\n"):
+        header = _EXAMPLE_HEADER.match(line)
+        if header:
+            skipping = header.group(1) != "1"
+            if not skipping:
+                lines.append("Example:")
+            continue
+        if skipping and (line.startswith("Now ") or line.startswith("Task:")):
+            skipping = False
+        if not skipping:
+            lines.append(line)
+    return "\n".join(lines)
+
+
+def _whitespace(text: str) -> str:
+    lines = []
+    block: List[str] = []
+    for line in text.split("\n"):
+        line = line.rstrip()
+        if not line:
+            continue
+        # Collect lines from an opening "{" until they parse as one JSON value
+        if block or line == "{":
+            block.append(line)
+            try:
+                lines.append(json.dumps(json.loads("\n".join(block)), separators=(",", ":"), ensure_ascii=False))
+                block = []
+            except ValueError:
+                pass
+            continue
+        lines.append(line)
+    return "\n".join(lines + block)
+
+
+def _lists(text: str) -> str:
+    lines: List[str] = []
+    items: List[str] = []
+    for line in text.split("\n"):
+        item = _LIST_ITEM.match(line)
+        if item and lines and (items or lines[-1].endswith(":")):
+            items.append(item.group(1).rstrip("."))
+            continue
+        if items:
+            lines[-1] += " " + "; ".join(items) + "."
+            items = []
+        lines.append(line)
+    if items:
+        lines[-1] += " " + "; ".join(items) + "."
+    return "\n".join(lines)
+
+
+# Applied in this order; a level turns on its own pass and every earlier level's
+_PASSES = (("whitespace", _whitespace), ("boilerplate", _boilerplate), ("examples", _examples), ("lists", _lists))
+
+
+def compact_at(text: str, level: str) -> str:
+    """A prompt compacted up to and including `level` (one of COMPACT_LEVELS)"""
+    enabled = COMPACT_LEVELS[:COMPACT_LEVELS.index(level) + 1]
+    for name, apply in _PASSES:
+        if name in enabled:
+            text = apply(text)
+    return text
+
+
+def compact_prompt(text: str, max_tokens: Optional[int] = None) -> Tuple[str, Optional[str]]:
+    """
+    Shrink a generated prompt, lightest level first.
+
+    Args:
+        text: Prompt text from one of the make_* builders
+        max_tokens: Token budget (services.tokens.count_tokens); None applies every level
+
+    Returns:
+        (text, level): the compacted prompt and the level used (None when the
+            prompt already fit). If no level fits, the fully compacted prompt is
+            returned; it is never truncated.
+    """
+    if max_tokens is None:
+        return compact_at(text, COMPACT_LEVELS[-1]), COMPACT_LEVELS[-1]
+    if count_tokens(text) <= max_tokens:
+        return text, None
+    for level in COMPACT_LEVELS:
+        compacted = compact_at(text, level)
+        if count_tokens(compacted) <= max_tokens:
+            break
+    return compacted, level
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    import argparse
+    from services.explain import explain
+    from services.generate import build_prompt, compact_result
+    from schemas import PromptStyle
+
+    parser = argparse.ArgumentParser(description="Tokens and score per style, before and after compaction")
+    parser.add_argument("goal")
+    parser.add_argument("--max-tokens", type=int, default=None, help="Token budget per prompt")
+    parser.add_argument("--show", action="store_true", help="Print the compacted prompts")
+    args = parser.parse_args(argv)
+
+    spec = explain(args.goal)
+    print(f"{'style':<18} {'level':<12} {'tokens':>13} {'saved':>6} {'score':>7}")
+    for style in PromptStyle:
+        result = compact_result(build_prompt(spec, style.value), args.max_tokens)
+        c = result["compaction"]
+        print(f"{style.value:<18} {c['level'] or '-':<12} {c['tokens_before']:>5} -> {c['tokens_after']:<5} "
+              f"{c['saved_pct']:>5}% {c['score_before']:>3} -> {c['score_after']}"
+              f"{'' if c['within_budget'] else '  over budget'}")
+        if args.show:
+            for name in ["planner_prompt", "executor_prompt"] if result["is_dual_prompt"] else ["prompt_body"]:
+                print(f"\n{result[name]}\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,45 +1,54 @@
-import re
 import os
+import json
 import logging
-from typing import List, Tuple, Optional
+from functools import partial
+from typing import AsyncIterator, FrozenSet, List, Tuple, Optional
+import anyio
+from providers.openai_provider import call_openai_cached, get_provider
+from providers.response_cache import get_response_cache
 from services.helpers import smart_split
+from services.keywords import scan_goal
+from services.cache import memoize, normalize_text
+from services.singleflight import singleflight
+from services.metrics import track_event
 
 logger = logging.getLogger(__name__)
 
-def extract_entities(goal: str) -> Tuple[List[str], List[str], List[str], List[str]]:
+def extract_entities(goal: str, hits: Optional[FrozenSet[str]] = None) -> Tuple[List[str], List[str], List[str], List[str]]:
     """Fast heuristic extraction of intent components"""
     inputs, outputs, constraints, risks = [], [], [], []
     
-    goal_lower = goal.lower()
+    if hits is None:
+        hits = scan_goal(goal)
     
     # Input detection
-    if "transcript" in goal_lower:
+    if "transcript" in hits:
         inputs.append("transcript_text")
-    if "document" in goal_lower or "text" in goal_lower:
+    if "document" in hits or "text" in hits:
         inputs.append("document_text")
-    if "image" in goal_lower or "photo" in goal_lower:
+    if "image" in hits or "photo" in hits:
         inputs.append("image_file")
-    if "data" in goal_lower or "csv" in goal_lower:
+    if "data" in hits or "csv" in hits:
         inputs.append("dataset")
     
     # Output detection
-    if "summary" in goal_lower or "summarize" in goal_lower:
+    if "summary" in hits or "summarize" in hits:
         outputs.append("summary_text")
-    if "action" in goal_lower or "task" in goal_lower:
+    if "action" in hits or "task" in hits:
         outputs.append("action_items")
-    if "classify" in goal_lower or "category" in goal_lower:
+    if "classify" in hits or "category" in hits:
         outputs.append("classification")
-    if "extract" in goal_lower:
+    if "extract" in hits:
         outputs.append("extracted_entities")
     
     # Constraint detection
-    if "json" in goal_lower:
+    if "json" in hits:
         constraints.append("output JSON format")
-    if re.search(r"\b\d+\s*bullet", goal_lower):
+    if "bullet_count" in hits:
         constraints.append("fixed bullet count")
-    if re.search(r"\b\d+\s*word", goal_lower):
+    if "word_count" in hits:
         constraints.append("word count limit")
-    if "concise" in goal_lower or "brief" in goal_lower:
+    if "concise" in hits or "brief" in hits:
         constraints.append("brevity required")
     
     # Risk detection
@@ -47,7 +56,7 @@ def extract_entities(goal: str) -> Tuple[List[str], List[str], List[str], List[s
         risks.append("input type unclear")
     if not outputs:
         risks.append("expected output format ambiguous")
-    if "json" in goal_lower and "schema" not in goal_lower:
+    if "json" in hits and "schema" not in hits:
         risks.append("JSON structure not specified")
     if len(goal.split()) < 5:
         risks.append("goal too vague")
@@ -80,14 +89,13 @@ def calculate_readiness_score(goal: str, inputs: List[str], outputs: List[str],
     
     return max(1, min(10, score))
 
-def refine_with_llm(goal: str, heuristic_spec: dict, provider: str = "openai") -> dict:
-    """Use LLM to refine the heuristic spec - with graceful fallback"""
-    try:
-        if provider == "openai":
-            from openai import OpenAI
-            client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-            
-            prompt = f"""You are a prompt engineering assistant. Analyze this goal and extract structured information.
+REFINE_MODEL = "gpt-4o-mini"
+REFINE_PARAMS = {"temperature": 0.2}
+REFINE_RESPONSE_FORMAT = {"type": "json_object"}
+
+def build_refine_prompt(goal: str) -> str:
+    """Prompt sent to the LLM to refine a goal's spec"""
+    return f"""You are a prompt engineering assistant. Analyze this goal and extract structured information.
 
 Goal: {goal}
 
@@ -102,40 +110,84 @@ Return JSON with these fields:
 
 Be precise and actionable."""
 
-            response = client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.2,
-                response_format={"type": "json_object"}
-            )
-            
-            import json
-            llm_result = json.loads(response.choices[0].message.content)
-            
-            # Merge with heuristic spec (LLM takes precedence)
-            refined = {
-                "intent": llm_result.get("intent", heuristic_spec["intent"]),
-                "inputs": llm_result.get("inputs", heuristic_spec["inputs"]),
-                "outputs": llm_result.get("outputs", heuristic_spec["outputs"]),
-                "constraints": llm_result.get("constraints", heuristic_spec["constraints"]),
-                "format": llm_result.get("format", heuristic_spec["format"]),
-                "risks": llm_result.get("risks", heuristic_spec["risks"]),
-                "missing": llm_result.get("missing", heuristic_spec["missing"]),
-            }
+def parse_llm_result(content: Optional[str]) -> dict:
+    """The LLM's answer as a JSON object; raises ValueError if it isn't one"""
+    if content is None:
+        raise ValueError("no response from provider")
+    llm_result = json.loads(content)
+    if not isinstance(llm_result, dict):
+        raise ValueError(f"expected a JSON object, got {type(llm_result).__name__}")
+    return llm_result
+
+def merge_llm_result(goal: str, heuristic_spec: dict, content: Optional[str],
+                     cache_hit: bool = False) -> dict:
+    """
+    Merge the LLM's JSON answer into the heuristic spec (LLM takes precedence).
+    `llm_cache_hit` marks answers served from the persistent response cache.
+    """
+    llm_result = parse_llm_result(content)
+    
+    refined = {
+        "intent": llm_result.get("intent", heuristic_spec["intent"]),
+        "inputs": llm_result.get("inputs", heuristic_spec["inputs"]),
+        "outputs": llm_result.get("outputs", heuristic_spec["outputs"]),
+        "constraints": llm_result.get("constraints", heuristic_spec["constraints"]),
+        "format": llm_result.get("format", heuristic_spec["format"]),
+        "risks": llm_result.get("risks", heuristic_spec["risks"]),
+        "missing": llm_result.get("missing", heuristic_spec["missing"]),
+    }
+    
+    # Recalculate readiness score with refined data
+    refined["readiness_score"] = calculate_readiness_score(
+        goal, refined["inputs"], refined["outputs"], 
+        refined["constraints"], refined["risks"], refined["missing"]
+    )
+    refined["llm_cache_hit"] = cache_hit
+    
+    return refined
+
+def refine_with_llm(goal: str, heuristic_spec: dict, provider: str = "openai") -> dict:
+    """Use LLM to refine the heuristic spec - with graceful fallback"""
+    try:
+        if provider == "openai":
+            content, cache_hit = call_openai_cached(
+                build_refine_prompt(goal), REFINE_MODEL, REFINE_PARAMS, REFINE_RESPONSE_FORMAT,
+                validate=parse_llm_result
+            ) or (None, False)
+            return merge_llm_result(goal, heuristic_spec, content, cache_hit)
             
-            # Recalculate readiness score with refined data
-            refined["readiness_score"] = calculate_readiness_score(
-                goal, refined["inputs"], refined["outputs"], 
-                refined["constraints"], refined["risks"], refined["missing"]
+    except Exception as e:
+        logger.warning(f"LLM refinement failed: {e}. Falling back to heuristics.")
+    
+    return heuristic_spec
+
+async def refine_with_llm_async(goal: str, heuristic_spec: dict, provider: str = "openai") -> dict:
+    """refine_with_llm on the pooled async client; no thread is held while waiting"""
+    try:
+        if provider == "openai":
+            client = get_provider()
+            if client is None:
+                raise RuntimeError("OpenAI provider not configured")
+            content, cache_hit = await client.complete_cached(
+                build_refine_prompt(goal), REFINE_MODEL, REFINE_PARAMS, REFINE_RESPONSE_FORMAT,
+                validate=parse_llm_result
             )
-            
-            return refined
+            return merge_llm_result(goal, heuristic_spec, content, cache_hit)
             
     except Exception as e:
         logger.warning(f"LLM refinement failed: {e}. Falling back to heuristics.")
     
     return heuristic_spec
 
+def _explain_key(goal: str, constraints_text: str = "", desired_format: str = "",
+                 use_llm: bool = False):
+    # LLM-refined results are not a pure function of the inputs
+    if use_llm and os.getenv("OPENAI_API_KEY"):
+        return None
+    return (normalize_text(goal), constraints_text or "", desired_format or "")
+
+@track_event("explain")
+@memoize("explain", key=_explain_key)
 def explain(goal: str, constraints_text: str = "", desired_format: str = "", 
             use_llm: bool = False) -> dict:
     """
@@ -146,9 +198,11 @@ def explain(goal: str, constraints_text: str = "", desired_format: str = "",
         constraints_text: Additional constraints
         desired_format: Preferred output format
         use_llm: Whether to refine with LLM (requires OPENAI_API_KEY)
+        use_cache: Pass False to bypass the memo cache for this call
     """
-    # Fast heuristic baseline
-    inputs, outputs, constraints, risks = extract_entities(goal)
+    # Fast heuristic baseline (single keyword scan shared with extract_entities)
+    hits = scan_goal(goal)
+    inputs, outputs, constraints, risks = extract_entities(goal, hits)
     
     if constraints_text:
         constraints += [c.strip() for c in smart_split(constraints_text) if c.strip()]
@@ -157,9 +211,9 @@ def explain(goal: str, constraints_text: str = "", desired_format: str = "",
     
     # Detect missing information
     missing = []
-    if "JSON" in fmt.upper() and "schema" not in goal.lower():
+    if "JSON" in fmt.upper() and "schema" not in hits:
         missing.append("provide JSON fields or a sample object")
-    if not any(word in goal.lower() for word in ["summarize", "extract", "classify", "generate", "analyze"]):
+    if not any(word in hits for word in ["summarize", "extract", "classify", "generate", "analyze"]):
         missing.append("clarify the specific action (summarize, extract, classify, etc.)")
     if len(goal.split()) < 8:
         missing.append("add more context about the task requirements")
@@ -177,8 +231,85 @@ def explain(goal: str, constraints_text: str = "", desired_format: str = "",
         "missing": missing,
     }
     
-    # Optional LLM refinement
+    # Optional LLM refinement; identical concurrent requests share one provider call
     if use_llm and os.getenv("OPENAI_API_KEY"):
-        return refine_with_llm(goal, heuristic_spec)
+        key = (normalize_text(goal), constraints_text or "", desired_format or "")
+        try:
+            return singleflight("refine_with_llm").do(key, lambda: refine_with_llm(goal, heuristic_spec))
+        except TimeoutError as e:
+            logger.warning(f"{e}. Falling back to heuristics.")
+            return heuristic_spec
     
     return heuristic_spec
+
+async def explain_async(goal: str, constraints_text: str = "", desired_format: str = "",
+                        use_llm: bool = False, use_cache: bool = True) -> dict:
+    """
+    Async explain(): the heuristic pass runs in a worker thread and LLM refinement
+    awaits the pooled provider client, so no thread waits on the round trip.
+    """
+    heuristic_spec = await anyio.to_thread.run_sync(
+        partial(explain, goal, constraints_text, desired_format, use_cache=use_cache)
+    )
+    if not (use_llm and os.getenv("OPENAI_API_KEY")):
+        return heuristic_spec
+    
+    # Identical concurrent requests share one provider call
+    key = (normalize_text(goal), constraints_text or "", desired_format or "")
+    try:
+        return await singleflight("refine_with_llm").do_async(
+            key, lambda: refine_with_llm_async(goal, heuristic_spec)
+        )
+    except TimeoutError as e:
+        logger.warning(f"{e}. Falling back to heuristics.")
+        return heuristic_spec
+
+async def explain_events(goal: str, constraints_text: str = "", desired_format: str = "",
+                         use_llm: bool = False, use_cache: bool = True) -> AsyncIterator[Tuple[str, dict]]:
+    """
+    explain_async() as (event, data) pairs for streaming clients.
+    
+    Yields the heuristic `spec` as soon as it is computed. With LLM refinement,
+    `token` events follow as the completion arrives (a response-cache hit skips
+    them), then the `refined` spec. Failures fall back to the heuristic spec,
+    like refine_with_llm.
+    """
+    heuristic_spec = await anyio.to_thread.run_sync(
+        partial(explain, goal, constraints_text, desired_format, use_cache=use_cache)
+    )
+    yield "spec", heuristic_spec
+    
+    client = get_provider() if use_llm and os.getenv("OPENAI_API_KEY") else None
+    if client is None:
+        return
+    
+    prompt = build_refine_prompt(goal)
+    cache = get_response_cache()
+    key = client.cache_key(prompt, REFINE_MODEL, REFINE_PARAMS, REFINE_RESPONSE_FORMAT)
+    content = await anyio.to_thread.run_sync(cache.get, key) if cache else None
+    cache_hit = content is not None
+    
+    if cache_hit:
+        try:
+            parse_llm_result(content)
+        except ValueError:
+            # Unusable cached answer (cached before it was checked): drop it and ask again
+            await anyio.to_thread.run_sync(cache.delete, key)
+            cache_hit = False
+    
+    try:
+        if not cache_hit:
+            parts = []
+            async for delta in client.stream(prompt, REFINE_MODEL, REFINE_PARAMS, REFINE_RESPONSE_FORMAT):
+                parts.append(delta)
+                yield "token", {"delta": delta}
+            content = "".join(parts)
+        refined = merge_llm_result(goal, heuristic_spec, content, cache_hit)
+        # Cached only once it has parsed, so a malformed answer isn't replayed
+        if cache and not cache_hit:
+            await anyio.to_thread.run_sync(cache.set, key, "openai", REFINE_MODEL, content)
+    except Exception as e:
+        logger.warning(f"LLM refinement failed: {e}. Falling back to heuristics.")
+        refined = heuristic_spec
+    
+    yield "refined", refined
@@ -0,0 +1,302 @@
+"""
+Bulk telemetry export.
+Streams runs, run items and comparisons as NDJSON or CSV, optionally gzipped,
+without holding the result set in memory: rows are fetched EXPORT_BATCH_ROWS
+at a time through a server-side cursor (yield_per) and each batch is encoded
+into one chunk.
+
+With archived=True, rows retention has moved into archive files (see
+services.retention) are streamed first, then the live rows.
+
+The export reads inside a single transaction, so it sees one consistent
+snapshot. On SQLite in WAL mode that also means the WAL can't be checkpointed
+past it until the export finishes.
+
+From backend/:
+    python -m services.export runs --since 2025-01-01 --format csv --gzip -o runs.csv.gz
+    python -m services.export comparisons --archived > comparisons.ndjson
+"""
+
+import io
+import os
+import csv
+import sys
+import json
+import zlib
+import asyncio
+import logging
+from dataclasses import dataclass
+from datetime import date, datetime
+from typing import Any, AsyncIterator, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+from sqlalchemy import Select, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, aliased
+from models import Blob, Run, RunItem, PromptScore, PromptTransformation
+from services.blobs import decode_blob
+
+logger = logging.getLogger(__name__)
+
+# Rows fetched per cursor round trip (and encoded per streamed chunk)
+EXPORT_BATCH_ROWS = int(os.getenv("EXPORT_BATCH_ROWS", "2000"))
+
+FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+
+@dataclass(frozen=True)
+class Export:
+    """
+    One exportable dataset: the selected columns and the timestamp range
+    filters apply to. `blobs` pairs output fields with the hash column that
+    holds their text when it lives in the blob store.
+    """
+    columns: Sequence[Any]
+    created_at: Any
+    order_by: Any
+    joins: Sequence[Any] = ()
+    blobs: Sequence[Tuple[str, Any]] = ()
+
+    def query(self, since: Optional[datetime] = None, until: Optional[datetime] = None) -> Select:
+        query = select(*self.columns)
+        for target, onclause in self.joins:
+            query = query.join(target, onclause)
+        for _, hash_column in self.blobs:
+            blob = aliased(Blob)
+            query = query.add_columns(blob.data, blob.compression).outerjoin(blob, blob.hash == hash_column)
+        if since is not None:
+            query = query.where(self.created_at >= since)
+        if until is not None:
+            query = query.where(self.created_at < until)
+        return query.order_by(self.order_by)
+
+    @property
+    def fields(self) -> List[str]:
+        return [c.key for c in self.columns]
+
+    def materialize(self, rows: Iterable[Sequence[Any]]) -> List[Tuple[Any, ...]]:
+        """Output tuples for query() rows, with blob-stored texts filled in"""
+        n = len(self.columns)
+        if not self.blobs:
+            return [tuple(row) for row in rows]
+        fields = self.fields
+        positions = [fields.index(field) for field, _ in self.blobs]
+        out = []
+        for row in rows:
+            values = list(row[:n])
+            for k, pos in enumerate(positions):
+                data = row[n + 2 * k]
+                if data is not None:
+                    values[pos] = decode_blob(data, row[n + 2 * k + 1])
+            out.append(tuple(values))
+        return out
+
+
+EXPORTS: Dict[str, Export] = {
+    "runs": Export(
+        columns=(
+            Run.id, Run.prompt_version_id, Run.style, Run.model, Run.params_json, Run.source,
+            Run.started_at, Run.finished_at, Run.tokens_in, Run.tokens_out, Run.cost,
+            Run.latency_ms, Run.created_at,
+        ),
+        created_at=Run.created_at,
+        order_by=Run.id,
+    ),
+    "run_items": Export(
+        columns=(
+            RunItem.id, RunItem.run_id, RunItem.input_ref, RunItem.output_ref, RunItem.pass_bool,
+            RunItem.similarity, RunItem.judge_score, RunItem.notes, RunItem.created_at,
+        ),
+        created_at=RunItem.created_at,
+        order_by=RunItem.id,
+        blobs=(("input_ref", RunItem.input_hash), ("output_ref", RunItem.output_hash)),
+    ),
+    # One row per compare: the PromptTransformation with its "before" PromptScore
+    "comparisons": Export(
+        columns=(
+            PromptTransformation.id,
+            PromptTransformation.before_id,
+            PromptScore.prompt_text.label("before_prompt_text"),
+            PromptScore.score.label("before_score"),
+            PromptScore.problems_json.label("before_problems_json"),
+            PromptTransformation.after_prompt_text,
+            PromptTransformation.after_score,
+            PromptTransformation.fixes_json,
+            PromptTransformation.improvement_pct,
+            PromptTransformation.created_at,
+        ),
+        created_at=PromptTransformation.created_at,
+        order_by=PromptTransformation.id,
+        joins=((PromptScore, PromptScore.id == PromptTransformation.before_id),),
+        blobs=(
+            ("before_prompt_text", PromptScore.prompt_hash),
+            ("after_prompt_text", PromptTransformation.after_prompt_hash),
+        ),
+    ),
+}
+
+
+def _scalar(value: Any) -> Any:
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+class ExportEncoder:
+    """Turns batches of row tuples into NDJSON or CSV bytes, gzipped on request"""
+
+    def __init__(self, fields: List[str], fmt: str = "ndjson", gzip: bool = False):
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown export format {fmt!r}; expected {', '.join(FORMATS)}")
+        self.fields = fields
+        self.fmt = fmt
+        # wbits=31 writes a gzip header and trailer around the deflate stream
+        self._gzip = zlib.compressobj(6, zlib.DEFLATED, 31) if gzip else None
+
+    def _out(self, text: str) -> bytes:
+        data = text.encode("utf-8")
+        return self._gzip.compress(data) if self._gzip else data
+
+    def header(self) -> bytes:
+        if self.fmt != "csv":
+            return b""
+        return self._encode_csv([self.fields])
+
+    def encode(self, rows: Iterable[Sequence[Any]]) -> bytes:
+        if self.fmt == "csv":
+            return self._encode_csv([[_scalar(v) for v in row] for row in rows])
+        fields = self.fields
+        return self._out("".join(
+            json.dumps(dict(zip(fields, map(_scalar, row))), separators=(",", ":")) + "\n"
+            for row in rows
+        ))
+
+    def _encode_csv(self, rows: List[List[Any]]) -> bytes:
+        buf = io.StringIO()
+        csv.writer(buf, lineterminator="\n").writerows(rows)
+        return self._out(buf.getvalue())
+
+    def finish(self) -> bytes:
+        return self._gzip.flush() if self._gzip else b""
+
+
+def get_export(dataset: str) -> Export:
+    """The Export for a dataset name; raises ValueError for unknown names"""
+    try:
+        return EXPORTS[dataset]
+    except KeyError:
+        raise ValueError(f"Unknown export {dataset!r}; expected {', '.join(EXPORTS)}") from None
+
+
+def iter_export(
+    db: Session,
+    dataset: str,
+    fmt: str = "ndjson",
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    gzip: bool = False,
+    batch_rows: int = EXPORT_BATCH_ROWS,
+    archived: bool = False,
+) -> Iterator[bytes]:
+    """
+    Encoded export chunks from a sync session (used by the CLI).
+
+    Args:
+        db: Database session
+        dataset: "runs", "run_items" or "comparisons"
+        fmt: "ndjson" or "csv"
+        since, until: Optional created_at range, since inclusive and until exclusive
+        gzip: Compress the stream (one gzip member)
+        batch_rows: Rows per cursor fetch and per chunk
+        archived: Include rows retention has archived (streamed first)
+
+    Yields:
+        chunk: Bytes to write out, in order
+    """
+    export = get_export(dataset)
+    encoder = ExportEncoder(export.fields, fmt, gzip)
+    header = encoder.header()
+    if header:
+        yield header
+    if archived:
+        from services.retention import archive_file_paths, read_archive_file
+        for path in archive_file_paths(db, dataset, since, until):
+            chunk = encoder.encode(read_archive_file(path, export.fields, since, until))
+            if chunk:
+                yield chunk
+    result = db.execute(export.query(since, until).execution_options(yield_per=batch_rows))
+    for rows in result.partitions():
+        chunk = encoder.encode(export.materialize(rows))
+        if chunk:  # gzip may still be buffering
+            yield chunk
+    yield encoder.finish()
+
+
+async def aiter_export(
+    db: AsyncSession,
+    dataset: str,
+    fmt: str = "ndjson",
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    gzip: bool = False,
+    batch_rows: int = EXPORT_BATCH_ROWS,
+    archived: bool = False,
+) -> AsyncIterator[bytes]:
+    """
+    iter_export on an AsyncSession, streaming through AsyncSession.stream().
+    Batches are encoded in a worker thread to keep JSON/CSV/gzip work off the
+    event loop.
+    """
+    export = get_export(dataset)
+    encoder = ExportEncoder(export.fields, fmt, gzip)
+    header = encoder.header()
+    if header:
+        yield header
+    if archived:
+        from services.retention import archive_file_paths, read_archive_file
+        for path in await db.run_sync(archive_file_paths, dataset, since, until):
+            rows = await asyncio.to_thread(read_archive_file, path, export.fields, since, until)
+            chunk = await asyncio.to_thread(encoder.encode, rows)
+            if chunk:
+                yield chunk
+    result = await db.stream(export.query(since, until).execution_options(yield_per=batch_rows))
+    async for rows in result.partitions():
+        chunk = await asyncio.to_thread(lambda: encoder.encode(export.materialize(rows)))
+        if chunk:
+            yield chunk
+    yield encoder.finish()
+
+
+def export_filename(dataset: str, fmt: str, gzip: bool) -> str:
+    return f"{dataset}.{fmt}" + (".gz" if gzip else "")
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    import argparse
+    from db import SessionLocal, init_db
+
+    parser = argparse.ArgumentParser(description="Stream telemetry rows as NDJSON or CSV")
+    parser.add_argument("dataset", choices=list(EXPORTS))
+    parser.add_argument("--format", dest="fmt", choices=list(FORMATS), default="ndjson")
+    parser.add_argument("--since", type=datetime.fromisoformat, help="created_at >= this ISO timestamp")
+    parser.add_argument("--until", type=datetime.fromisoformat, help="created_at < this ISO timestamp")
+    parser.add_argument("--gzip", action="store_true", help="gzip the output")
+    parser.add_argument("--archived", action="store_true", help="Include rows moved out by retention")
+    parser.add_argument("-o", "--output", help="Output file (default: stdout)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    init_db()
+    out = open(args.output, "wb") if args.output else sys.stdout.buffer
+    try:
+        with SessionLocal() as db:
+            for chunk in iter_export(db, args.dataset, args.fmt, args.since, args.until, args.gzip,
+                                     archived=args.archived):
+                out.write(chunk)
+    finally:
+        if args.output:
+            out.close()
+        else:
+            out.flush()
+
+
+if __name__ == "__main__":
+    main()
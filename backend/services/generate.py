@@ -1,7 +1,16 @@
-from typing import Dict, Union
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, Union
 import json
+from schemas import PromptStyle
 from services.explain import explain
 from services.helpers import smart_split
+from services.scoring import score_prompt
+from services.compact import compact_prompt, COMPACT_LEVELS
+from services.tokens import count_tokens
+from services.cache import memoize, normalize_text, normalize_params
+from services.metrics import track_event
+
+# Wildcard accepted in `styles` to request every PromptStyle
+ALL_STYLES = "*"
 
 def make_directive(spec: dict) -> str:
     """Traditional directive-style prompt with clear instructions"""
@@ -202,73 +211,116 @@ def make_rubric_scored(spec: dict) -> str:
     
     return "\n".join(lines)
 
-def code_wrappers(prompt_body: str, model: str = "gpt-4o-mini", params: dict = None) -> Dict[str, str]:
-    """Generate code wrappers in Python, JavaScript, and cURL"""
-    params = params or {}
-    temperature = params.get("temperature", 0.2)
-    max_tokens = params.get("max_tokens", None)
-    
-    # Escape for JSON properly
-    import json
-    prompt_escaped = json.dumps(prompt_body)
+# A wrapper renders one SDK snippet: (prompt_body, model, params) -> code
+Wrapper = Callable[[str, str, dict], str]
+
+# Registered wrappers by language; DEFAULT_LANGUAGES are rendered when a
+# request doesn't pass `languages`, the rest only when asked for by name
+WRAPPERS: Dict[str, Wrapper] = {}
+DEFAULT_LANGUAGES: List[str] = []
+
+def register_wrapper(language: str, default: bool = False):
+    """
+    Decorator registering a code wrapper for `language`
     
-    # Build params string
-    param_lines_py = [f'    model="{model}"', f'    messages=[{{"role":"user","content":{prompt_escaped}}}]']
-    param_lines_js = [f'  model: "{model}"', f'  messages: [{{ role: "user", content: {prompt_escaped} }}]']
-    param_dict = {"model": model, "messages": [{"role": "user", "content": prompt_body}]}
+    Usage:
+        @register_wrapper("go")
+        def wrap_go(prompt_body: str, model: str, params: dict) -> str:
+            ...
     
+    Pass default=True to render it on every request that doesn't pick languages.
+    """
+    def decorator(func: Wrapper) -> Wrapper:
+        WRAPPERS[language] = func
+        if default and language not in DEFAULT_LANGUAGES:
+            DEFAULT_LANGUAGES.append(language)
+        return func
+    return decorator
+
+def unknown_languages(languages: Optional[List[str]]) -> List[str]:
+    """Requested languages with no registered wrapper"""
+    return [lang for lang in languages or [] if lang not in WRAPPERS]
+
+@register_wrapper("python", default=True)
+def wrap_python(prompt_body: str, model: str, params: dict) -> str:
+    param_lines = [f'    model="{model}"', f'    messages=[{{"role":"user","content":{json.dumps(prompt_body)}}}]']
+    temperature = params.get("temperature", 0.2)
     if temperature is not None:
-        param_lines_py.append(f'    temperature={temperature}')
-        param_lines_js.append(f'  temperature: {temperature}')
-        param_dict["temperature"] = temperature
-    
-    if max_tokens:
-        param_lines_py.append(f'    max_tokens={max_tokens}')
-        param_lines_js.append(f'  max_tokens: {max_tokens}')
-        param_dict["max_tokens"] = max_tokens
+        param_lines.append(f'    temperature={temperature}')
+    if params.get("max_tokens"):
+        param_lines.append(f'    max_tokens={params["max_tokens"]}')
     
-    py = f"""# Python example
+    return f"""# Python example
 from openai import OpenAI
 client = OpenAI()
 resp = client.chat.completions.create(
-{',\\n'.join(param_lines_py)}
+{',\\n'.join(param_lines)}
 )
 print(resp.choices[0].message.content)
 """
+
+@register_wrapper("javascript", default=True)
+def wrap_javascript(prompt_body: str, model: str, params: dict) -> str:
+    param_lines = [f'  model: "{model}"', f'  messages: [{{ role: "user", content: {json.dumps(prompt_body)} }}]']
+    temperature = params.get("temperature", 0.2)
+    if temperature is not None:
+        param_lines.append(f'  temperature: {temperature}')
+    if params.get("max_tokens"):
+        param_lines.append(f'  max_tokens: {params["max_tokens"]}')
     
-    js = f"""// JavaScript example
+    return f"""// JavaScript example
 import OpenAI from "openai";
 const client = new OpenAI();
 const resp = await client.chat.completions.create({{
-{',\\n'.join(param_lines_js)}
+{',\\n'.join(param_lines)}
 }});
 console.log(resp.choices[0].message.content);
 """
+
+@register_wrapper("curl", default=True)
+def wrap_curl(prompt_body: str, model: str, params: dict) -> str:
+    param_dict = {"model": model, "messages": [{"role": "user", "content": prompt_body}]}
+    temperature = params.get("temperature", 0.2)
+    if temperature is not None:
+        param_dict["temperature"] = temperature
+    if params.get("max_tokens"):
+        param_dict["max_tokens"] = params["max_tokens"]
     
     curl_data = json.dumps(param_dict, indent=2)
-    curl = f"""# cURL example
+    return f"""# cURL example
 curl https://api.openai.com/v1/chat/completions \\
   -H "Authorization: Bearer $OPENAI_API_KEY" \\
   -H "Content-Type: application/json" \\
   -d '{curl_data}'
 """
-    
-    return {"python": py, "javascript": js, "curl": curl}
 
-def generate(goal: str, style: str = "directive", model: str = "gpt-4o-mini", 
-              params: dict = None) -> dict:
+@track_event("code_wrappers")
+def code_wrappers(prompt_body: str, model: str = "gpt-4o-mini", params: dict = None,
+                  languages: Optional[List[str]] = None) -> Dict[str, str]:
     """
-    Generate a prompt in the specified style
+    Render code wrappers for a prompt
     
     Args:
-        goal: User's natural language goal
-        style: One of: directive, schema_json, few_shot, planner_executor, rubric_scored
-        model: LLM model to use (default: gpt-4o-mini)
+        prompt_body: Prompt text to embed
+        model: LLM model to use in the snippets
         params: Additional parameters like temperature, max_tokens
+        languages: Registered wrappers to render, in order (default: DEFAULT_LANGUAGES;
+            [] renders none). Unknown names raise ValueError.
     """
-    spec = explain(goal)
     params = params or {}
-    
+    if languages is None:
+        languages = DEFAULT_LANGUAGES
+    unknown = unknown_languages(languages)
+    if unknown:
+        raise ValueError(f"No code wrapper registered for: {', '.join(unknown)}")
+    return {lang: WRAPPERS[lang](prompt_body, model, params) for lang in languages}
+
+@track_event("style_build")
+def build_prompt(spec: dict, style: str) -> dict:
+    """
+    Build one style's prompt text(s) from an already computed spec, without
+    language variants (see build_style)
+    """
     # Generate prompt based on style
     if style == "schema_json":
         body = make_schema_json(spec)
@@ -297,14 +349,196 @@ def generate(goal: str, style: str = "directive", model: str = "gpt-4o-mini",
     if is_dual:
         result["planner_prompt"] = body["planner_prompt"]
         result["executor_prompt"] = body["executor_prompt"]
-        result["language_variants"] = {
-            "planner": code_wrappers(body["planner_prompt"], model, params),
-            "executor": code_wrappers(body["executor_prompt"], model, params)
-        }
         # For compatibility with existing schema, also set prompt_body to planner
         result["prompt_body"] = body["planner_prompt"]
     else:
         result["prompt_body"] = body
-        result["language_variants"] = code_wrappers(body, model, params)
     
     return result
+
+def prompt_targets(result: dict) -> Dict[str, str]:
+    """Prompts that get code wrappers: planner/executor for dual prompts, else just the body"""
+    if result["is_dual_prompt"]:
+        return {"planner": result["planner_prompt"], "executor": result["executor_prompt"]}
+    return {"": result["prompt_body"]}
+
+def scoring_text(result: dict) -> str:
+    """Text score_prompt rates for a result: planner and executor together for dual prompts"""
+    if result["is_dual_prompt"]:
+        return f"{result['planner_prompt']}\n\n{result['executor_prompt']}"
+    return result["prompt_body"]
+
+@track_event("compact")
+def compact_result(result: dict, max_prompt_tokens: Optional[int] = None) -> dict:
+    """
+    Compact a build_prompt result's prompt(s) in place (see services.compact)
+    
+    Each prompt of a dual prompt is sent on its own, so each gets the whole
+    max_prompt_tokens budget. Adds `compaction` with the level used, tokens
+    and score_prompt score before and after, and the problems compaction
+    introduced.
+    """
+    before = score_prompt(scoring_text(result))
+    targets = prompt_targets(result)
+    tokens_before = sum(count_tokens(text) for text in targets.values())
+    
+    levels = []
+    for name, text in targets.items():
+        compacted, level = compact_prompt(text, max_prompt_tokens)
+        result[f"{name}_prompt" if name else "prompt_body"] = compacted
+        if level:
+            levels.append(COMPACT_LEVELS.index(level))
+    if result["is_dual_prompt"]:
+        result["prompt_body"] = result["planner_prompt"]
+    
+    compacted_targets = prompt_targets(result).values()
+    tokens_after = sum(count_tokens(text) for text in compacted_targets)
+    after = score_prompt(scoring_text(result))
+    result["compaction"] = {
+        "level": COMPACT_LEVELS[max(levels)] if levels else None,
+        "max_prompt_tokens": max_prompt_tokens,
+        "within_budget": max_prompt_tokens is None or all(
+            count_tokens(text) <= max_prompt_tokens for text in compacted_targets
+        ),
+        "tokens_before": tokens_before,
+        "tokens_after": tokens_after,
+        "tokens_saved": tokens_before - tokens_after,
+        "saved_pct": round(100 * (tokens_before - tokens_after) / tokens_before) if tokens_before else 0,
+        "score_before": before["score"],
+        "score_after": after["score"],
+        "problems_added": [p for p in after["problems"] if p not in before["problems"]],
+    }
+    result["notes"].append(f"Compacted from {tokens_before} to {tokens_after} tokens")
+    return result
+
+def build_style(spec: dict, style: str, model: str = "gpt-4o-mini", params: dict = None,
+                languages: Optional[List[str]] = None, compact: bool = False,
+                max_prompt_tokens: Optional[int] = None) -> dict:
+    """
+    Build one style from an already computed spec
+    
+    Args:
+        spec: Output of explain() for the goal
+        style: One of: directive, schema_json, few_shot, planner_executor, rubric_scored
+        model: LLM model to use in code wrappers
+        params: Additional parameters like temperature, max_tokens
+        languages: Code wrappers to render (see code_wrappers)
+        compact: Compact the prompt(s) as far as possible before rendering wrappers
+        max_prompt_tokens: Compact only as far as needed to fit this many tokens
+            per prompt (implies compact)
+    """
+    params = params or {}
+    result = build_prompt(spec, style)
+    if compact or max_prompt_tokens:
+        compact_result(result, max_prompt_tokens)
+    
+    if result["is_dual_prompt"]:
+        result["language_variants"] = {
+            name: code_wrappers(text, model, params, languages) for name, text in prompt_targets(result).items()
+        }
+    else:
+        result["language_variants"] = code_wrappers(result["prompt_body"], model, params, languages)
+    
+    return result
+
+def expand_styles(styles: List[str]) -> List[str]:
+    """Expand the "*" wildcard and drop duplicates, keeping first-seen order"""
+    expanded = []
+    for style in styles:
+        names = [s.value for s in PromptStyle] if style == ALL_STYLES else [style]
+        for name in names:
+            if name not in expanded:
+                expanded.append(name)
+    return expanded
+
+def generate_many(goal: str, styles: List[str], model: str = "gpt-4o-mini",
+                  params: dict = None, languages: Optional[List[str]] = None,
+                  compact: bool = False, max_prompt_tokens: Optional[int] = None) -> List[dict]:
+    """
+    Generate several styles from one explain() pass, scored and ranked
+    
+    Each result carries score_prompt's score and problems. Dual prompts are scored
+    on planner and executor together; compacted prompts are scored as compacted.
+    Results are sorted best score first; ties keep the requested order.
+    """
+    spec = explain(goal)
+    results = []
+    for style in expand_styles(styles):
+        result = build_style(spec, style, model, params, languages, compact, max_prompt_tokens)
+        scored = score_prompt(scoring_text(result))
+        result["score"] = scored["score"]
+        result["problems"] = scored["problems"]
+        results.append(result)
+    
+    results.sort(key=lambda r: r["score"], reverse=True)
+    return results
+
+def _generate_key(goal: str, style: str = "directive", model: str = "gpt-4o-mini",
+                  params: dict = None, styles: Optional[List[str]] = None,
+                  languages: Optional[List[str]] = None, compact: bool = False,
+                  max_prompt_tokens: Optional[int] = None):
+    return (
+        normalize_text(goal),
+        None if styles else style,
+        model,
+        normalize_params(params),
+        tuple(styles) if styles else None,
+        None if languages is None else tuple(languages),
+        bool(compact or max_prompt_tokens),
+        max_prompt_tokens,
+    )
+
+@track_event("generate")
+@memoize("generate", key=_generate_key)
+def generate(goal: str, style: str = "directive", model: str = "gpt-4o-mini", 
+              params: dict = None, styles: Optional[List[str]] = None,
+              languages: Optional[List[str]] = None, compact: bool = False,
+              max_prompt_tokens: Optional[int] = None) -> dict:
+    """
+    Generate a prompt in the specified style
+    
+    Args:
+        goal: User's natural language goal
+        style: One of: directive, schema_json, few_shot, planner_executor, rubric_scored
+        model: LLM model to use (default: gpt-4o-mini)
+        params: Additional parameters like temperature, max_tokens
+        styles: Generate several styles at once (["*"] for all); returns
+            {"results": [...]} ranked by score instead of a single result
+        languages: Code wrappers to render in language_variants (default: python,
+            javascript, curl; [] for none)
+        compact: Return a minimal-token version of the prompt(s), with a
+            `compaction` report of tokens and score before/after
+        max_prompt_tokens: Compact only as far as needed to fit this token
+            budget per prompt (implies compact)
+        use_cache: Pass False to bypass the memo cache for this call
+    """
+    if styles:
+        return {"results": generate_many(goal, styles, model, params, languages, compact, max_prompt_tokens)}
+    
+    spec = explain(goal)
+    return build_style(spec, style, model, params, languages, compact, max_prompt_tokens)
+
+def generate_events(goal: str, style: str = "directive", model: str = "gpt-4o-mini",
+                    params: dict = None, languages: Optional[List[str]] = None,
+                    use_cache: bool = True, compact: bool = False,
+                    max_prompt_tokens: Optional[int] = None) -> Iterator[Tuple[str, dict]]:
+    """
+    generate() as (event, data) pairs for streaming clients
+    
+    Yields the `prompt` (build_prompt's fields) first, then one `variant` per
+    requested code wrapper language; dual prompts get a variant per planner/executor
+    prompt and language, tagged with `prompt`. With compact/max_prompt_tokens
+    the prompt event carries the compacted prompt(s) and `compaction`.
+    """
+    params = params or {}
+    result = build_prompt(explain(goal, use_cache=use_cache), style)
+    if compact or max_prompt_tokens:
+        compact_result(result, max_prompt_tokens)
+    yield "prompt", result
+    
+    for name, text in prompt_targets(result).items():
+        for language, code in code_wrappers(text, model, params, languages).items():
+            variant = {"language": language, "code": code}
+            if name:
+                variant["prompt"] = name
+            yield "variant", variant
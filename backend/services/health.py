@@ -0,0 +1,157 @@
+"""
+Health probes.
+Liveness never touches the database. Readiness runs `SELECT 1`, cached for
+a moment so frequent probes from several replicas don't each cost a round
+trip. Run metrics come from a snapshot a background thread refreshes every
+HEALTH_METRICS_INTERVAL_S, so probe cost doesn't grow with the runs table.
+"""
+
+import os
+import time
+import logging
+import threading
+from typing import Any, Dict, Optional
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+HEALTH_METRICS_INTERVAL_S = float(os.getenv("HEALTH_METRICS_INTERVAL_S", "30"))
+# How long a readiness result is reused before the database is checked again
+HEALTH_READY_CACHE_S = float(os.getenv("HEALTH_READY_CACHE_S", "1"))
+
+EMPTY_RUN_STATS = {
+    "total_runs": 0,
+    "avg_latency_ms": 0,
+    "total_cost": 0.0,
+    "success_rate": 0.0
+}
+
+
+def check_db() -> bool:
+    """One `SELECT 1` on a pooled connection"""
+    from db import engine
+    try:
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+        return True
+    except Exception as e:
+        logger.warning(f"[HEALTH] Database check failed: {e}")
+        return False
+
+
+class MetricsSnapshot:
+    """Run statistics recomputed by a background thread every interval_s"""
+
+    def __init__(self, interval_s: float = HEALTH_METRICS_INTERVAL_S):
+        self.interval_s = interval_s
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._metrics: Dict[str, Any] = dict(EMPTY_RUN_STATS)
+        self._refreshed_at: Optional[float] = None
+        self.refreshes = 0
+        self.failures = 0
+
+    def refresh(self) -> None:
+        from db import SessionLocal
+        from services.logger import get_run_stats
+        db = SessionLocal()
+        try:
+            metrics = get_run_stats(db)
+        except Exception as e:
+            logger.error(f"[HEALTH] Metrics refresh failed: {e}")
+            with self._lock:
+                self.failures += 1
+            return
+        finally:
+            db.close()
+        with self._lock:
+            self._metrics = metrics
+            self._refreshed_at = time.time()
+            self.refreshes += 1
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="metrics-snapshot", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            self.refresh()
+            if self._stop.wait(self.interval_s):
+                return
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stop.set()
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+        self._thread = None
+
+    def get(self) -> Dict[str, Any]:
+        """Latest metrics with their age in seconds (None until the first refresh lands)"""
+        with self._lock:
+            age = None if self._refreshed_at is None else round(time.time() - self._refreshed_at, 3)
+            return {"metrics": self._metrics, "age_s": age}
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"interval_s": self.interval_s, "refreshes": self.refreshes, "failures": self.failures}
+
+
+_snapshot: Optional[MetricsSnapshot] = None
+_snapshot_lock = threading.Lock()
+
+
+def get_metrics_snapshot() -> MetricsSnapshot:
+    """The process-wide snapshot; its refresher thread starts on first use"""
+    global _snapshot
+    if _snapshot is None:
+        with _snapshot_lock:
+            if _snapshot is None:
+                _snapshot = MetricsSnapshot()
+                _snapshot.start()
+    return _snapshot
+
+
+def stop_metrics_snapshot() -> None:
+    """
+    Stop the background refresher (call on shutdown). The next
+    get_metrics_snapshot() starts a fresh one, so an app that is started
+    again doesn't serve a snapshot nothing refreshes.
+    """
+    global _snapshot
+    with _snapshot_lock:
+        snapshot, _snapshot = _snapshot, None
+    if snapshot is not None:
+        snapshot.stop()
+
+
+_ready_lock = threading.Lock()
+_ready: Optional[bool] = None
+_ready_checked_at = 0.0
+
+
+def cached_readiness() -> Optional[bool]:
+    """The last readiness result if it is still fresh, else None"""
+    if _ready is not None and time.monotonic() - _ready_checked_at < HEALTH_READY_CACHE_S:
+        return _ready
+    return None
+
+
+def check_ready() -> bool:
+    """Database readiness, re-checked at most once per HEALTH_READY_CACHE_S"""
+    global _ready, _ready_checked_at
+    ready = cached_readiness()
+    if ready is not None:
+        return ready
+    with _ready_lock:
+        # Another probe may have refreshed it while we waited
+        ready = cached_readiness()
+        if ready is None:
+            ready = check_db()
+            _ready, _ready_checked_at = ready, time.monotonic()
+    return ready
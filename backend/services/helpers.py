@@ -1,5 +1,11 @@
+import json
+
 def smart_split(s: str):
     # splits on commas and semicolons without being too fancy
     for sep in [",", ";", "\n"]:
         s = s.replace(sep, "|")
     return [x.strip() for x in s.split("|")]
+
+def sse_event(event: str, data) -> str:
+    # one server-sent event; data is JSON on a single line
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
@@ -0,0 +1,106 @@
+"""
+Compiled keyword engine.
+The substring and regex rules used by scoring and explain are compiled once at
+import time. Each text is lower-cased and scanned once, and every rule then
+reads the resulting hit set instead of re-scanning the text.
+"""
+
+import re
+from typing import Dict, FrozenSet, Iterable, Optional
+
+# Literal keywords read by services.scoring (score_prompt, optimize_prompt)
+SCORING_KEYWORDS = (
+    "task:", "you are", "json", "format", "example", "few-shot", "constraints",
+    "exactly", "acceptance", "quality check", "schema", "fields", "summarize",
+    "bullet", "point", "extract", "list", "array", "classify",
+)
+
+# Literal keywords read by services.explain (extract_entities, explain)
+GOAL_KEYWORDS = (
+    "transcript", "document", "text", "image", "photo", "data", "csv",
+    "summary", "summarize", "action", "task", "classify", "category", "extract",
+    "json", "concise", "brief", "schema", "generate", "analyze",
+)
+
+# Regex rules for goals. Each named group is one rule and is reported by name.
+GOAL_PATTERN = r"\b\d+\s*(?:(?P<bullet_count>bullet)|(?P<word_count>word))"
+
+# Below this many keywords, one C-level substring search per keyword beats the
+# regex automaton; above it the automaton wins because its cost stays flat.
+AUTOMATON_MIN_KEYWORDS = 512
+
+
+def _trie_regex(words: Iterable[str]) -> str:
+    """Build a prefix-factored alternation that prefers the longest match"""
+    trie: Dict = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[""] = True
+
+    def emit(node: Dict) -> str:
+        branches = [re.escape(ch) + emit(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        if "" in node:
+            if len(branches) == 1 and len(body) > 1:
+                body = "(?:" + body + ")"
+            body += "?"
+        return body
+
+    return emit(trie)
+
+
+class KeywordMatcher:
+    """
+    Finds every keyword and pattern hit in a text with one call.
+
+    Large vocabularies are compiled into a single trie-shaped regex wrapped in
+    a zero-width lookahead, so overlapping hits are all seen in one pass. At
+    each position only the longest keyword is reported; shorter keywords that
+    are prefixes of it are added from a table built here.
+    """
+
+    def __init__(self, keywords: Iterable[str], pattern: Optional[str] = None,
+                 automaton_min_keywords: int = AUTOMATON_MIN_KEYWORDS):
+        self.keywords = tuple(sorted({k.lower() for k in keywords}))
+        self.pattern = re.compile(pattern) if pattern else None
+        self.uses_automaton = len(self.keywords) >= automaton_min_keywords
+        self._automaton = None
+        self._prefixes: Dict[str, FrozenSet[str]] = {}
+        if self.uses_automaton:
+            self._automaton = re.compile(f"(?=({_trie_regex(self.keywords)}))")
+            self._prefixes = {
+                k: frozenset(p for p in self.keywords if k.startswith(p)) for k in self.keywords
+            }
+
+    def scan(self, text: str) -> FrozenSet[str]:
+        """Return the keywords and pattern rule names present in text (case-insensitive)"""
+        text = text.lower()
+        if self._automaton is not None:
+            hits = set()
+            prefixes = self._prefixes
+            for found in set(self._automaton.findall(text)):
+                hits |= prefixes[found]
+        else:
+            hits = {k for k in self.keywords if k in text}
+        if self.pattern is not None:
+            for m in self.pattern.finditer(text):
+                hits.update(name for name, value in m.groupdict().items() if value is not None)
+        return frozenset(hits)
+
+
+SCORING_MATCHER = KeywordMatcher(SCORING_KEYWORDS)
+GOAL_MATCHER = KeywordMatcher(GOAL_KEYWORDS, GOAL_PATTERN)
+
+
+def scan_prompt(prompt: str) -> FrozenSet[str]:
+    """Keyword hits for a prompt, as read by score_prompt and optimize_prompt"""
+    return SCORING_MATCHER.scan(prompt)
+
+
+def scan_goal(goal: str) -> FrozenSet[str]:
+    """Keyword and pattern hits for a goal, as read by extract_entities and explain"""
+    return GOAL_MATCHER.scan(goal)
@@ -3,39 +3,191 @@ Telemetry and run logging service.
 Centralized logging that can later hook into Langfuse, Posthog, or other observability tools.
 """
 
+import os
+import time
 import logging
 import json
+import threading
+import anyio
 from datetime import datetime
-from typing import Optional, Dict, Any
-from functools import wraps
+from typing import Optional, Dict, Any, List, Tuple
+from sqlalchemy import delete, event, func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from models import Run, PromptVersion
+from models import Run, PromptVersion, PromptScore, PromptTransformation
+from services.writebehind import WriteBehindQueue, TELEMETRY_WRITE_BEHIND
+from services.rollups import bump_daily_stats, run_deltas, transform_deltas
+from services.blobs import encode_blobs, store_blobs
+from services.metrics import track_event
 
 logger = logging.getLogger(__name__)
 
-def track_event(event_name: str):
+def build_run_row(
+    prompt_version_id: int,
+    style: str,
+    model: str,
+    params: Dict[str, Any],
+    started_at: datetime,
+    finished_at: Optional[datetime] = None,
+    output: Optional[str] = None,
+    tokens_in: int = 0,
+    tokens_out: int = 0,
+    cost: float = 0.0,
+    source: str = "web"
+) -> Dict[str, Any]:
+    """Column values for one Run row (arguments as for record_run)"""
+    # Calculate latency
+    if finished_at:
+        latency_ms = int((finished_at - started_at).total_seconds() * 1000)
+    else:
+        latency_ms = 0
+    
+    return {
+        "prompt_version_id": prompt_version_id,
+        "style": style,
+        "model": model,
+        "params_json": json.dumps(params or {}),
+        "source": source,
+        "started_at": started_at,
+        "finished_at": finished_at or datetime.utcnow(),
+        "tokens_in": tokens_in,
+        "tokens_out": tokens_out,
+        "cost": cost,
+        "latency_ms": latency_ms,
+        # Set here rather than by the column default so the daily rollup buckets the same day
+        "created_at": datetime.utcnow(),
+    }
+
+
+def insert_runs(db: Session, rows: List[Dict[str, Any]]) -> List[int]:
+    """Bulk INSERT Run rows and bump their daily rollups without committing; returns ids in input order"""
+    if not rows:
+        return []
+    run_ids = list(db.scalars(
+        insert(Run).returning(Run.id, sort_by_parameter_order=True),
+        rows,
+    ).all())
+    bump_daily_stats(db, run_deltas(rows))
+    return run_ids
+
+
+def encode_comparisons(comparisons: List[Dict[str, Any]]) -> Dict[str, Any]:
     """
-    Decorator for tracking events (future-proof for analytics integration)
+    Hash and encode the prompt texts of comparisons for insert_comparisons.
+    CPU-bound (sha256 and zlib per text), so the async path runs it in the
+    threadpool rather than inside AsyncSession.run_sync, which runs on the loop.
     
-    Usage:
-        @track_event("generate_call")
-        def generate(...):
-            ...
+    Returns:
+        encoded: "before_hashes" and "after_hashes" (one per comparison) and
+            "blobs" (rows for store_blobs)
     """
-    def decorator(func):
-        @wraps(func)
-        def wrapper(*args, **kwargs):
-            logger.info(f"[EVENT] {event_name} triggered")
-            result = func(*args, **kwargs)
-            logger.info(f"[EVENT] {event_name} completed")
-            return result
-        return wrapper
-    return decorator
+    hashes, blobs = encode_blobs(
+        [c["before"]["prompt"] for c in comparisons] + [c["after"]["prompt"] for c in comparisons]
+    )
+    return {
+        "before_hashes": hashes[:len(comparisons)],
+        "after_hashes": hashes[len(comparisons):],
+        "blobs": blobs,
+    }
+
+
+def insert_comparisons(db: Session, comparisons: List[Dict[str, Any]],
+                       encoded: Optional[Dict[str, Any]] = None) -> None:
+    """
+    Bulk INSERT PromptScore + PromptTransformation rows and bump their daily rollup without committing.
+    Prompt texts go to the blob store; the rows reference them by hash.
+    
+    Args:
+        db: Database session
+        comparisons: Results from compare_prompts
+        encoded: encode_comparisons(comparisons), if already computed
+    """
+    if not comparisons:
+        return
+    now = datetime.utcnow()
+    if encoded is None:
+        encoded = encode_comparisons(comparisons)
+    store_blobs(db, encoded["blobs"])
+    before_hashes, after_hashes = encoded["before_hashes"], encoded["after_hashes"]
+    before_ids = db.scalars(
+        insert(PromptScore).returning(PromptScore.id, sort_by_parameter_order=True),
+        [
+            {
+                "prompt_text": "",
+                "prompt_hash": before_hash,
+                "score": c["before"]["score"],
+                "problems_json": json.dumps(c["before"]["problems"]),
+            }
+            for c, before_hash in zip(comparisons, before_hashes)
+        ],
+    ).all()
+    
+    db.execute(
+        insert(PromptTransformation),
+        [
+            {
+                "before_id": before_id,
+                "after_prompt_text": "",
+                "after_prompt_hash": after_hash,
+                "after_score": c["after"]["score"],
+                "fixes_json": json.dumps(c["after"]["fixes"]),
+                "improvement_pct": c["improvement_pct"],
+                "created_at": now,
+            }
+            for before_id, after_hash, c in zip(before_ids, after_hashes, comparisons)
+        ],
+    )
+    bump_daily_stats(db, transform_deltas(len(comparisons), now))
+
+
+def flush_telemetry(batch: List[Tuple[str, Dict[str, Any]]]) -> None:
+    """Write a batch of queued ("run", row) / ("comparison", result) items in one transaction"""
+    from db import SessionLocal
+    
+    runs = [item for kind, item in batch if kind == "run"]
+    comparisons = [item for kind, item in batch if kind == "comparison"]
+    db = SessionLocal()
+    try:
+        insert_runs(db, runs)
+        insert_comparisons(db, comparisons)
+        db.commit()
+        logger.info(f"[TELEMETRY] Flushed {len(runs)} run(s), {len(comparisons)} comparison(s)")
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+_writer: Optional[WriteBehindQueue] = None
+_writer_lock = threading.Lock()
 
 
+def get_telemetry_writer() -> Optional[WriteBehindQueue]:
+    """The write-behind queue, or None when TELEMETRY_WRITE_BEHIND is off"""
+    global _writer
+    if TELEMETRY_WRITE_BEHIND and _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = WriteBehindQueue(flush_telemetry)
+    return _writer
+
+
+def stop_telemetry_writer() -> None:
+    """Flush queued telemetry and stop the background writer (call on shutdown)"""
+    if _writer is not None:
+        _writer.stop()
+
+
+def telemetry_queue_stats() -> Optional[Dict[str, Any]]:
+    return _writer.stats() if _writer is not None else None
+
+
+@track_event("record_run")
 def record_run(
     db: Session,
-    prompt_version_id: int,
+    prompt_version_id: Optional[int],
     style: str,
     model: str,
     params: Dict[str, Any],
@@ -52,7 +204,7 @@ def record_run(
     
     Args:
         db: Database session
-        prompt_version_id: ID of the prompt version used
+        prompt_version_id: ID of the prompt version used (None skips recording)
         style: Prompt style (directive, schema_json, etc.)
         model: LLM model name
         params: Model parameters (temperature, max_tokens, etc.)
@@ -65,85 +217,264 @@ def record_run(
         source: Source of the run (web, api, cli, notebook)
     
     Returns:
-        run_id: ID of the created run record
+        run_id: ID of the created run record (0 if queued for write-behind,
+            -1 if the write failed or was dropped)
     """
+    if prompt_version_id is None:
+        # Never attribute a run to a made-up version
+        logger.error(f"[TELEMETRY] No prompt version for style={style}; run not recorded")
+        return -1
+    
+    row = build_run_row(
+        prompt_version_id, style, model, params, started_at, finished_at,
+        output, tokens_in, tokens_out, cost, source
+    )
+    
+    writer = get_telemetry_writer()
+    if writer is not None:
+        return 0 if writer.put(("run", row)) else -1
+    
     try:
-        # Calculate latency
-        if finished_at:
-            latency_ms = int((finished_at - started_at).total_seconds() * 1000)
-        else:
-            latency_ms = 0
+        run_id = insert_runs(db, [row])[0]
+        db.commit()
         
-        # Create run record
-        run = Run(
-            prompt_version_id=prompt_version_id,
-            style=style,
-            model=model,
-            params_json=json.dumps(params),
-            source=source,
-            started_at=started_at,
-            finished_at=finished_at or datetime.utcnow(),
-            tokens_in=tokens_in,
-            tokens_out=tokens_out,
-            cost=cost,
-            latency_ms=latency_ms
-        )
+        logger.info(f"[TELEMETRY] Recorded run {run_id}: style={style}, latency={row['latency_ms']}ms")
+        return run_id
         
-        db.add(run)
+    except Exception as e:
+        logger.error(f"[TELEMETRY] Failed to record run: {e}")
+        db.rollback()
+        # Don't crash the app if telemetry fails
+        return -1
+
+
+@track_event("record_runs")
+def record_runs(db: Session, runs: List[Dict[str, Any]]) -> List[int]:
+    """
+    Record several runs in a single transaction.
+    
+    Args:
+        db: Database session
+        runs: One dict per run with the keyword arguments of record_run (minus db)
+    
+    Runs without a prompt_version_id are skipped.
+    
+    Returns:
+        run_ids: IDs of the created runs in input order (0 for each run queued for
+            write-behind, -1 for each dropped one), or [] if the write failed
+    """
+    skipped = [r["style"] for r in runs if r.get("prompt_version_id") is None]
+    if skipped:
+        logger.error(f"[TELEMETRY] No prompt version for styles={skipped}; runs not recorded")
+        runs = [r for r in runs if r.get("prompt_version_id") is not None]
+    if not runs:
+        return []
+    rows = [build_run_row(**r) for r in runs]
+    
+    writer = get_telemetry_writer()
+    if writer is not None:
+        return [0 if writer.put(("run", row)) else -1 for row in rows]
+    
+    try:
+        run_ids = insert_runs(db, rows)
         db.commit()
-        db.refresh(run)
         
-        logger.info(f"[TELEMETRY] Recorded run {run.id}: style={style}, latency={latency_ms}ms")
-        return run.id
+        logger.info(f"[TELEMETRY] Recorded {len(run_ids)} run(s): styles={[r['style'] for r in runs]}")
+        return run_ids
         
     except Exception as e:
-        logger.error(f"[TELEMETRY] Failed to record run: {e}")
+        logger.error(f"[TELEMETRY] Failed to record runs: {e}")
+        db.rollback()
+        # Don't crash the app if telemetry fails
+        return []
+
+
+@track_event("record_comparisons")
+def record_comparisons(db: Session, comparisons: List[Dict[str, Any]],
+                       encoded: Optional[Dict[str, Any]] = None) -> int:
+    """
+    Store prompt comparisons in a single transaction.
+    Each comparison writes one PromptScore (before) and one PromptTransformation (after),
+    using one bulk INSERT per table regardless of batch size.
+    
+    Args:
+        db: Database session
+        comparisons: Results from compare_prompts (before["prompt"] is the original text)
+        encoded: encode_comparisons(comparisons), if already computed
+    
+    Returns:
+        count: Number of comparisons stored (or queued for write-behind), -1 if the write failed
+    """
+    if not comparisons:
+        return 0
+    
+    writer = get_telemetry_writer()
+    if writer is not None:
+        return sum(1 for c in comparisons if writer.put(("comparison", c)))
+    
+    try:
+        insert_comparisons(db, comparisons, encoded)
+        db.commit()
+        
+        logger.info(f"[TELEMETRY] Recorded {len(comparisons)} comparison(s)")
+        return len(comparisons)
+        
+    except Exception as e:
+        logger.error(f"[TELEMETRY] Failed to record comparisons: {e}")
         db.rollback()
         # Don't crash the app if telemetry fails
         return -1
 
 
-def get_or_create_scratchpad_version(db: Session, style: str, model: str) -> int:
+# Scratchpad version ids by label, resolved once per process
+SCRATCHPAD_CACHE_TTL_S = float(os.getenv("SCRATCHPAD_CACHE_TTL_S", "300"))
+_scratchpad_versions: Dict[str, Tuple[int, float]] = {}
+_scratchpad_lock = threading.Lock()
+
+
+def invalidate_scratchpad_cache(version_id: Optional[int] = None) -> None:
+    """Forget one cached scratchpad version id, or all of them"""
+    with _scratchpad_lock:
+        if version_id is None:
+            _scratchpad_versions.clear()
+        else:
+            for label, (cached_id, _) in list(_scratchpad_versions.items()):
+                if cached_id == version_id:
+                    del _scratchpad_versions[label]
+
+
+@event.listens_for(PromptVersion, "after_delete")
+def _on_version_deleted(mapper, connection, target):
+    invalidate_scratchpad_cache(target.id)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _on_bulk_version_delete(orm_execute_state):
+    # Bulk DELETE statements bypass after_delete, so drop the whole cache
+    if orm_execute_state.is_delete and orm_execute_state.bind_mapper is not None \
+            and orm_execute_state.bind_mapper.class_ is PromptVersion:
+        invalidate_scratchpad_cache()
+
+
+def scratchpad_label(style: str) -> str:
+    return f"scratchpad-{style}"
+
+
+def _cached_scratchpad_version(label: str) -> Optional[int]:
+    """Cached version id for a scratchpad label, if still within its TTL"""
+    with _scratchpad_lock:
+        cached = _scratchpad_versions.get(label)
+    if cached is not None and time.monotonic() - cached[1] < SCRATCHPAD_CACHE_TTL_S:
+        return cached[0]
+    return None
+
+
+def _insert_version_if_absent(db: Session, values: Dict[str, Any]) -> None:
+    """INSERT a scratchpad version unless the unique index already has it"""
+    dialect = db.get_bind().dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        if dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        db.execute(
+            dialect_insert(PromptVersion).values(**values).on_conflict_do_nothing(
+                index_elements=["version_label"],
+                index_where=PromptVersion.prompt_id.is_(None),
+            )
+        )
+        return
+    
+    try:
+        with db.begin_nested():
+            db.execute(insert(PromptVersion).values(**values))
+    except IntegrityError:
+        pass  # Another request created it first
+
+
+@track_event("scratchpad_version")
+def get_or_create_scratchpad_version(db: Session, style: str, model: str) -> Optional[int]:
     """
     Get or create a scratchpad version for ad-hoc runs.
     This ensures all runs have a version, even in sandbox mode.
     
+    Ids are cached per process (SCRATCHPAD_CACHE_TTL_S) and creation is an
+    INSERT ... ON CONFLICT DO NOTHING against the unique scratchpad index, so
+    concurrent first requests for a style all resolve to the same row.
+    
     Args:
         db: Database session
         style: Prompt style
         model: Model name
     
     Returns:
-        version_id: ID of the scratchpad version
+        version_id: ID of the scratchpad version, or None if it could not be resolved
     """
+    label = scratchpad_label(style)
+    cached = _cached_scratchpad_version(label)
+    if cached is not None:
+        return cached
+    
     try:
-        # Look for existing scratchpad version with this style
-        version = db.query(PromptVersion).filter(
-            PromptVersion.version_label == f"scratchpad-{style}",
-            PromptVersion.prompt_id == None
-        ).first()
+        lookup = select(PromptVersion.id).where(
+            PromptVersion.version_label == label,
+            PromptVersion.prompt_id.is_(None)
+        )
+        version_id = db.scalar(lookup)
         
-        if not version:
+        if version_id is None:
             # Create new scratchpad version
-            version = PromptVersion(
-                prompt_id=None,
-                version_label=f"scratchpad-{style}",
-                model=model,
-                params_json="{}",
-                changelog="Auto-created scratchpad version"
-            )
-            db.add(version)
+            _insert_version_if_absent(db, {
+                "prompt_id": None,
+                "version_label": label,
+                "model": model,
+                "params_json": "{}",
+                "changelog": "Auto-created scratchpad version",
+            })
             db.commit()
-            db.refresh(version)
-            logger.info(f"[TELEMETRY] Created scratchpad version {version.id} for style={style}")
+            version_id = db.scalar(lookup)
+            logger.info(f"[TELEMETRY] Resolved scratchpad version {version_id} for style={style}")
         
-        return version.id
+        if version_id is not None:
+            with _scratchpad_lock:
+                _scratchpad_versions[label] = (version_id, time.monotonic())
+        return version_id
         
     except Exception as e:
         logger.error(f"[TELEMETRY] Failed to create scratchpad version: {e}")
         db.rollback()
-        # Return a sentinel value if creation fails
-        return 1  # Assume version 1 exists as fallback
+        return None
+
+
+def dedupe_prompt_versions(conn) -> int:
+    """
+    Merge duplicate (prompt_id, version_label) rows left by older racing inserts.
+    Runs are re-pointed at the oldest row of each group before the rest are deleted.
+    
+    Returns:
+        count: Number of duplicate rows removed
+    """
+    table = PromptVersion.__table__
+    groups = conn.execute(
+        select(table.c.prompt_id, table.c.version_label, func.min(table.c.id))
+        .group_by(table.c.prompt_id, table.c.version_label)
+        .having(func.count(table.c.id) > 1)
+    ).all()
+    
+    removed = 0
+    for prompt_id, label, keep_id in groups:
+        same_prompt = table.c.prompt_id.is_(None) if prompt_id is None else table.c.prompt_id == prompt_id
+        dup_ids = conn.scalars(
+            select(table.c.id).where(same_prompt, table.c.version_label == label, table.c.id != keep_id)
+        ).all()
+        conn.execute(update(Run).where(Run.prompt_version_id.in_(dup_ids)).values(prompt_version_id=keep_id))
+        conn.execute(delete(PromptVersion).where(PromptVersion.id.in_(dup_ids)))
+        removed += len(dup_ids)
+    
+    if removed:
+        logger.warning(f"[TELEMETRY] Removed {removed} duplicate prompt version(s)")
+        invalidate_scratchpad_cache()
+    return removed
 
 
 def get_run_stats(db: Session, limit: int = 100) -> Dict[str, Any]:
@@ -196,3 +527,58 @@ def get_run_stats(db: Session, limit: int = 100) -> Dict[str, Any]:
             "success_rate": 0.0
         }
 
+
+
+# Async variants for the async request path. Each runs the sync implementation
+# through AsyncSession.run_sync: the statements are awaited on the event loop
+# via the async driver, so no threadpool worker is held while the DB responds.
+# With write-behind on, they queue rows with put_many_async instead: inside
+# run_sync a full queue (block policy) would be waited on from the loop.
+
+async def record_run_async(db: AsyncSession, **kwargs: Any) -> int:
+    """record_run on an AsyncSession (same keyword arguments and return value)"""
+    if get_telemetry_writer() is not None:
+        run_ids = await record_runs_async(db, [kwargs])
+        return run_ids[0] if run_ids else -1
+    return await db.run_sync(lambda session: record_run(session, **kwargs))
+
+
+async def record_runs_async(db: AsyncSession, runs: List[Dict[str, Any]]) -> List[int]:
+    """record_runs on an AsyncSession"""
+    writer = get_telemetry_writer()
+    if writer is None:
+        return await db.run_sync(record_runs, runs)
+    
+    skipped = [r["style"] for r in runs if r.get("prompt_version_id") is None]
+    if skipped:
+        logger.error(f"[TELEMETRY] No prompt version for styles={skipped}; runs not recorded")
+    items = [("run", build_run_row(**r)) for r in runs if r.get("prompt_version_id") is not None]
+    return [0 if queued else -1 for queued in await writer.put_many_async(items)]
+
+
+async def record_comparisons_async(db: AsyncSession, comparisons: List[Dict[str, Any]],
+                                   encoded: Optional[Dict[str, Any]] = None) -> int:
+    """
+    record_comparisons on an AsyncSession. The prompt texts are hashed and
+    encoded in the threadpool first (unless `encoded` is passed), so only the
+    statements run on the event loop.
+    """
+    writer = get_telemetry_writer()
+    if writer is not None:
+        return sum(await writer.put_many_async([("comparison", c) for c in comparisons]))
+    if comparisons and encoded is None:
+        encoded = await anyio.to_thread.run_sync(encode_comparisons, comparisons)
+    return await db.run_sync(record_comparisons, comparisons, encoded)
+
+
+async def get_or_create_scratchpad_version_async(db: AsyncSession, style: str, model: str) -> Optional[int]:
+    """get_or_create_scratchpad_version on an AsyncSession; cached ids skip the DB entirely"""
+    cached = _cached_scratchpad_version(scratchpad_label(style))
+    if cached is not None:
+        return cached
+    return await db.run_sync(get_or_create_scratchpad_version, style, model)
+
+
+async def get_run_stats_async(db: AsyncSession) -> Dict[str, Any]:
+    """get_run_stats on an AsyncSession"""
+    return await db.run_sync(get_run_stats)
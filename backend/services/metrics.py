@@ -0,0 +1,346 @@
+"""
+In-process metrics in the Prometheus text format.
+Counters, gauges and fixed-bucket histograms that are cheap enough to leave
+on in production (one lock round trip per update, no allocation on the hot
+path). `track_event` times functions and inner stages; MetricsMiddleware
+times every HTTP request by route template. GET /metrics renders everything.
+
+Series:
+    promptgauge_event_duration_seconds{event}            histogram
+    promptgauge_events_in_flight{event}                  gauge
+    promptgauge_event_errors_total{event,error}          counter
+    promptgauge_http_request_duration_seconds{method,route,status}  histogram
+    promptgauge_http_requests_in_flight{method}          gauge
+"""
+
+import os
+import abc
+import time
+import inspect
+import threading
+from bisect import bisect_left
+from collections import deque
+from functools import wraps
+from typing import Dict, List, Sequence, Tuple
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ["true", "1", "yes"]
+# Histogram bucket upper bounds in seconds (comma-separated)
+METRICS_BUCKETS_S = tuple(
+    float(b) for b in os.getenv(
+        "METRICS_BUCKETS_S", "0.0005,0.001,0.0025,0.005,0.01,0.025,0.05,0.1,0.25,0.5,1,2.5,5,10,30"
+    ).split(",")
+)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+Labels = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class _Metric(abc.ABC):
+    """Common parts of a labelled metric family"""
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+    @abc.abstractmethod
+    def render(self) -> List[str]:
+        """Exposition lines for every series, starting with the HELP/TYPE header"""
+
+
+class _Value:
+    """One counter series"""
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value += amount
+
+
+class Counter(_Metric):
+    """Monotonic counter per label set"""
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help_text, labelnames)
+        self._series: Dict[Labels, _Value] = {}
+
+    def labels(self, *values: str) -> _Value:
+        """The series for a label set; hold on to it to skip the lookup on hot paths"""
+        series = self._series.get(values)
+        if series is None:
+            with self._lock:
+                series = self._series.setdefault(values, _Value())
+        return series
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        self.labels(*labels).inc(amount)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            series = sorted(self._series.items())
+        return self._header() + [
+            f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(s.value)}" for labels, s in series
+        ]
+
+
+class _Running:
+    """Calls currently inside a tracked block; deque appends and pops are thread-safe without a lock"""
+    __slots__ = ("_calls",)
+
+    def __init__(self):
+        self._calls = deque()
+
+    def enter(self) -> None:
+        self._calls.append(None)
+
+    def exit(self) -> None:
+        self._calls.pop()
+
+    @property
+    def value(self) -> int:
+        return len(self._calls)
+
+
+class InFlightGauge(Counter):
+    """Gauge of calls in progress per label set"""
+    kind = "gauge"
+
+    def labels(self, *values: str) -> _Running:
+        series = self._series.get(values)
+        if series is None:
+            with self._lock:
+                series = self._series.setdefault(values, _Running())
+        return series
+
+
+class _Buckets:
+    """One histogram series: per-bucket counts (the last is +Inf), sum and count"""
+    __slots__ = ("bounds", "counts", "sum", "count", "_lock")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        index = bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def read(self) -> Tuple[List[int], float, int]:
+        with self._lock:
+            return list(self.counts), self.sum, self.count
+
+
+class Histogram(Counter):
+    """Fixed-bucket histogram per label set (bucket upper bounds in seconds)"""
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = METRICS_BUCKETS_S):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def labels(self, *values: str) -> _Buckets:
+        series = self._series.get(values)
+        if series is None:
+            with self._lock:
+                series = self._series.setdefault(values, _Buckets(self.buckets))
+        return series
+
+    def observe(self, value: float, *labels: str) -> None:
+        self.labels(*labels).observe(value)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            series = sorted(self._series.items())
+        lines = self._header()
+        names = self.labelnames + ("le",)
+        for labels, s in series:
+            counts, total, count = s.read()
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                lines.append(f"{self.name}_bucket{_format_labels(names, labels + (_format_value(bound),))} {cumulative}")
+            label_text = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_text} {repr(total)}")
+            lines.append(f"{self.name}_count{label_text} {count}")
+        return lines
+
+
+REGISTRY: List[_Metric] = []
+
+EVENT_DURATION = Histogram(
+    "promptgauge_event_duration_seconds", "Time spent in a tracked function or stage", ["event"]
+)
+EVENTS_IN_FLIGHT = InFlightGauge("promptgauge_events_in_flight", "Tracked calls currently running", ["event"])
+EVENT_ERRORS = Counter(
+    "promptgauge_event_errors_total", "Tracked calls that raised, by exception type", ["event", "error"]
+)
+HTTP_DURATION = Histogram(
+    "promptgauge_http_request_duration_seconds", "HTTP request latency until the response is sent",
+    ["method", "route", "status"]
+)
+HTTP_IN_FLIGHT = InFlightGauge("promptgauge_http_requests_in_flight", "HTTP requests being served", ["method"])
+
+
+def render_metrics() -> str:
+    """Every registered metric in the Prometheus text exposition format"""
+    lines: List[str] = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def track_event(event_name: str):
+    """
+    Decorator that records a latency histogram, an in-flight gauge and an
+    error counter for a function under `event_name`.
+
+    Works on plain functions, coroutines and (async) generators; a generator
+    is timed until it is exhausted or closed. Cancellation and an early
+    close aren't counted as errors. With METRICS_ENABLED off the
+    function is returned unchanged.
+
+    Usage:
+        @track_event("generate_call")
+        def generate(...):
+            ...
+    """
+    def decorator(func):
+        if not METRICS_ENABLED:
+            return func
+        duration = EVENT_DURATION.labels(event_name)
+        in_flight = EVENTS_IN_FLIGHT.labels(event_name)
+        perf_counter = time.perf_counter
+
+        def failed(e: Exception) -> None:
+            EVENT_ERRORS.inc(event_name, type(e).__name__)
+
+        if inspect.isasyncgenfunction(func):
+            @wraps(func)
+            async def asyncgen_wrapper(*args, **kwargs):
+                in_flight.enter()
+                start = perf_counter()
+                try:
+                    async for item in func(*args, **kwargs):
+                        yield item
+                except Exception as e:
+                    failed(e)
+                    raise
+                finally:
+                    duration.observe(perf_counter() - start)
+                    in_flight.exit()
+            return asyncgen_wrapper
+
+        if inspect.iscoroutinefunction(func):
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                in_flight.enter()
+                start = perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                except Exception as e:
+                    failed(e)
+                    raise
+                finally:
+                    duration.observe(perf_counter() - start)
+                    in_flight.exit()
+            return async_wrapper
+
+        if inspect.isgeneratorfunction(func):
+            @wraps(func)
+            def gen_wrapper(*args, **kwargs):
+                in_flight.enter()
+                start = perf_counter()
+                try:
+                    yield from func(*args, **kwargs)
+                except Exception as e:
+                    failed(e)
+                    raise
+                finally:
+                    duration.observe(perf_counter() - start)
+                    in_flight.exit()
+            return gen_wrapper
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            in_flight.enter()
+            start = perf_counter()
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                failed(e)
+                raise
+            finally:
+                duration.observe(perf_counter() - start)
+                in_flight.exit()
+        return wrapper
+    return decorator
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware timing each HTTP request until its response has been
+    sent (streamed bodies included), labelled by the matched route template
+    so /runs?cursor=... and /export/runs don't each get their own series.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        in_flight = HTTP_IN_FLIGHT.labels(method)
+        in_flight.enter()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            HTTP_DURATION.observe(time.perf_counter() - start, method, route, str(status))
+            in_flight.exit()
@@ -0,0 +1,265 @@
+"""
+Opt-in per-request profiling.
+A request is profiled when it carries `X-Profile: <PROFILE_TOKEN>`, or when
+it is picked by 1-in-PROFILE_SAMPLE_N sampling. While it runs, a sampling
+thread records the Python stack of every busy thread every
+PROFILE_INTERVAL_MS. That covers the handler on the event loop and the
+heuristics it hands to the threadpool. The most recent PROFILE_KEEP
+profiles are kept in memory under a server-generated id (the client's
+X-Request-ID is recorded alongside, never used as the key), and returned
+as top-N hot functions or as collapsed stacks for flamegraph.pl /
+speedscope:
+
+    GET /profiles                    recent profiles, newest first
+    GET /profiles/{id}               top functions by self and total samples
+    GET /profiles/{id}/collapsed     "frame;frame;frame count" lines
+
+Profiles expose internal stacks and request paths, so everything here
+needs PROFILE_TOKEN: the /profiles endpoints require it in X-Profile, and
+PROFILE_SAMPLE_N is ignored without it. With no token the middleware isn't
+installed, so there is no per-request cost. One request is profiled at a time; stacks of other
+requests running meanwhile show up in it too. Profiles live in the process
+that served the request.
+"""
+
+import os
+import sys
+import hmac
+import time
+import uuid
+import logging
+import linecache
+import threading
+from collections import Counter, OrderedDict
+from datetime import datetime
+from itertools import count
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Requests sending `X-Profile: <token>` are profiled (unset disables the header)
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")
+# Profile one request in N (0 disables sampling; needs PROFILE_TOKEN too)
+PROFILE_SAMPLE_N = int(os.getenv("PROFILE_SAMPLE_N", "0"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "1"))
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "50"))
+PROFILE_TOP_N = int(os.getenv("PROFILE_TOP_N", "30"))
+
+# Leaf frames of threads that are parked, not working: the event loop in
+# select (or an idle uvloop), idle threadpool workers, writers waiting on a
+# queue. A string narrows it to frames currently on a line containing it,
+# e.g. aiosqlite's worker is idle in tx.get() but busy running a query.
+IDLE_FRAMES = {
+    ("selectors.py", "select"): None,
+    ("runners.py", "run"): None,
+    ("threading.py", "wait"): None,
+    ("queue.py", "get"): None,
+    ("core.py", "_connection_worker_thread"): "tx.get()",
+}
+MAX_STACK_DEPTH = 128
+
+
+if PROFILE_SAMPLE_N > 0 and not PROFILE_TOKEN:
+    logger.warning("[PROFILE] PROFILE_SAMPLE_N is set without PROFILE_TOKEN; profiling stays off")
+
+
+def profiling_enabled() -> bool:
+    return bool(PROFILE_TOKEN)
+
+
+def token_matches(value: Optional[str]) -> bool:
+    """True if `value` is PROFILE_TOKEN (constant-time comparison); always False with no token set"""
+    if not PROFILE_TOKEN or value is None:
+        return False
+    return hmac.compare_digest(value.encode("utf-8"), PROFILE_TOKEN.encode("utf-8"))
+
+
+def _is_idle(frame) -> bool:
+    code = frame.f_code
+    key = (os.path.basename(code.co_filename), code.co_name)
+    if key not in IDLE_FRAMES:
+        return False
+    line = IDLE_FRAMES[key]
+    return line is None or line in linecache.getline(code.co_filename, frame.f_lineno)
+
+
+def _frame_label(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    """Background thread counting the busy Python stacks of every other thread"""
+
+    def __init__(self, interval_s: float = PROFILE_INTERVAL_MS / 1000):
+        self.interval_s = interval_s
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+    def start(self) -> None:
+        # A CPU-bound thread only hands over the GIL every switch interval
+        # (5ms by default); shorten it so samples land every interval_s
+        self._switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(min(self._switch_interval, self.interval_s))
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+        sys.setswitchinterval(self._switch_interval)
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        names = {t.ident: t.name for t in threading.enumerate()}
+        while not self._stop.wait(self.interval_s):
+            self.samples += 1
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                if _is_idle(frame):
+                    continue
+                stack = []
+                while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                    stack.append(_frame_label(frame.f_code))
+                    frame = frame.f_back
+                if ident not in names:
+                    names = {t.ident: t.name for t in threading.enumerate()}
+                stack.append(names.get(ident, f"thread-{ident}"))
+                self.stacks[tuple(reversed(stack))] += 1
+
+
+def top_functions(stacks: Counter, n: int = PROFILE_TOP_N) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Hottest functions of a stack profile.
+
+    Returns:
+        top: "self" (samples with the function on top of the stack) and
+            "total" (samples with it anywhere on the stack), n of each
+    """
+    own: Counter = Counter()
+    total: Counter = Counter()
+    for stack, samples in stacks.items():
+        frames = stack[1:]  # drop the thread name
+        if not frames:
+            continue
+        own[frames[-1]] += samples
+        for frame in set(frames):
+            total[frame] += samples
+    return {
+        "self": [{"function": f, "samples": s} for f, s in own.most_common(n)],
+        "total": [{"function": f, "samples": s} for f, s in total.most_common(n)],
+    }
+
+
+def collapse(stacks: Counter) -> str:
+    """Collapsed-stack text ("root;...;leaf count" per line)"""
+    return "".join(
+        ";".join(frame.replace(";", ":") for frame in stack) + f" {samples}\n"
+        for stack, samples in sorted(stacks.items())
+    )
+
+
+class ProfileStore:
+    """The most recent profiles, oldest dropped first"""
+
+    def __init__(self, keep: int = PROFILE_KEEP):
+        self.keep = keep
+        self._profiles: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, profile: Dict[str, Any]) -> None:
+        with self._lock:
+            self._profiles[profile["id"]] = profile
+            self._profiles.move_to_end(profile["id"])
+            while len(self._profiles) > self.keep:
+                self._profiles.popitem(last=False)
+
+    def get(self, profile_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self._profiles.get(profile_id)
+
+    def list(self) -> List[Dict[str, Any]]:
+        """Summaries, newest first"""
+        with self._lock:
+            profiles = list(reversed(self._profiles.values()))
+        return [{k: v for k, v in p.items() if k != "stacks"} for p in profiles]
+
+
+_store = ProfileStore()
+
+
+def get_profile_store() -> ProfileStore:
+    return _store
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware that samples the stacks of requests picked by the
+    X-Profile header or by 1-in-N sampling, and tags their response with
+    X-Profile-Id. Only installed when profiling_enabled().
+    """
+
+    def __init__(self, app, store: ProfileStore = _store):
+        self.app = app
+        self.store = store
+        self._requests = count(1)
+        self._busy = threading.Lock()
+
+    def _wanted(self, scope) -> bool:
+        if scope["path"].startswith("/profiles"):
+            return False
+        if not PROFILE_TOKEN:
+            return False
+        for name, value in scope["headers"]:
+            if name == b"x-profile":
+                return token_matches(value.decode("latin-1"))
+        return PROFILE_SAMPLE_N > 0 and next(self._requests) % PROFILE_SAMPLE_N == 0
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self._wanted(scope) or not self._busy.acquire(blocking=False):
+            await self.app(scope, receive, send)
+            return
+
+        # Our own id, so a client can't overwrite another request's profile
+        profile_id = uuid.uuid4().hex
+        request_id = dict(scope["headers"]).get(b"x-request-id", b"").decode("latin-1")[:64] or None
+        status = 500
+
+        async def send_with_id(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message = {**message, "headers": [*message.get("headers", []),
+                                                  (b"x-profile-id", profile_id.encode("latin-1"))]}
+            await send(message)
+
+        sampler = StackSampler()
+        started_at = datetime.utcnow()
+        start = time.perf_counter()
+        sampler.start()
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            sampler.stop()
+            self._busy.release()
+            self.store.add({
+                "id": profile_id,
+                "request_id": request_id,
+                "method": scope["method"],
+                "path": scope["path"],
+                "route": getattr(scope.get("route"), "path", None),
+                "status": status,
+                "started_at": started_at.isoformat(),
+                "duration_ms": round((time.perf_counter() - start) * 1000, 2),
+                "interval_ms": sampler.interval_s * 1000,
+                "samples": sampler.samples,
+                "stacks": sampler.stacks,
+            })
+
+
+def profile_detail(profile: Dict[str, Any], n: int = PROFILE_TOP_N) -> Dict[str, Any]:
+    """A stored profile with its top functions instead of the raw stacks"""
+    out = {k: v for k, v in profile.items() if k != "stacks"}
+    out["top"] = top_functions(profile["stacks"], n)
+    return out
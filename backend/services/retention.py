@@ -0,0 +1,259 @@
+"""
+Retention.
+Runs (with their run items) and comparisons older than RETENTION_DAYS are
+moved out of the database into gzipped NDJSON files under ARCHIVE_DIR,
+partitioned by dataset and month:
+
+    archive/runs/2026-01/0000000001-0000005000.ndjson.gz
+
+Work is done RETENTION_BATCH_ROWS at a time. Each batch is written to disk
+first, then deleted in one short transaction that also records the files in
+archive_files and adds the rows' counters to archived_daily_stats, so
+/stats/me and rollup rebuilds keep counting them. A batch interrupted before
+its commit is redone on the next pass (same rows, same file names).
+
+Archived rows stay readable through the export path (archived=true).
+SQLite doesn't shrink the database file; freed pages are reused by new rows.
+Prompt texts the archived rows referenced stay in the blob store until
+`python -m services.blobs gc`.
+
+From backend/:
+    python -m services.retention archive [--days 90] [--dry-run]
+    python -m services.retention status
+"""
+
+import os
+import json
+import gzip
+import time
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from sqlalchemy import delete, exists, func, insert, select
+from sqlalchemy.orm import Session
+from models import ArchivedDailyStats, ArchiveFile, Run, RunItem, PromptScore, PromptTransformation
+from services.export import EXPORTS, ExportEncoder
+from services.rollups import COUNTERS, bump_daily_stats, run_deltas
+
+logger = logging.getLogger(__name__)
+
+# Rows older than this many days are archived (0 disables retention)
+RETENTION_DAYS = int(os.getenv("RETENTION_DAYS", "90"))
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "archive")
+RETENTION_BATCH_ROWS = int(os.getenv("RETENTION_BATCH_ROWS", "5000"))
+# Pause between batches so request writers get the lock in between
+RETENTION_BATCH_PAUSE_S = float(os.getenv("RETENTION_BATCH_PAUSE_S", "0.05"))
+
+
+def archive_cutoff(days: int = RETENTION_DAYS) -> datetime:
+    """Rows created before this are due for archiving"""
+    return datetime.utcnow() - timedelta(days=days)
+
+
+def write_archive_files(dataset: str, rows: Sequence[Any], archive_dir: str = ARCHIVE_DIR) -> List[Dict[str, Any]]:
+    """
+    Write export-shaped rows to one gzipped NDJSON file per month.
+
+    Returns:
+        files: archive_files rows describing what was written
+    """
+    export = EXPORTS[dataset]
+    by_month: Dict[str, List[Any]] = defaultdict(list)
+    for row in rows:
+        by_month[row.created_at.strftime("%Y-%m")].append(row)
+
+    files = []
+    for month, month_rows in sorted(by_month.items()):
+        ids = [row.id for row in month_rows]
+        created = [row.created_at for row in month_rows]
+        path = f"{dataset}/{month}/{min(ids):010d}-{max(ids):010d}.ndjson.gz"
+        full_path = os.path.join(archive_dir, path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+
+        encoder = ExportEncoder(export.fields, "ndjson", gzip=True)
+        tmp_path = full_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(encoder.encode(export.materialize(month_rows)))
+            f.write(encoder.finish())
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, full_path)
+
+        files.append({
+            "dataset": dataset,
+            "path": path,
+            "rows": len(month_rows),
+            "min_id": min(ids),
+            "max_id": max(ids),
+            "min_created_at": min(created),
+            "max_created_at": max(created),
+        })
+    return files
+
+
+def archive_runs_batch(db: Session, cutoff: datetime, batch_rows: int = RETENTION_BATCH_ROWS,
+                       archive_dir: str = ARCHIVE_DIR) -> int:
+    """Archive and delete the oldest batch of runs (and their run items); returns runs moved"""
+    runs = db.execute(EXPORTS["runs"].query(until=cutoff).limit(batch_rows)).all()
+    if not runs:
+        return 0
+    run_ids = [row.id for row in runs]
+    items = db.execute(EXPORTS["run_items"].query().where(RunItem.run_id.in_(run_ids))).all()
+    # End the read snapshot before the file I/O: on SQLite a transaction that
+    # read and then writes fails outright if another writer committed meanwhile
+    db.rollback()
+
+    files = write_archive_files("runs", runs, archive_dir)
+    if items:
+        files += write_archive_files("run_items", items, archive_dir)
+
+    db.execute(delete(RunItem).where(RunItem.run_id.in_(run_ids)))
+    db.execute(delete(Run).where(Run.id.in_(run_ids)))
+    bump_daily_stats(db, run_deltas(row._mapping for row in runs), table=ArchivedDailyStats)
+    db.execute(insert(ArchiveFile), files)
+    db.commit()
+    return len(runs)
+
+
+def archive_comparisons_batch(db: Session, cutoff: datetime, batch_rows: int = RETENTION_BATCH_ROWS,
+                              archive_dir: str = ARCHIVE_DIR) -> int:
+    """Archive and delete the oldest batch of comparisons (transformation + before score); returns rows moved"""
+    rows = db.execute(EXPORTS["comparisons"].query(until=cutoff).limit(batch_rows)).all()
+    if not rows:
+        return 0
+    db.rollback()
+
+    files = write_archive_files("comparisons", rows, archive_dir)
+    deltas: Dict[Any, Dict[str, int]] = defaultdict(lambda: dict.fromkeys(COUNTERS, 0))
+    for row in rows:
+        deltas[row.created_at.date()]["transforms"] += 1
+
+    db.execute(delete(PromptTransformation).where(PromptTransformation.id.in_([row.id for row in rows])))
+    db.execute(delete(PromptScore).where(
+        PromptScore.id.in_([row.before_id for row in rows]),
+        ~exists().where(PromptTransformation.before_id == PromptScore.id),
+    ))
+    bump_daily_stats(db, deltas, table=ArchivedDailyStats)
+    db.execute(insert(ArchiveFile), files)
+    db.commit()
+    return len(rows)
+
+
+ARCHIVERS = {
+    "runs": (Run, archive_runs_batch),
+    "comparisons": (PromptTransformation, archive_comparisons_batch),
+}
+
+
+def count_due(db: Session, cutoff: datetime) -> Dict[str, int]:
+    """Rows per archivable dataset created before cutoff"""
+    return {
+        name: db.scalar(select(func.count(model.id)).where(model.created_at < cutoff))
+        for name, (model, _) in ARCHIVERS.items()
+    }
+
+
+def archive_old_rows(
+    db: Session,
+    days: int = RETENTION_DAYS,
+    batch_rows: int = RETENTION_BATCH_ROWS,
+    pause_s: float = RETENTION_BATCH_PAUSE_S,
+    archive_dir: str = ARCHIVE_DIR,
+) -> Dict[str, int]:
+    """
+    Move every run and comparison older than `days` into archive files.
+
+    Args:
+        db: Database session
+        days: Retention horizon in days (must be positive)
+        batch_rows: Rows per batch (one file per month touched, one transaction)
+        pause_s: Sleep between batches
+        archive_dir: Root directory for the archive files
+
+    Returns:
+        moved: Rows archived per dataset
+    """
+    if days <= 0:
+        raise ValueError("Retention horizon must be at least one day")
+    cutoff = archive_cutoff(days)
+    moved = {}
+    for name, (_, archive_batch) in ARCHIVERS.items():
+        moved[name] = 0
+        while True:
+            count = archive_batch(db, cutoff, batch_rows, archive_dir)
+            if not count:
+                break
+            moved[name] += count
+            logger.info(f"[RETENTION] Archived {moved[name]} {name} row(s) so far")
+            if pause_s:
+                time.sleep(pause_s)
+    return moved
+
+
+def archive_file_paths(db: Session, dataset: str, since: Optional[datetime] = None,
+                       until: Optional[datetime] = None) -> List[str]:
+    """Archive files of a dataset that may hold rows in [since, until), oldest first"""
+    query = select(ArchiveFile.path).where(ArchiveFile.dataset == dataset)
+    if since is not None:
+        query = query.where(ArchiveFile.max_created_at >= since)
+    if until is not None:
+        query = query.where(ArchiveFile.min_created_at < until)
+    return list(db.scalars(query.order_by(ArchiveFile.min_created_at, ArchiveFile.min_id)))
+
+
+def read_archive_file(path: str, fields: Sequence[str], since: Optional[datetime] = None,
+                      until: Optional[datetime] = None, archive_dir: str = ARCHIVE_DIR) -> List[Tuple[Any, ...]]:
+    """Rows of one archive file in `fields` order, filtered to [since, until) on created_at"""
+    rows = []
+    with gzip.open(os.path.join(archive_dir, path), "rt", encoding="utf-8") as f:
+        for line in f:
+            record = json.loads(line)
+            if since is not None or until is not None:
+                created_at = datetime.fromisoformat(record["created_at"])
+                if (since is not None and created_at < since) or (until is not None and created_at >= until):
+                    continue
+            rows.append(tuple(record.get(field) for field in fields))
+    return rows
+
+
+def archive_status(db: Session, days: int = RETENTION_DAYS) -> Dict[str, Any]:
+    """Archived files/rows per dataset, and live rows currently past the horizon"""
+    archived = {
+        dataset: {"files": files, "rows": rows or 0}
+        for dataset, files, rows in db.execute(
+            select(ArchiveFile.dataset, func.count(ArchiveFile.id), func.sum(ArchiveFile.rows))
+            .group_by(ArchiveFile.dataset)
+        )
+    }
+    status: Dict[str, Any] = {"retention_days": days, "archive_dir": ARCHIVE_DIR, "archived": archived}
+    if days > 0:
+        status["due"] = count_due(db, archive_cutoff(days))
+    return status
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    import argparse
+    from db import SessionLocal, init_db
+
+    parser = argparse.ArgumentParser(description="Archive old telemetry rows into compressed files")
+    parser.add_argument("command", choices=["archive", "status"])
+    parser.add_argument("--days", type=int, default=RETENTION_DAYS, help="Retention horizon in days")
+    parser.add_argument("--batch-rows", type=int, default=RETENTION_BATCH_ROWS)
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would be archived")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    init_db()
+    with SessionLocal() as db:
+        if args.command == "status" or args.dry_run:
+            print(json.dumps(archive_status(db, args.days), indent=2))
+            return
+        if args.days <= 0:
+            parser.error("retention is disabled (RETENTION_DAYS/--days is 0)")
+        moved = archive_old_rows(db, args.days, args.batch_rows)
+    print(f"Archived: {', '.join(f'{n} {name}' for name, n in moved.items())}")
+
+
+if __name__ == "__main__":
+    main()
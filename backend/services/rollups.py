@@ -0,0 +1,179 @@
+"""
+Per-day stats rollups.
+daily_stats holds one row of counters per UTC day (runs, completed runs,
+prompt transformations). Run and compare writes bump it in their own
+transaction, so /stats/me sums a few small rows instead of counting the
+full history. Rows moved out by retention are counted in
+archived_daily_stats, which a rebuild adds back in.
+
+Rebuild from the raw tables (after restores, manual deletes, etc.), from backend/:
+    python -m services.rollups rebuild
+"""
+
+import logging
+from collections import defaultdict
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, List, Optional
+from sqlalchemy import case, delete, func, insert, select, text, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from models import ArchivedDailyStats, DailyStats, Run, PromptTransformation
+
+logger = logging.getLogger(__name__)
+
+COUNTERS = ("runs", "completed_runs", "transforms")
+
+
+def run_deltas(rows: Iterable[Dict[str, Any]]) -> Dict[date, Dict[str, int]]:
+    """Counter deltas for Run rows (as built by logger.build_run_row)"""
+    deltas: Dict[date, Dict[str, int]] = defaultdict(lambda: dict.fromkeys(COUNTERS, 0))
+    for row in rows:
+        day = (row.get("created_at") or datetime.utcnow()).date()
+        deltas[day]["runs"] += 1
+        if row.get("finished_at") is not None:
+            deltas[day]["completed_runs"] += 1
+    return deltas
+
+
+def transform_deltas(count: int, created_at: datetime) -> Dict[date, Dict[str, int]]:
+    """Counter deltas for `count` PromptTransformation rows created at created_at"""
+    return {created_at.date(): {"runs": 0, "completed_runs": 0, "transforms": count}}
+
+
+def bump_daily_stats(db: Session, deltas: Dict[date, Dict[str, int]], table=DailyStats) -> None:
+    """
+    Add counter deltas to daily_stats (or archived_daily_stats) without
+    committing, so the bump lands in the same transaction as the rows it counts.
+    """
+    now = datetime.utcnow()
+    dialect = db.get_bind().dialect.name
+    # Fixed order so concurrent writers lock day rows in the same sequence
+    for day, counts in sorted(deltas.items()):
+        if not any(counts.values()):
+            continue
+        values = {"day": day, **{c: counts.get(c, 0) for c in COUNTERS}, "updated_at": now}
+
+        if dialect in ("sqlite", "postgresql"):
+            if dialect == "sqlite":
+                from sqlalchemy.dialects.sqlite import insert as dialect_insert
+            else:
+                from sqlalchemy.dialects.postgresql import insert as dialect_insert
+            stmt = dialect_insert(table).values(**values)
+            db.execute(stmt.on_conflict_do_update(
+                index_elements=["day"],
+                set_={
+                    **{c: getattr(table, c) + stmt.excluded[c] for c in COUNTERS},
+                    "updated_at": now,
+                },
+            ))
+            continue
+
+        increment = update(table).where(table.day == day).values(
+            **{c: getattr(table, c) + counts.get(c, 0) for c in COUNTERS}, updated_at=now
+        )
+        if db.execute(increment).rowcount:
+            continue
+        try:
+            with db.begin_nested():
+                db.execute(insert(table).values(**values))
+        except IntegrityError:
+            db.execute(increment)  # Another request created the day first
+
+
+def read_totals(db: Session, since: date) -> Dict[str, int]:
+    """
+    All-time counter totals plus totals for days on or after `since`,
+    from one aggregate over daily_stats.
+    """
+    recent = DailyStats.day >= since
+    row = db.execute(select(
+        func.coalesce(func.sum(DailyStats.runs), 0),
+        func.coalesce(func.sum(DailyStats.completed_runs), 0),
+        func.coalesce(func.sum(DailyStats.transforms), 0),
+        func.coalesce(func.sum(case((recent, DailyStats.runs), else_=0)), 0),
+        func.coalesce(func.sum(case((recent, DailyStats.transforms), else_=0)), 0),
+    )).one()
+    return {
+        "total_runs": row[0],
+        "completed_runs": row[1],
+        "total_transforms": row[2],
+        "recent_runs": row[3],
+        "recent_transforms": row[4],
+    }
+
+
+def _as_date(value) -> date:
+    # SQLite's date() returns 'YYYY-MM-DD' text
+    return value if isinstance(value, date) else date.fromisoformat(value)
+
+
+def rebuild_daily_stats(db: Session) -> int:
+    """
+    Recompute daily_stats from the runs and prompt_transformations tables,
+    plus archived_daily_stats for rows retention has moved out, and commit.
+    Concurrent writers wait for the rebuild (Postgres locks the rollup table;
+    SQLite serializes writers anyway). Don't run it alongside an archive pass.
+
+    Returns:
+        days: Number of day rows written
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        db.execute(text("LOCK TABLE daily_stats IN EXCLUSIVE MODE"))
+
+    deltas: Dict[date, Dict[str, int]] = defaultdict(lambda: dict.fromkeys(COUNTERS, 0))
+    run_day = func.date(Run.created_at)
+    for day, runs, completed in db.execute(
+        select(run_day, func.count(Run.id), func.count(Run.finished_at)).group_by(run_day)
+    ):
+        if day is not None:
+            deltas[_as_date(day)].update(runs=runs, completed_runs=completed)
+
+    transform_day = func.date(PromptTransformation.created_at)
+    for day, transforms in db.execute(
+        select(transform_day, func.count(PromptTransformation.id)).group_by(transform_day)
+    ):
+        if day is not None:
+            deltas[_as_date(day)]["transforms"] = transforms
+
+    for archived in db.scalars(select(ArchivedDailyStats)):
+        for c in COUNTERS:
+            deltas[archived.day][c] += getattr(archived, c)
+
+    now = datetime.utcnow()
+    db.execute(delete(DailyStats))
+    if deltas:
+        db.execute(insert(DailyStats), [
+            {"day": day, **counts, "updated_at": now} for day, counts in sorted(deltas.items())
+        ])
+    db.commit()
+    logger.info(f"[ROLLUPS] Rebuilt daily_stats: {len(deltas)} day(s)")
+    return len(deltas)
+
+
+def backfill_daily_stats(db: Session) -> Optional[int]:
+    """Rebuild daily_stats only if it is empty (first start after upgrading); returns days written"""
+    if db.execute(select(DailyStats.day).limit(1)).first() is not None:
+        return None
+    if all(db.execute(select(column).limit(1)).first() is None
+           for column in (Run.id, PromptTransformation.id, ArchivedDailyStats.day)):
+        return None
+    return rebuild_daily_stats(db)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    import argparse
+    from db import SessionLocal, init_db
+
+    parser = argparse.ArgumentParser(description="Maintain the daily_stats rollup table")
+    parser.add_argument("command", choices=["rebuild"], help="rebuild: recompute every day from raw rows")
+    parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    init_db()
+    with SessionLocal() as db:
+        days = rebuild_daily_stats(db)
+    print(f"daily_stats rebuilt: {days} day(s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Run listing.
+Pages are keyset-paginated on (started_at, id), newest first, so reading page
+N costs the same as reading page 1. Only the RunOut columns are selected.
+"""
+
+import base64
+import binascii
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+from sqlalchemy import select, tuple_
+from sqlalchemy.orm import Session
+from models import Run
+
+# Columns exposed by schemas.RunOut
+RUN_COLUMNS = (
+    Run.id,
+    Run.prompt_version_id,
+    Run.style,
+    Run.model,
+    Run.source,
+    Run.started_at,
+    Run.finished_at,
+    Run.latency_ms,
+    Run.tokens_in,
+    Run.tokens_out,
+    Run.cost,
+)
+
+
+def encode_cursor(started_at: datetime, run_id: int) -> str:
+    """Opaque cursor pointing just past the given run"""
+    raw = f"{started_at.isoformat()}|{run_id}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Inverse of encode_cursor; raises ValueError for malformed cursors"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("utf-8")
+        started_at, run_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(started_at), int(run_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError) as e:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from e
+
+
+def list_runs(
+    db: Session,
+    limit: int = 20,
+    cursor: Optional[str] = None,
+    style: Optional[str] = None,
+    model: Optional[str] = None,
+    source: Optional[str] = None,
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    One page of runs, most recent first.
+
+    Args:
+        db: Database session
+        limit: Page size
+        cursor: next_cursor from the previous page (None for the first page)
+        style, model, source: Optional exact-match filters
+
+    Returns:
+        (rows, next_cursor): RunOut-shaped dicts, and the cursor for the next
+            page (None on the last page)
+    """
+    query = select(*RUN_COLUMNS)
+    if cursor:
+        query = query.where(tuple_(Run.started_at, Run.id) < decode_cursor(cursor))
+    if style:
+        query = query.where(Run.style == style)
+    if model:
+        query = query.where(Run.model == model)
+    if source:
+        query = query.where(Run.source == source)
+
+    # Fetch one extra row to learn whether another page exists
+    query = query.order_by(Run.started_at.desc(), Run.id.desc()).limit(limit + 1)
+    rows = [dict(row) for row in db.execute(query).mappings()]
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]["started_at"], rows[-1]["id"])
+    return rows, next_cursor
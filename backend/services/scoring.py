@@ -4,15 +4,22 @@ Fast, deterministic scoring for prompt quality assessment.
 """
 
 import logging
-from typing import Dict, List, Tuple
+from typing import Dict, FrozenSet, List, Optional, Tuple
+from services.keywords import scan_prompt
+from services.cache import memoize
+from services.metrics import track_event
 
 logger = logging.getLogger(__name__)
 
 
-def score_prompt(prompt: str) -> Dict:
+def score_prompt(prompt: str, hits: Optional[FrozenSet[str]] = None) -> Dict:
     """
     Score a prompt on a 1-10 scale using rule-based heuristics.
     
+    Args:
+        prompt: Prompt text to score
+        hits: Precomputed keyword hits from services.keywords.scan_prompt (optional)
+    
     Returns:
         {
             "score": int (1-10),
@@ -27,20 +34,21 @@ def score_prompt(prompt: str) -> Dict:
         if condition:
             problems.append(message)
     
-    lp = prompt.lower()
+    if hits is None:
+        hits = scan_prompt(prompt)
     
     # Check for common prompt quality issues
-    miss("task:" not in lp and "you are" not in lp, "No explicit task or role")
-    miss("json" not in lp and "format" not in lp, "No explicit output format")
-    miss("example" not in lp and "few-shot" not in lp, "No examples provided")
-    miss("constraints" not in lp and "exactly" not in lp, "No constraints or bounds")
-    miss("acceptance" not in lp and "quality check" not in lp, "No acceptance checks")
-    miss("schema" not in lp and "fields" not in lp, "No schema or fields listed")
+    miss("task:" not in hits and "you are" not in hits, "No explicit task or role")
+    miss("json" not in hits and "format" not in hits, "No explicit output format")
+    miss("example" not in hits and "few-shot" not in hits, "No examples provided")
+    miss("constraints" not in hits and "exactly" not in hits, "No constraints or bounds")
+    miss("acceptance" not in hits and "quality check" not in hits, "No acceptance checks")
+    miss("schema" not in hits and "fields" not in hits, "No schema or fields listed")
     
     # Additional quality checks
     miss(len(prompt.strip()) < 20, "Prompt too short (< 20 chars)")
-    miss("summarize" in lp and "bullet" not in lp and "point" not in lp, "No output structure for summary")
-    miss("extract" in lp and "list" not in lp and "array" not in lp, "No collection format for extraction")
+    miss("summarize" in hits and "bullet" not in hits and "point" not in hits, "No output structure for summary")
+    miss("extract" in hits and "list" not in hits and "array" not in hits, "No collection format for extraction")
     
     # Calculate score (10 - number of problems, capped 1-10)
     base = 10 - len(problems)
@@ -56,7 +64,8 @@ def score_prompt(prompt: str) -> Dict:
     }
 
 
-def optimize_prompt(original_prompt: str, context: str = "") -> Tuple[str, List[str]]:
+def optimize_prompt(original_prompt: str, context: str = "",
+                    hits: Optional[FrozenSet[str]] = None) -> Tuple[str, List[str]]:
     """
     Optimize a prompt by applying fixes for identified problems.
     
@@ -65,12 +74,13 @@ def optimize_prompt(original_prompt: str, context: str = "") -> Tuple[str, List[
     """
     fixes = []
     lines = []
-    lp = original_prompt.lower()
+    if hits is None:
+        hits = scan_prompt(original_prompt)
     
     # Build optimized prompt
     
     # Add role if missing
-    if "task:" not in lp and "you are" not in lp:
+    if "task:" not in hits and "you are" not in hits:
         lines.append("You are a precise and helpful assistant.")
         fixes.append("Added explicit role definition")
     
@@ -81,13 +91,13 @@ def optimize_prompt(original_prompt: str, context: str = "") -> Tuple[str, List[
     lines.append(task_line)
     
     # Add output format if missing
-    if "json" not in lp and "format" not in lp:
+    if "json" not in hits and "format" not in hits:
         lines.append("")
         lines.append("Output format: Provide your response in a clear, structured format.")
         fixes.append("Added output format specification")
     
     # Add constraints if missing
-    if "constraints" not in lp and "exactly" not in lp:
+    if "constraints" not in hits and "exactly" not in hits:
         lines.append("")
         lines.append("Constraints:")
         lines.append("- Be concise and accurate")
@@ -95,7 +105,7 @@ def optimize_prompt(original_prompt: str, context: str = "") -> Tuple[str, List[
         fixes.append("Added constraints for quality control")
     
     # Add quality checks if missing
-    if "acceptance" not in lp and "quality check" not in lp:
+    if "acceptance" not in hits and "quality check" not in hits:
         lines.append("")
         lines.append("Quality checks:")
         lines.append("- Verify all required information is included")
@@ -103,13 +113,13 @@ def optimize_prompt(original_prompt: str, context: str = "") -> Tuple[str, List[
         fixes.append("Added quality acceptance criteria")
     
     # Add schema guidance if JSON mentioned but no schema
-    if ("json" in lp or "JSON" in original_prompt) and "schema" not in lp and "fields" not in lp:
+    if "json" in hits and "schema" not in hits and "fields" not in hits:
         lines.append("")
         lines.append("Required fields: Specify the exact JSON structure needed")
         fixes.append("Added schema/fields specification")
     
     # Add examples if appropriate task type
-    if ("summarize" in lp or "extract" in lp or "classify" in lp) and "example" not in lp:
+    if ("summarize" in hits or "extract" in hits or "classify" in hits) and "example" not in hits:
         lines.append("")
         lines.append("Approach: Follow best practices for this task type")
         fixes.append("Added task-specific guidance")
@@ -119,18 +129,22 @@ def optimize_prompt(original_prompt: str, context: str = "") -> Tuple[str, List[
     return optimized, fixes
 
 
+@track_event("compare_prompts")
+@memoize("compare", key=lambda original, context="": (original, context or ""))
 def compare_prompts(original: str, context: str = "") -> Dict:
     """
     Compare original prompt with optimized version.
+    Pass use_cache=False to bypass the memo cache for this call.
     
     Returns comprehensive before/after analysis.
     """
-    # Score original
-    before = score_prompt(original)
+    # Score original (one keyword scan shared by scoring and optimizing)
+    hits = scan_prompt(original)
+    before = score_prompt(original, hits)
     before["prompt"] = original
     
     # Generate optimized version
-    optimized, fixes = optimize_prompt(original, context)
+    optimized, fixes = optimize_prompt(original, context, hits)
     after = score_prompt(optimized)
     after["prompt"] = optimized
     after["fixes"] = fixes
@@ -148,3 +162,39 @@ def compare_prompts(original: str, context: str = "") -> Dict:
         "improvement_pct": improvement_pct
     }
 
+
+
+def summarize_comparisons(results: List[Dict]) -> Dict:
+    """
+    Aggregate stats over a batch of compare_prompts results.
+    
+    Returns:
+        {
+            "count": int,
+            "avg_before_score": float,
+            "avg_after_score": float,
+            "avg_improvement_pct": float,
+            "min_improvement_pct": int,
+            "max_improvement_pct": int
+        }
+    """
+    count = len(results)
+    if count == 0:
+        return {
+            "count": 0,
+            "avg_before_score": 0.0,
+            "avg_after_score": 0.0,
+            "avg_improvement_pct": 0.0,
+            "min_improvement_pct": 0,
+            "max_improvement_pct": 0
+        }
+    
+    improvements = [r["improvement_pct"] for r in results]
+    return {
+        "count": count,
+        "avg_before_score": round(sum(r["before"]["score"] for r in results) / count, 2),
+        "avg_after_score": round(sum(r["after"]["score"] for r in results) / count, 2),
+        "avg_improvement_pct": round(sum(improvements) / count, 2),
+        "min_improvement_pct": min(improvements),
+        "max_improvement_pct": max(improvements)
+    }
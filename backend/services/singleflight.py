@@ -0,0 +1,157 @@
+"""
+Single-flight request coalescing.
+Concurrent calls with the same key wait on one computation and share its
+result (or its exception). do() serves the sync endpoints FastAPI runs in its
+threadpool; do_async() serves coroutines on the event loop.
+"""
+
+import os
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+# How long a waiter blocks on someone else's in-flight call before giving up
+SINGLEFLIGHT_TIMEOUT_S = float(os.getenv("SINGLEFLIGHT_TIMEOUT_S", "30"))
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """Coalesces concurrent calls that share a key"""
+
+    def __init__(self, name: str, timeout: float = SINGLEFLIGHT_TIMEOUT_S):
+        self.name = name
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self._async_calls: Dict[Hashable, "asyncio.Future[Any]"] = {}
+        self.executions = 0
+        self.collapsed = 0
+        self.timeouts = 0
+        self.errors = 0
+
+    def do(self, key: Hashable, fn: Callable[[], Any], timeout: Optional[float] = None) -> Any:
+        """
+        Run fn once per in-flight key.
+
+        The first caller for a key runs fn; callers arriving while it runs wait for
+        its result. If fn raises, every waiter re-raises the same exception.
+        Waiters give up after `timeout` seconds (default: the group's timeout)
+        and raise TimeoutError; the running call is not interrupted.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self.collapsed += 1
+
+        if leader:
+            try:
+                call.result = fn()
+                return call.result
+            except BaseException as e:
+                call.error = e
+                with self._lock:
+                    self.errors += 1
+                raise
+            finally:
+                with self._lock:
+                    self._calls.pop(key, None)
+                    self.executions += 1
+                call.done.set()
+
+        wait_s = self.timeout if timeout is None else timeout
+        if not call.done.wait(wait_s):
+            with self._lock:
+                self.timeouts += 1
+            raise TimeoutError(f"Timed out after {wait_s}s waiting for in-flight {self.name} call")
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    async def do_async(self, key: Hashable, fn: Callable[[], Awaitable[Any]],
+                       timeout: Optional[float] = None) -> Any:
+        """
+        do() for coroutines: waiters await the leader's result on the event loop.
+
+        A leader's exception is shared, its cancellation is not: if the leader's
+        task is cancelled, a waiter that wasn't takes over (or joins whichever
+        waiter got there first) within its remaining timeout.
+        """
+        loop = asyncio.get_running_loop()
+        wait_s = self.timeout if timeout is None else timeout
+        deadline = loop.time() + wait_s
+        while True:
+            with self._lock:
+                future = self._async_calls.get(key)
+                leader = future is None
+                if leader:
+                    future = self._async_calls[key] = loop.create_future()
+                    # Mark the outcome as retrieved even when nobody else waited for it
+                    future.add_done_callback(lambda f: f.cancelled() or f.exception())
+                else:
+                    self.collapsed += 1
+
+            if leader:
+                try:
+                    result = await fn()
+                    future.set_result(result)
+                    return result
+                except asyncio.CancelledError:
+                    future.cancel()
+                    raise
+                except BaseException as e:
+                    future.set_exception(e)
+                    with self._lock:
+                        self.errors += 1
+                    raise
+                finally:
+                    with self._lock:
+                        self._async_calls.pop(key, None)
+                        self.executions += 1
+
+            try:
+                return await asyncio.wait_for(asyncio.shield(future), max(0.0, deadline - loop.time()))
+            except asyncio.TimeoutError:
+                with self._lock:
+                    self.timeouts += 1
+                raise TimeoutError(f"Timed out after {wait_s}s waiting for in-flight {self.name} call")
+            except asyncio.CancelledError:
+                # Only the leader was cancelled: retry; our own cancellation propagates
+                if not future.cancelled() or asyncio.current_task().cancelling():
+                    raise
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "in_flight": len(self._calls) + len(self._async_calls),
+                "executions": self.executions,
+                "collapsed": self.collapsed,
+                "timeouts": self.timeouts,
+                "errors": self.errors,
+            }
+
+
+GROUPS: Dict[str, SingleFlight] = {}
+
+
+def singleflight(name: str, timeout: Optional[float] = None) -> SingleFlight:
+    """Get or create the named coalescing group"""
+    group = GROUPS.get(name)
+    if group is None:
+        group = GROUPS.setdefault(name, SingleFlight(name, SINGLEFLIGHT_TIMEOUT_S if timeout is None else timeout))
+    return group
+
+
+def singleflight_stats() -> Dict[str, Dict[str, int]]:
+    """Counters for every coalescing group"""
+    return {name: group.stats() for name, group in GROUPS.items()}
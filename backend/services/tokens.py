@@ -0,0 +1,140 @@
+"""
+Offline token counting and cost estimates.
+count_tokens() approximates a BPE tokenizer (cl100k/o200k style) without
+a vocabulary: text is split the way those tokenizers pre-split it (words
+with their leading space, 1-3 digit groups, punctuation runs, whitespace),
+and each piece is costed by its shape. Short words are one token, long
+words and ALL-CAPS split into several, and non-ASCII characters count
+about one each. It is an estimate for telemetry and cost reporting, not
+an exact count. Repeated texts are memoized.
+
+MODEL_PRICES holds USD per million input/output tokens. Unknown models
+cost 0, and the longest matching prefix wins, so dated snapshots like
+gpt-4o-mini-2024-07-18 use their family's price. Override or extend it
+with MODEL_PRICES_JSON, e.g. {"my-model": [1.0, 2.0]}.
+"""
+
+import os
+import re
+import json
+import hashlib
+import logging
+from typing import Any, Dict, Hashable, Iterable, Optional, Tuple
+from services.cache import memoize
+from services.metrics import Counter
+
+logger = logging.getLogger(__name__)
+
+# USD per 1M tokens: (input, output)
+MODEL_PRICES: Dict[str, Tuple[float, float]] = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4-turbo": (10.00, 30.00),
+    "gpt-4": (30.00, 60.00),
+    "gpt-3.5-turbo": (0.50, 1.50),
+    "o1-mini": (3.00, 12.00),
+    "o1-preview": (15.00, 60.00),
+    "o1": (15.00, 60.00),
+}
+try:
+    MODEL_PRICES.update({k: tuple(v) for k, v in json.loads(os.getenv("MODEL_PRICES_JSON", "{}")).items()})
+except (ValueError, TypeError) as e:
+    logger.warning(f"[TOKENS] Ignoring invalid MODEL_PRICES_JSON: {e}")
+
+# Longest prefixes first, so "gpt-4o-mini" matches before "gpt-4o" and "gpt-4"
+_PRICE_PREFIXES = sorted(MODEL_PRICES, key=len, reverse=True)
+
+# Same pre-split as the GPT-4 tokenizers, restricted to ASCII classes
+_PIECES = re.compile(
+    r"(?P<contraction>'(?:[sdmt]|ll|ve|re))"
+    r"|(?P<word> ?[A-Za-z]+)"
+    r"|(?P<digits>[0-9]{1,3})"
+    r"|(?P<other> ?[^\sA-Za-z0-9]+)"
+    r"|(?P<space>\s+(?!\S)|\s+)"
+)
+
+LLM_TOKENS = Counter("promptgauge_llm_tokens_total", "Tokens sent to and received from LLM providers",
+                     ["model", "kind"])
+LLM_COST = Counter("promptgauge_llm_cost_usd_total", "Estimated LLM spend in USD", ["model"])
+
+
+def _count_key(text: str) -> Hashable:
+    # Long texts are keyed by digest so the cache doesn't pin large strings
+    return text if len(text) <= 1024 else hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+
+@memoize("count_tokens", key=_count_key)
+def count_tokens(text: str) -> int:
+    """
+    Approximate token count of a text
+
+    Args:
+        text: Any text (prompt, completion)
+        use_cache: Pass False to bypass the memo cache for this call
+    """
+    tokens = 0
+    for m in _PIECES.finditer(text):
+        kind = m.lastgroup
+        n = m.end() - m.start()
+        if kind == "word":
+            letters = n - (text[m.start()] == " ")
+            if letters <= 6:
+                tokens += 1
+            elif m.group().isupper():
+                tokens += 1 + (letters - 1) // 3
+            else:
+                tokens += 1 + (letters - 4) // 5
+        elif kind == "other":
+            piece = m.group()
+            ascii_chars = sum(1 for ch in piece if ch < "\x80")
+            tokens += max(1, (ascii_chars + 1) // 2 + n - ascii_chars)
+        elif kind == "space":
+            tokens += 1 if "\n" in m.group() else 1 + (n - 1) // 8
+        else:
+            tokens += 1
+    return tokens
+
+
+def model_price(model: Optional[str]) -> Optional[Tuple[float, float]]:
+    """(input, output) USD per 1M tokens for a model, or None if it isn't priced"""
+    if not model:
+        return None
+    price = MODEL_PRICES.get(model)
+    if price is None:
+        price = next((MODEL_PRICES[p] for p in _PRICE_PREFIXES if model.startswith(p)), None)
+    return price
+
+
+def estimate_cost(model: Optional[str], tokens_in: int, tokens_out: int = 0) -> float:
+    """Estimated USD cost of a call (0.0 for unpriced models)"""
+    price = model_price(model)
+    if price is None:
+        return 0.0
+    return round((tokens_in * price[0] + tokens_out * price[1]) / 1_000_000, 8)
+
+
+def prompt_usage(prompts: Iterable[str], model: Optional[str]) -> Dict[str, Any]:
+    """
+    Token and cost estimate for sending generated prompt(s) to `model`.
+    Generation makes no completion, so tokens_out is 0 and the cost is the
+    input side only.
+
+    Args:
+        prompts: Prompt texts a run produced (both halves of a dual prompt)
+        model: Target model the prompt is generated for
+
+    Returns:
+        usage: tokens_in, tokens_out and cost, ready for record_run
+    """
+    tokens_in = sum(count_tokens(p) for p in prompts if p)
+    return {"tokens_in": tokens_in, "tokens_out": 0, "cost": estimate_cost(model, tokens_in)}
+
+
+def record_llm_usage(model: str, tokens_in: int, tokens_out: int) -> float:
+    """Add one provider call to the LLM token and spend counters; returns its estimated cost"""
+    cost = estimate_cost(model, tokens_in, tokens_out)
+    LLM_TOKENS.inc(model, "prompt", amount=tokens_in)
+    LLM_TOKENS.inc(model, "completion", amount=tokens_out)
+    LLM_COST.inc(model, amount=cost)
+    logger.info(f"[LLM USAGE] model={model} tokens_in={tokens_in} tokens_out={tokens_out} cost=${cost:.6f}")
+    return cost
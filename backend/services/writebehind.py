@@ -0,0 +1,191 @@
+"""
+Write-behind queue for telemetry rows.
+Requests enqueue rows and return immediately; a background thread bulk-writes
+them when a batch fills up or the flush interval passes. This keeps the SQLite
+write lock out of the request path.
+
+On the event loop use put_many_async: put() can block for up to
+TELEMETRY_BLOCK_TIMEOUT_S per item when the queue is full, which would
+stall every request on the worker.
+"""
+
+import os
+import time
+import queue
+import logging
+import threading
+import anyio
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+TELEMETRY_WRITE_BEHIND = os.getenv("TELEMETRY_WRITE_BEHIND", "false").lower() in ["true", "1", "yes"]
+TELEMETRY_QUEUE_SIZE = int(os.getenv("TELEMETRY_QUEUE_SIZE", "10000"))
+TELEMETRY_BATCH_SIZE = int(os.getenv("TELEMETRY_BATCH_SIZE", "500"))
+TELEMETRY_FLUSH_INTERVAL_S = float(os.getenv("TELEMETRY_FLUSH_INTERVAL_S", "1.0"))
+# What to do when the queue is under pressure: block, drop, or sample
+TELEMETRY_QUEUE_POLICY = os.getenv("TELEMETRY_QUEUE_POLICY", "block")
+TELEMETRY_BLOCK_TIMEOUT_S = float(os.getenv("TELEMETRY_BLOCK_TIMEOUT_S", "0.05"))
+# With the sample policy, keep 1 in N items once the queue is 80% full
+TELEMETRY_SAMPLE_RATE = int(os.getenv("TELEMETRY_SAMPLE_RATE", "10"))
+
+POLICIES = ("block", "drop", "sample")
+SAMPLE_HIGH_WATER = 0.8
+
+
+class WriteBehindQueue:
+    """
+    Bounded queue drained by a background flusher thread.
+
+    `flush_fn` receives a list of queued items and must write them in one
+    transaction. The thread starts on the first put and is drained by stop().
+    """
+
+    def __init__(
+        self,
+        flush_fn: Callable[[List[Any]], None],
+        maxsize: int = TELEMETRY_QUEUE_SIZE,
+        batch_size: int = TELEMETRY_BATCH_SIZE,
+        flush_interval_s: float = TELEMETRY_FLUSH_INTERVAL_S,
+        policy: str = TELEMETRY_QUEUE_POLICY,
+        block_timeout_s: float = TELEMETRY_BLOCK_TIMEOUT_S,
+        sample_rate: int = TELEMETRY_SAMPLE_RATE,
+    ):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown queue policy {policy!r}; expected one of {POLICIES}")
+        self.flush_fn = flush_fn
+        self.maxsize = maxsize
+        self.batch_size = batch_size
+        self.flush_interval_s = flush_interval_s
+        self.policy = policy
+        self.block_timeout_s = block_timeout_s
+        self.sample_rate = max(1, sample_rate)
+        self._queue: "queue.Queue[Any]" = queue.Queue(maxsize=maxsize)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._sample_counter = 0
+        self.enqueued = 0
+        self.flushed = 0
+        self.dropped = 0
+        self.sampled_out = 0
+        self.failed = 0
+        self.batches = 0
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="telemetry-writer", daemon=True)
+            self._thread.start()
+
+    def put(self, item: Any) -> bool:
+        """Queue an item; returns False if backpressure dropped it. May block (block policy)."""
+        if self._thread is None:
+            self.start()
+
+        if self.policy == "sample" and self._queue.qsize() >= self.maxsize * SAMPLE_HIGH_WATER:
+            with self._lock:
+                self._sample_counter += 1
+                keep = self._sample_counter % self.sample_rate == 0
+                if not keep:
+                    self.sampled_out += 1
+            if not keep:
+                return False
+
+        try:
+            if self.policy == "block":
+                self._queue.put(item, timeout=self.block_timeout_s)
+            else:
+                self._queue.put_nowait(item)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            return False
+
+        with self._lock:
+            self.enqueued += 1
+        return True
+
+    def put_many(self, items: List[Any]) -> List[bool]:
+        """put() each item, in order"""
+        return [self.put(item) for item in items]
+
+    async def put_many_async(self, items: List[Any]) -> List[bool]:
+        """
+        put_many for the event loop. Items are queued without blocking while
+        there is room; with the block policy and a full queue, the rest wait
+        for room in a worker thread, so the loop keeps running meanwhile.
+        """
+        if self.policy != "block":
+            return self.put_many(items)  # drop and sample never wait
+        if self._thread is None:
+            self.start()
+        results: List[bool] = []
+        for i, item in enumerate(items):
+            try:
+                self._queue.put_nowait(item)
+            except queue.Full:
+                results.extend(await anyio.to_thread.run_sync(self.put_many, items[i:]))
+                break
+            with self._lock:
+                self.enqueued += 1
+            results.append(True)
+        return results
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """Flush everything still queued and stop the flusher thread"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _next_batch(self) -> List[Any]:
+        batch: List[Any] = []
+        deadline = time.monotonic() + self.flush_interval_s
+        while len(batch) < self.batch_size:
+            try:
+                if self._stop.is_set():
+                    batch.append(self._queue.get_nowait())
+                else:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._next_batch()
+            if batch:
+                self._flush(batch)
+            elif self._stop.is_set():
+                return
+
+    def _flush(self, batch: List[Any]) -> None:
+        try:
+            self.flush_fn(batch)
+            with self._lock:
+                self.flushed += len(batch)
+                self.batches += 1
+        except Exception as e:
+            logger.error(f"[TELEMETRY] Write-behind flush of {len(batch)} item(s) failed: {e}")
+            with self._lock:
+                self.failed += len(batch)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "policy": self.policy,
+                "depth": self._queue.qsize(),
+                "maxsize": self.maxsize,
+                "enqueued": self.enqueued,
+                "flushed": self.flushed,
+                "batches": self.batches,
+                "dropped": self.dropped,
+                "sampled_out": self.sampled_out,
+                "failed": self.failed,
+            }
@@ -0,0 +1,73 @@
+"""
+Shared fixtures. The app reads its configuration from the environment at
+import time, so the test database (a temporary SQLite file) and archive
+directory are set up here, before any backend module is imported.
+
+From backend/:
+    python -m pytest
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+
+import pytest
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND)
+
+_tmp = tempfile.mkdtemp(prefix="promptgauge-tests-")
+os.environ.update(
+    DATABASE_URL=f"sqlite:///{os.path.join(_tmp, 'test.db')}",
+    ARCHIVE_DIR=os.path.join(_tmp, "archive"),
+    LLM_CACHE_PATH="",
+    TELEMETRY_WRITE_BEHIND="false",
+    STARTUP_MODE="full",
+)
+os.environ.pop("OPENAI_API_KEY", None)
+
+
+def reset_database() -> None:
+    """Drop and recreate every table, and forget ids cached from the old ones"""
+    import models  # noqa: F401  (registers the tables)
+    from db import Base, engine, init_db
+    from services.logger import invalidate_scratchpad_cache
+
+    Base.metadata.drop_all(engine)
+    init_db()
+    invalidate_scratchpad_cache()
+
+
+@pytest.fixture
+def db():
+    """A session on an empty, freshly migrated test database"""
+    from db import SessionLocal
+
+    reset_database()
+    with SessionLocal() as session:
+        yield session
+
+
+@pytest.fixture
+def archive_dir():
+    """The (emptied) ARCHIVE_DIR that retention writes to and exports read from"""
+    from services.retention import ARCHIVE_DIR
+
+    shutil.rmtree(ARCHIVE_DIR, ignore_errors=True)
+    os.makedirs(ARCHIVE_DIR)
+    return ARCHIVE_DIR
+
+
+@pytest.fixture
+def client(db):
+    """TestClient over the app, on the same test database as `db`"""
+    from fastapi.testclient import TestClient
+    from app import app
+
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(_tmp, ignore_errors=True)
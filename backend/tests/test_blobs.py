@@ -0,0 +1,95 @@
+"""Blob store maintenance: migrating inline texts, and collecting unreferenced blobs"""
+
+from datetime import datetime
+
+import pytest
+from sqlalchemy import func, insert, select
+
+from models import Blob, PromptScore, PromptTransformation, RunItem
+from services.blobs import TEXT_REFS, blob_stats, gc_blobs, migrate_inline_texts, put_blobs
+from services.export import iter_export
+from services.logger import build_run_row, get_or_create_scratchpad_version, insert_comparisons, insert_runs
+from services.scoring import compare_prompts
+
+DATASETS = ("comparisons", "run_items")
+LONG_TEXT = "Summarize the transcript into five bullets. " * 40  # compressed (over BLOB_COMPRESS_MIN_BYTES)
+
+
+def export_all(db):
+    return {dataset: b"".join(iter_export(db, dataset)) for dataset in DATASETS}
+
+
+def referenced_hashes(db):
+    return {h for _, hash_col in TEXT_REFS for h in db.scalars(select(hash_col).where(hash_col.isnot(None)))}
+
+
+@pytest.fixture
+def legacy_rows(db):
+    """
+    Rows as written before the blob store (text inline, hash NULL), next to
+    rows written since (text in blobs, referenced by hash)
+    """
+    now = datetime.utcnow()
+    version_id = get_or_create_scratchpad_version(db, "directive", "gpt-4o-mini")
+    run_id, = insert_runs(db, [build_run_row(version_id, "directive", "gpt-4o-mini", {}, now, now)])
+
+    before_ids = db.scalars(insert(PromptScore).returning(PromptScore.id, sort_by_parameter_order=True), [
+        {"prompt_text": text, "score": 40, "problems_json": "[]"}
+        for text in ["write an email", LONG_TEXT, "write an email"]
+    ]).all()
+    db.execute(insert(PromptTransformation), [
+        {"before_id": before_id, "after_prompt_text": f"Write a short email. ({i})", "after_score": 80,
+         "fixes_json": "[]", "improvement_pct": 100, "created_at": now}
+        for i, before_id in enumerate(before_ids)
+    ])
+    db.execute(insert(RunItem), [
+        {"run_id": run_id, "input_ref": "input text", "output_ref": LONG_TEXT},
+        {"run_id": run_id, "input_ref": "input text", "output_ref": "short output"},
+    ])
+    insert_comparisons(db, [compare_prompts("Summarize this meeting into bullets")])
+    db.commit()
+
+
+def test_migrate_keeps_exports_unchanged(db, legacy_rows):
+    before = export_all(db)
+    assert sum(blob_stats(db)["inline_rows"].values()) == 10
+
+    moved = migrate_inline_texts(db, batch_rows=2)
+
+    assert moved == {
+        "prompt_scores.prompt_text": 3,
+        "prompt_transformations.after_prompt_text": 3,
+        "run_items.input_ref": 2,
+        "run_items.output_ref": 2,
+    }
+    assert export_all(db) == before
+    assert sum(blob_stats(db)["inline_rows"].values()) == 0
+    for text_col, hash_col in TEXT_REFS:
+        assert db.scalar(select(func.count()).where(hash_col.is_(None))) == 0
+        assert set(db.scalars(select(text_col))) == {""}
+
+
+def test_migrate_stores_each_text_once(db, legacy_rows):
+    migrate_inline_texts(db)
+
+    assert db.scalar(select(func.count(Blob.hash))) == len(referenced_hashes(db))
+    assert db.scalar(select(Blob.compression).where(Blob.size == len(LONG_TEXT))) == "zlib"
+    assert migrate_inline_texts(db) == dict.fromkeys(
+        [f"{text_col.class_.__tablename__}.{text_col.key}" for text_col, _ in TEXT_REFS], 0
+    )
+
+
+def test_gc_removes_only_unreferenced_blobs(db, legacy_rows):
+    migrate_inline_texts(db)
+    before = export_all(db)
+    orphans = put_blobs(db, ["a prompt whose rows were archived", "another one"])
+    db.commit()
+    kept = referenced_hashes(db)
+
+    assert gc_blobs(db) == len(orphans)
+
+    stored = set(db.scalars(select(Blob.hash)))
+    assert stored == kept
+    assert not stored & set(orphans)
+    assert export_all(db) == before
+    assert gc_blobs(db) == 0
@@ -0,0 +1,87 @@
+"""Prompt compaction: lossless levels, level choice under a token budget, and no truncation"""
+
+import re
+from copy import deepcopy
+
+import pytest
+
+from schemas import PromptStyle
+from services.compact import COMPACT_LEVELS, compact_at, compact_prompt
+from services.explain import explain
+from services.generate import build_prompt, compact_result, prompt_targets
+from services.tokens import count_tokens
+
+GOAL = "Extract action items from this meeting transcript as JSON with owner and due date"
+STYLES = [style.value for style in PromptStyle]
+_LIST_MARKER = re.compile(r"^\s*(?:- |\d+\. )")
+
+
+@pytest.fixture(scope="module")
+def spec():
+    return explain(GOAL, use_cache=False)
+
+
+def built(spec, style):
+    return build_prompt(deepcopy(spec), style)
+
+
+def words(text):
+    """Word sequence of a text, ignoring punctuation, whitespace and JSON layout"""
+    return " ".join(re.findall(r"\w+", text))
+
+
+@pytest.mark.parametrize("level", ["whitespace", "lists"])
+@pytest.mark.parametrize("style", STYLES)
+def test_lossless_levels_keep_every_instruction(spec, style, level):
+    for text in prompt_targets(built(spec, style)).values():
+        compacted = f" {words(compact_at(text, level))} "
+
+        assert count_tokens(compact_at(text, level)) <= count_tokens(text)
+        for line in text.split("\n"):
+            content = words(_LIST_MARKER.sub("", line))
+            assert not content or f" {content} " in compacted, f"{level} lost {line!r}"
+
+
+@pytest.mark.parametrize("style", STYLES)
+def test_budget_picks_lightest_level_that_fits(spec, style):
+    for text in prompt_targets(built(spec, style)).values():
+        assert compact_prompt(text, count_tokens(text)) == (text, None)
+        for level in COMPACT_LEVELS:
+            budget = count_tokens(compact_at(text, level))
+            if count_tokens(text) <= budget:
+                assert compact_prompt(text, budget) == (text, None)
+                continue
+            lightest = next(l for l in COMPACT_LEVELS if count_tokens(compact_at(text, l)) <= budget)
+
+            assert compact_prompt(text, budget) == (compact_at(text, lightest), lightest)
+
+
+@pytest.mark.parametrize("style", STYLES)
+def test_result_within_budget(spec, style):
+    targets = prompt_targets(built(spec, style))
+    budget = max(count_tokens(compact_at(text, "whitespace")) for text in targets.values())
+
+    compaction = compact_result(built(spec, style), budget)["compaction"]
+
+    assert compaction["within_budget"] and compaction["level"] in ("whitespace", None)
+    assert compaction["tokens_after"] <= compaction["tokens_before"]
+
+
+@pytest.mark.parametrize("style", STYLES)
+def test_nothing_fits_returns_full_compaction_untruncated(spec, style):
+    original = prompt_targets(built(spec, style))
+
+    result = compact_result(built(spec, style), max_prompt_tokens=1)
+
+    assert result["compaction"]["within_budget"] is False
+    assert result["compaction"]["level"] == COMPACT_LEVELS[-1]
+    assert prompt_targets(result) == {name: compact_at(text, COMPACT_LEVELS[-1]) for name, text in original.items()}
+
+
+def test_generate_reports_budget_miss(client):
+    response = client.post("/generate", json={"goal": GOAL, "style": "few_shot", "max_prompt_tokens": 1})
+
+    assert response.status_code == 200
+    compaction = response.json()["compaction"]
+    assert compaction["within_budget"] is False and compaction["max_prompt_tokens"] == 1
+    assert compaction["tokens_after"] > 1
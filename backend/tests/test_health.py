@@ -0,0 +1,36 @@
+"""Health probes: the metrics snapshot across app restarts"""
+
+from datetime import datetime
+
+from fastapi.testclient import TestClient
+
+from app import app
+from services.health import get_metrics_snapshot, stop_metrics_snapshot
+from services.logger import build_run_row, get_or_create_scratchpad_version, insert_runs
+
+
+def add_runs(db, count):
+    now = datetime.utcnow()
+    version_id = get_or_create_scratchpad_version(db, "directive", "gpt-4o-mini")
+    insert_runs(db, [build_run_row(version_id, "directive", "gpt-4o-mini", {}, now, now)] * count)
+    db.commit()
+
+
+def test_snapshot_restarts_with_the_app(db):
+    with TestClient(app) as first:
+        snapshot = get_metrics_snapshot()
+        assert first.get("/health").status_code == 200
+    assert snapshot._thread is None  # stopped on shutdown
+
+    add_runs(db, 3)
+
+    with TestClient(app) as second:
+        restarted = get_metrics_snapshot()
+        assert restarted is not snapshot and restarted._thread.is_alive()
+        restarted.refresh()
+        assert second.get("/health").json()["metrics"]["total_runs"] == 3
+
+
+def test_stop_without_a_snapshot_is_a_no_op():
+    stop_metrics_snapshot()
+    stop_metrics_snapshot()
@@ -0,0 +1,127 @@
+"""LLM response cache: only usable answers are cached, and /health doesn't open it"""
+
+import asyncio
+
+import pytest
+
+import providers.openai_provider
+import providers.response_cache
+import services.explain
+from providers.openai_provider import OpenAIProvider
+from providers.response_cache import ResponseCache
+from services.explain import REFINE_MODEL, REFINE_PARAMS, REFINE_RESPONSE_FORMAT, build_refine_prompt
+from services.explain import explain, explain_events, refine_with_llm_async
+
+GOAL = "Summarize this meeting transcript into action items"
+GOOD = '{"intent": "summarize", "outputs": ["action_items"]}'
+
+
+class ScriptedProvider(OpenAIProvider):
+    """Answers from a list instead of the API"""
+
+    def __init__(self, answers):
+        super().__init__(api_key="test")
+        self.answers = list(answers)
+        self.calls = 0
+
+    async def complete(self, prompt, model=None, params=None, response_format=None):
+        self.calls += 1
+        return self.answers.pop(0)
+
+    async def stream(self, prompt, model=None, params=None, response_format=None):
+        self.calls += 1
+        for ch in self.answers.pop(0):
+            yield ch
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    cache = ResponseCache(str(tmp_path / "llm_cache.db"))
+    for module in (providers.openai_provider, services.explain):
+        monkeypatch.setattr(module, "get_response_cache", lambda: cache)
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    yield cache
+    cache.close()
+
+
+@pytest.fixture
+def use_provider(monkeypatch):
+    def use(answers):
+        provider = ScriptedProvider(answers)
+        monkeypatch.setattr(services.explain, "get_provider", lambda: provider)
+        return provider
+    return use
+
+
+def cached_refinement(cache, provider):
+    key = provider.cache_key(build_refine_prompt(GOAL), REFINE_MODEL, REFINE_PARAMS, REFINE_RESPONSE_FORMAT)
+    return cache.get(key)
+
+
+def refine():
+    return asyncio.run(refine_with_llm_async(GOAL, explain(GOAL, use_cache=False)))
+
+
+def stream_refined():
+    async def collect():
+        return [event async for event in explain_events(GOAL, use_llm=True, use_cache=False)]
+    return dict(asyncio.run(collect()))["refined"]
+
+
+@pytest.mark.parametrize("bad", ["not json", '["a list"]', ""])
+def test_unusable_answer_is_not_cached(cache, use_provider, bad):
+    provider = use_provider([bad, GOOD])
+
+    assert "llm_cache_hit" not in refine()  # heuristic fallback
+    assert cached_refinement(cache, provider) is None
+
+    refined = refine()
+    assert refined["outputs"] == ["action_items"] and refined["llm_cache_hit"] is False
+    assert cached_refinement(cache, provider) == GOOD
+    assert refine()["llm_cache_hit"] is True
+    assert provider.calls == 2
+
+
+def test_unusable_cached_answer_is_evicted(cache, use_provider):
+    provider = use_provider([GOOD])
+    key = provider.cache_key(build_refine_prompt(GOAL), REFINE_MODEL, REFINE_PARAMS, REFINE_RESPONSE_FORMAT)
+    cache.set(key, "openai", REFINE_MODEL, "not json")
+
+    refined = refine()
+
+    assert refined["outputs"] == ["action_items"] and refined["llm_cache_hit"] is False
+    assert provider.calls == 1
+    assert cached_refinement(cache, provider) == GOOD
+
+
+def test_streamed_answer_is_cached_only_once_parsed(cache, use_provider):
+    provider = use_provider(["not json", GOOD])
+
+    assert "llm_cache_hit" not in stream_refined()
+    assert cached_refinement(cache, provider) is None
+
+    assert stream_refined()["llm_cache_hit"] is False
+    assert stream_refined()["llm_cache_hit"] is True
+    assert provider.calls == 2
+
+
+def test_streamed_refinement_evicts_unusable_cached_answer(cache, use_provider):
+    provider = use_provider([GOOD])
+    key = provider.cache_key(build_refine_prompt(GOAL), REFINE_MODEL, REFINE_PARAMS, REFINE_RESPONSE_FORMAT)
+    cache.set(key, "openai", REFINE_MODEL, "not json")
+
+    assert stream_refined()["outputs"] == ["action_items"]
+    assert cached_refinement(cache, provider) == GOOD
+
+
+def test_health_does_not_open_the_cache(client, tmp_path, monkeypatch):
+    monkeypatch.setattr(providers.response_cache, "LLM_CACHE_PATH", str(tmp_path / "llm_cache.db"))
+    monkeypatch.setattr(providers.response_cache, "_cache", None)
+
+    assert client.get("/health").json()["llm_cache"] is None
+    assert providers.response_cache._cache is None
+
+    opened = ResponseCache(str(tmp_path / "llm_cache.db"))
+    monkeypatch.setattr(providers.response_cache, "_cache", opened)
+    assert client.get("/health").json()["llm_cache"]["size"] == 0
+    opened.close()
@@ -0,0 +1,156 @@
+"""OpenAI provider against a local stub of the chat completions API (OPENAI_BASE_URL)"""
+
+import json
+import time
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import providers.openai_provider
+from providers.openai_provider import OpenAIProvider, call_openai, call_openai_cached
+from providers.response_cache import ResponseCache
+
+
+class StubAPI(ThreadingHTTPServer):
+    """
+    Answers POST /v1/chat/completions. `statuses` are returned in order
+    (then 200s); each request is held for `delay_s` so overlap can be counted.
+    """
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), StubHandler)
+        self.statuses = []
+        self.delay_s = 0.0
+        self.requests = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/v1"
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        stub = self.server
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        with stub.lock:
+            stub.requests.append(request)
+            stub.in_flight += 1
+            stub.max_in_flight = max(stub.max_in_flight, stub.in_flight)
+            status = stub.statuses.pop(0) if stub.statuses else 200
+        time.sleep(stub.delay_s)
+        with stub.lock:
+            stub.in_flight -= 1
+
+        prompt = request["messages"][0]["content"]
+        body = {"error": {"message": "stub error"}} if status != 200 else {
+            "id": "chatcmpl-stub", "object": "chat.completion", "created": 0, "model": request["model"],
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": f"echo: {prompt}"}}],
+            "usage": {"prompt_tokens": 5, "completion_tokens": 3, "total_tokens": 8},
+        }
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    server = StubAPI()
+    thread = threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.01}, daemon=True)
+    thread.start()
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.setenv("OPENAI_BASE_URL", server.base_url)
+    monkeypatch.setattr(providers.openai_provider, "get_response_cache", lambda: None)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def run(coro_fn, **options):
+    async def main():
+        provider = OpenAIProvider(backoff_base_s=0.01, **options)
+        try:
+            return await coro_fn(provider)
+        finally:
+            await provider.aclose()
+    return asyncio.run(main())
+
+
+def test_complete(stub):
+    assert run(lambda p: p.complete("hi", params={"max_tokens": 5})) == "echo: hi"
+    assert stub.requests[0]["model"] == "gpt-4o-mini" and stub.requests[0]["max_tokens"] == 5
+
+
+def test_retryable_errors_are_retried(stub):
+    stub.statuses = [503, 429]
+
+    assert run(lambda p: p.complete("hi")) == "echo: hi"
+    assert len(stub.requests) == 3
+
+
+def test_gives_up_after_max_retries(stub):
+    stub.statuses = [503] * 5
+
+    assert run(lambda p: p.complete("hi"), max_retries=2) is None
+    assert len(stub.requests) == 3
+
+
+def test_other_errors_are_not_retried(stub):
+    stub.statuses = [400]
+
+    assert run(lambda p: p.complete("hi")) is None
+    assert len(stub.requests) == 1
+
+
+def test_concurrency_cap(stub):
+    stub.delay_s = 0.05
+
+    async def burst(provider):
+        return await asyncio.gather(*(provider.complete(f"q{i}") for i in range(6)))
+
+    assert run(burst, max_concurrency=2) == [f"echo: q{i}" for i in range(6)]
+    assert stub.max_in_flight == 2
+
+
+def test_cached_completion_skips_the_api(stub, tmp_path, monkeypatch):
+    cache = ResponseCache(str(tmp_path / "llm_cache.db"))
+    monkeypatch.setattr(providers.openai_provider, "get_response_cache", lambda: cache)
+
+    assert call_openai_cached("hi") == ("echo: hi", False)
+    assert call_openai_cached("hi") == ("echo: hi", True)
+    assert call_openai_cached("hi", use_cache=False) == ("echo: hi", False)
+    assert len(stub.requests) == 2
+    cache.close()
+
+
+def test_call_openai_from_a_script(stub):
+    assert call_openai("hi") == "echo: hi"
+
+
+def test_call_openai_inside_a_running_loop_returns_none(stub, caplog):
+    async def from_async_code():
+        return call_openai("hi")
+
+    assert asyncio.run(from_async_code()) is None
+    assert "running event loop" in caplog.text
+    assert stub.requests == []
+
+
+def test_call_openai_without_a_server_returns_none(stub, monkeypatch):
+    monkeypatch.setenv("OPENAI_BASE_URL", "http://127.0.0.1:9/v1")
+    monkeypatch.setattr(OpenAIProvider, "backoff_s", lambda self, attempt: 0)
+
+    assert call_openai("hi") is None
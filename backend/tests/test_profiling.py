@@ -0,0 +1,89 @@
+"""Profiling: token-gated, and keyed by ids clients can't choose"""
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import services.profiling
+from services.profiling import ProfileStore, ProfilingMiddleware, profiling_enabled, token_matches
+
+TOKEN = "s3cret-token"
+
+
+@pytest.fixture
+def token(monkeypatch):
+    monkeypatch.setattr(services.profiling, "PROFILE_TOKEN", TOKEN)
+    return TOKEN
+
+
+@pytest.fixture
+def profiled(monkeypatch):
+    """A small app behind the middleware, with its own profile store"""
+    store = ProfileStore(keep=10)
+    app = FastAPI()
+
+    @app.get("/work")
+    def work():
+        return {"ok": sum(i * i for i in range(10_000))}
+
+    app.add_middleware(ProfilingMiddleware, store=store)
+    return TestClient(app), store
+
+
+def test_sampling_alone_does_not_enable_profiling(monkeypatch, client):
+    monkeypatch.setattr(services.profiling, "PROFILE_SAMPLE_N", 1)
+
+    assert not profiling_enabled()
+    assert client.get("/profiles").status_code == 404
+
+
+def test_sampling_without_token_profiles_nothing(monkeypatch, profiled):
+    monkeypatch.setattr(services.profiling, "PROFILE_SAMPLE_N", 1)
+    test_client, store = profiled
+
+    response = test_client.get("/work")
+
+    assert "x-profile-id" not in response.headers
+    assert store.list() == []
+
+
+@pytest.mark.parametrize("header, status", [
+    (None, 403),
+    ("wrong", 403),
+    (TOKEN[:-1], 403),
+    (TOKEN + "x", 403),
+    ("", 403),
+    (TOKEN, 200),
+])
+def test_profiles_require_the_token(client, token, header, status):
+    headers = {} if header is None else {"X-Profile": header}
+
+    assert client.get("/profiles", headers=headers).status_code == status
+    assert client.get("/profiles/abc/collapsed", headers=headers).status_code == (404 if status == 200 else status)
+
+
+def test_nothing_matches_without_a_token():
+    assert not any(token_matches(value) for value in [TOKEN, "", None])
+
+
+def test_client_request_id_does_not_pick_the_profile_id(profiled, token):
+    test_client, store = profiled
+
+    ids = [
+        test_client.get("/work", headers={"X-Profile": TOKEN, "X-Request-ID": "same-id"}).headers["x-profile-id"]
+        for _ in range(2)
+    ]
+
+    assert len(set(ids)) == 2 and "same-id" not in ids
+    profiles = store.list()
+    assert {p["id"] for p in profiles} == set(ids)
+    assert {p["request_id"] for p in profiles} == {"same-id"}
+
+
+def test_sampled_requests_are_profiled_with_a_token(monkeypatch, profiled, token):
+    monkeypatch.setattr(services.profiling, "PROFILE_SAMPLE_N", 1)
+    test_client, store = profiled
+
+    profile_id = test_client.get("/work").headers["x-profile-id"]
+
+    assert store.get(profile_id)["path"] == "/work"
@@ -0,0 +1,102 @@
+"""dedupe_prompt_versions: the startup migration that merges duplicate versions"""
+
+from datetime import datetime
+
+import pytest
+from sqlalchemy import inspect, insert, select, text
+from sqlalchemy.exc import IntegrityError
+
+from db import engine, ensure_indexes
+from models import Prompt, PromptVersion, Run
+from services.logger import (
+    _scratchpad_versions, build_run_row, get_or_create_scratchpad_version, insert_runs,
+)
+
+UNIQUE_INDEXES = {"uq_prompt_versions_prompt_label", "uq_prompt_versions_scratchpad_label"}
+
+
+def add_version(db, label, prompt_id=None):
+    return db.scalar(insert(PromptVersion).returning(PromptVersion.id), {
+        "prompt_id": prompt_id, "version_label": label, "model": "gpt-4o-mini", "params_json": "{}",
+    })
+
+
+def add_runs(db, version_id, count):
+    now = datetime.utcnow()
+    return insert_runs(db, [build_run_row(version_id, "directive", "gpt-4o-mini", {}, now, now)] * count)
+
+
+@pytest.fixture
+def legacy_versions(db):
+    """
+    prompt_versions as left by the racing inserts before the unique indexes
+    existed: duplicate scratchpad and prompt versions, each with its own runs
+    """
+    with engine.begin() as conn:
+        for name in UNIQUE_INDEXES:
+            conn.execute(text(f"DROP INDEX {name}"))
+    prompt_id = db.scalar(insert(Prompt).returning(Prompt.id), {"name": "p", "style": "directive", "body": "b"})
+
+    groups = {
+        "scratchpad": [add_version(db, "scratchpad-directive") for _ in range(3)],
+        "prompt": [add_version(db, "v1", prompt_id) for _ in range(2)],
+        "unique": [add_version(db, "scratchpad-few_shot")],
+    }
+    runs = {version_id: add_runs(db, version_id, 2) for ids in groups.values() for version_id in ids}
+    db.commit()
+    return groups, runs
+
+
+def test_runs_repointed_to_oldest_version(db, legacy_versions):
+    groups, runs = legacy_versions
+
+    ensure_indexes()
+    db.expire_all()
+
+    for ids in groups.values():
+        keep = min(ids)
+        for version_id in ids:
+            run_versions = set(db.scalars(select(Run.prompt_version_id).where(Run.id.in_(runs[version_id]))))
+            assert run_versions == {keep}
+    assert db.scalar(select(Run.id).where(Run.prompt_version_id.not_in(select(PromptVersion.id)))) is None
+
+
+def test_duplicates_removed(db, legacy_versions):
+    groups, runs = legacy_versions
+
+    ensure_indexes()
+    db.expire_all()
+
+    remaining = set(db.scalars(select(PromptVersion.id)))
+    assert remaining == {min(ids) for ids in groups.values()}
+    assert len(list(db.scalars(select(Run.id)))) == sum(len(ids) for ids in runs.values())
+
+
+def test_unique_indexes_build_and_hold(db, legacy_versions):
+    groups, _ = legacy_versions
+
+    ensure_indexes()
+
+    assert UNIQUE_INDEXES <= {index["name"] for index in inspect(engine).get_indexes("prompt_versions")}
+    with pytest.raises(IntegrityError):
+        add_version(db, "scratchpad-directive")
+    db.rollback()
+
+
+def test_cached_scratchpad_ids_dropped(db, legacy_versions):
+    groups, _ = legacy_versions
+    removed_id = max(groups["scratchpad"])
+    _scratchpad_versions["scratchpad-directive"] = (removed_id, float("inf"))
+
+    ensure_indexes()
+
+    assert get_or_create_scratchpad_version(db, "directive", "gpt-4o-mini") == min(groups["scratchpad"])
+
+
+def test_no_duplicates_is_a_no_op(db):
+    from services.logger import dedupe_prompt_versions
+
+    add_version(db, "scratchpad-directive")
+    db.commit()
+    with engine.begin() as conn:
+        assert dedupe_prompt_versions(conn) == 0
@@ -0,0 +1,114 @@
+"""Retention: archiving old runs and comparisons keeps stats and exports intact"""
+
+import os
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import func, insert, select
+
+import services.logger
+from models import ArchiveFile, PromptTransformation, Run, RunItem
+from services.export import iter_export
+from services.logger import build_run_row, get_or_create_scratchpad_version, insert_comparisons, insert_runs
+from services.retention import archive_old_rows
+from services.rollups import read_totals, rebuild_daily_stats
+from services.scoring import compare_prompts
+
+DATASETS = ("runs", "run_items", "comparisons")
+RETENTION_DAYS = 90
+
+
+def export_all(db, archived):
+    return {dataset: b"".join(iter_export(db, dataset, archived=archived)) for dataset in DATASETS}
+
+
+def archive_file_paths(archive_dir):
+    return sorted(
+        os.path.relpath(os.path.join(root, name), archive_dir)
+        for root, _, names in os.walk(archive_dir) for name in names
+    )
+
+
+@pytest.fixture
+def history(db, monkeypatch):
+    """
+    200 days of runs (half with run items) and comparisons from 150, 120 and
+    10 days ago: most of it past the retention horizon, some of it recent
+    """
+    now = datetime.utcnow()
+    version_id = get_or_create_scratchpad_version(db, "directive", "gpt-4o-mini")
+    rows = []
+    for i in range(600):
+        started = now - timedelta(days=200 - i / 3, hours=1)
+        row = build_run_row(version_id, "directive", "gpt-4o-mini", {}, started,
+                            started + timedelta(seconds=2) if i % 3 else None, "out", 10, 20, 0.001)
+        row["created_at"] = started
+        rows.append(row)
+    run_ids = insert_runs(db, rows)
+    db.execute(insert(RunItem), [{"run_id": run_id, "input_ref": "in", "output_ref": "out"} for run_id in run_ids[::2]])
+
+    result = compare_prompts("Summarize this meeting into bullets")
+    for days_ago in (150, 120, 10):
+        class PastDatetime(datetime):
+            @classmethod
+            def utcnow(cls):
+                return now - timedelta(days=days_ago)
+        monkeypatch.setattr(services.logger, "datetime", PastDatetime)
+        insert_comparisons(db, [result] * 20)
+    monkeypatch.undo()
+    db.commit()
+
+
+def snapshot(db, client):
+    week_ago = (datetime.utcnow() - timedelta(days=7)).date()
+    return {"totals": read_totals(db, week_ago), "stats": client.get("/stats/me").json()}
+
+
+def test_stats_unchanged_by_archive_and_rebuild(db, client, archive_dir, history):
+    before = snapshot(db, client)
+
+    moved = archive_old_rows(db, days=RETENTION_DAYS, batch_rows=150, pause_s=0, archive_dir=archive_dir)
+    assert moved["runs"] > 0 and moved["comparisons"] == 40
+    assert snapshot(db, client) == before
+
+    rebuild_daily_stats(db)
+    assert snapshot(db, client) == before
+
+
+def test_archived_export_matches_pre_archive_export(db, archive_dir, history):
+    before = export_all(db, archived=False)
+
+    archive_old_rows(db, days=RETENTION_DAYS, batch_rows=150, pause_s=0, archive_dir=archive_dir)
+
+    assert export_all(db, archived=False) != before
+    assert export_all(db, archived=True) == before
+
+
+def test_rerun_after_crash_before_commit(db, client, archive_dir, history, monkeypatch):
+    before = {"snapshot": snapshot(db, client), "export": export_all(db, archived=False)}
+    commit = db.commit
+    crashes = []
+
+    def crash_once():
+        if not crashes:
+            crashes.append(archive_file_paths(archive_dir))
+            raise RuntimeError("crashed before commit")
+        commit()
+
+    monkeypatch.setattr(db, "commit", crash_once)
+    with pytest.raises(RuntimeError):
+        archive_old_rows(db, days=RETENTION_DAYS, batch_rows=150, pause_s=0, archive_dir=archive_dir)
+    db.rollback()
+    assert crashes[0], "the batch's files should have been written before the commit"
+    assert db.scalar(select(func.count(ArchiveFile.id))) == 0
+
+    archive_old_rows(db, days=RETENTION_DAYS, batch_rows=150, pause_s=0, archive_dir=archive_dir)
+
+    paths = list(db.scalars(select(ArchiveFile.path)))
+    assert sorted(paths) == archive_file_paths(archive_dir)
+    assert set(crashes[0]) <= set(paths)
+    assert snapshot(db, client) == before["snapshot"]
+    assert export_all(db, archived=True) == before["export"]
+    cutoff = datetime.utcnow() - timedelta(days=RETENTION_DAYS)
+    assert db.scalar(select(func.count(Run.id)).where(Run.created_at < cutoff)) == 0
+    assert db.scalar(select(func.count(PromptTransformation.id)).where(PromptTransformation.created_at < cutoff)) == 0
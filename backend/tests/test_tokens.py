@@ -0,0 +1,96 @@
+"""Offline token counts and cost estimates, and the usage /generate records"""
+
+import json
+
+import pytest
+from sqlalchemy import select
+
+from models import Run
+from services.tokens import count_tokens, estimate_cost, model_price, prompt_usage
+
+BAD_MAX_TOKENS = ["lots", [1], {"n": 1}, -500, 1e30, None]
+
+
+@pytest.mark.parametrize("text, tokens", [
+    ("", 0),
+    ("hello", 1),
+    (" hello world", 2),
+    ("internationalization", 4),
+    ("NASA", 1),
+    ("ABCDEFGHIJ", 4),
+    ("12345", 2),
+    ("a\nb", 3),
+    ("!!", 1),
+    ("日本語", 3),
+])
+def test_count_tokens(text, tokens):
+    assert count_tokens(text, use_cache=False) == tokens
+
+
+def test_count_tokens_grows_with_text_and_memoizes_long_texts():
+    text = "Summarize the meeting transcript into five bullets. " * 100
+    assert count_tokens(text) == count_tokens(text, use_cache=False) > count_tokens(text[:500])
+
+
+def test_model_price_uses_longest_prefix():
+    assert model_price("gpt-4o-mini-2024-07-18") == model_price("gpt-4o-mini") != model_price("gpt-4o")
+    assert model_price("my-local-model") is None
+    assert estimate_cost("my-local-model", 1000, 1000) == 0.0
+
+
+def test_prompt_usage_counts_input_only():
+    usage = prompt_usage(["Write a haiku about rain.", "", "Now check it."], "gpt-4o")
+    tokens_in = count_tokens("Write a haiku about rain.") + count_tokens("Now check it.")
+
+    assert usage == {"tokens_in": tokens_in, "tokens_out": 0, "cost": estimate_cost("gpt-4o", tokens_in)}
+    assert usage["cost"] > 0
+
+
+def recorded_runs(db):
+    db.expire_all()
+    return list(db.scalars(select(Run).order_by(Run.id)))
+
+
+@pytest.mark.parametrize("max_tokens", BAD_MAX_TOKENS)
+def test_generate_records_input_usage_whatever_the_params(db, client, max_tokens):
+    response = client.post("/generate", json={
+        "goal": "Summarize this transcript into 5 bullets", "style": "directive", "model": "gpt-4o",
+        "params": {"max_tokens": max_tokens},
+    })
+
+    assert response.status_code == 200
+    run, = recorded_runs(db)
+    assert run.tokens_in == count_tokens(response.json()["prompt_body"])
+    assert run.tokens_out == 0
+    assert run.cost == estimate_cost("gpt-4o", run.tokens_in) > 0
+
+
+@pytest.mark.parametrize("max_tokens", BAD_MAX_TOKENS)
+def test_generate_stream_records_input_usage_whatever_the_params(db, client, max_tokens):
+    response = client.post("/generate/stream", json={
+        "goal": "Summarize this transcript into 5 bullets", "style": "planner_executor",
+        "params": {"max_tokens": max_tokens},
+    })
+
+    assert response.status_code == 200
+    events = {
+        block.split("\n")[0].removeprefix("event: "): json.loads(block.split("\n")[1].removeprefix("data: "))
+        for block in response.text.strip().split("\n\n")
+    }
+    assert events["done"]["run_id"] is not None
+    run, = recorded_runs(db)
+    prompt = events["prompt"]
+    assert run.tokens_in == count_tokens(prompt["planner_prompt"]) + count_tokens(prompt["executor_prompt"])
+    assert run.tokens_out == 0
+
+
+def test_generate_many_records_usage_per_style(db, client):
+    response = client.post("/generate", json={
+        "goal": "Summarize this transcript into 5 bullets", "styles": ["directive", "few_shot"],
+        "params": {"max_tokens": "lots"},
+    })
+
+    assert response.status_code == 200
+    runs = recorded_runs(db)
+    assert {run.style for run in runs} == {"directive", "few_shot"}
+    assert all(run.tokens_in > 0 and run.tokens_out == 0 for run in runs)